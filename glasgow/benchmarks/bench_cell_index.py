@@ -0,0 +1,119 @@
+'''
+regression check + timing: cell_index.CellIndex on a synthetic city grid (generate_grid_points over a
+fixtures.py boundary, the degree lattice of generate_grids.py) and on a 27700 lattice.
+every centre must map back to its own grid_id, random points must get the nearest centre chosen by
+query_planner.assign_nearest_grid (KD-tree + haversine), geometry_cells must equal an sjoin against the cell
+rectangles, and a saved index must load back identical. timed against the KD-tree and a point-in-square sjoin.
+usage: python glasgow/benchmarks/bench_cell_index.py [radius_m] [n_points]
+'''
+# %%
+import os
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+sys.path.insert(0, HERE)
+import fixtures  # noqa: E402
+from cell_index import CellIndex  # noqa: E402
+from grid_utils import generate_grid_points, grid_steps, lattice_spec, lattice_tile, points_to_grid_id  # noqa: E402
+from query_planner import assign_nearest_grid  # noqa: E402
+
+RADIUS_M = float(sys.argv[1]) if len(sys.argv) > 1 else 3000
+N_POINTS = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000_000
+
+# %%
+boundary = fixtures.boundary(RADIUS_M)
+bounds = boundary.total_bounds
+lat_step, lon_step = grid_steps(bounds, spacing_m=20)
+df_grid = generate_grid_points(boundary.geometry.iloc[0], bounds, lat_step, lon_step, verbose=False)
+
+t0 = time.perf_counter()
+index = CellIndex.from_grid(df_grid)
+t_build = time.perf_counter() - t0
+assert np.array_equal(index.latlon_to_grid_id(df_grid["query_lat"], df_grid["query_lon"]), df_grid["grid_id"])
+print(f"{len(df_grid)} cells, {index.shape[0]} x {index.shape[1]} lattice built in {t_build * 1000:.0f}ms; "
+      f"every centre maps to its own grid_id")
+
+with tempfile.TemporaryDirectory() as tmp:
+    index.save(os.path.join(tmp, "index"))
+    t0 = time.perf_counter()
+    loaded = CellIndex.load(os.path.join(tmp, "index"))
+    t_load = time.perf_counter() - t0
+    assert np.array_equal(np.asarray(loaded.grid_ids), index.grid_ids)
+    print(f"saved index loads in {t_load * 1000:.1f}ms")
+
+# ---- points -> grid_id ----
+rng = np.random.default_rng(0)
+lat = rng.uniform(bounds[1], bounds[3], N_POINTS)
+lon = rng.uniform(bounds[0], bounds[2], N_POINTS)
+
+t0 = time.perf_counter()
+gid = index.latlon_to_grid_id(lat, lon)
+t_index = time.perf_counter() - t0
+t0 = time.perf_counter()
+snapped = index.latlon_to_grid_id(lat, lon, snap_cells=3)
+t_snap = time.perf_counter() - t0
+
+t0 = time.perf_counter()
+nearest = assign_nearest_grid(pd.DataFrame({"lat": lat, "lon": lon}), df_grid)
+t_kd = time.perf_counter() - t0
+inside = gid >= 0
+agree = (gid[inside] == nearest["grid_id"].to_numpy()[inside]).mean()
+# disagreements can only be near-ties between two centres (projection vs haversine), so they must be rare
+assert agree > 0.9999, agree
+near_boundary = (snapped >= 0) & ~inside
+agree_snap = (snapped[near_boundary] == nearest["grid_id"].to_numpy()[near_boundary]).mean()
+assert agree_snap > 0.99, agree_snap
+print(f"{N_POINTS} points: lattice lookup {t_index:.3f}s ({t_snap:.3f}s with snapping of {near_boundary.sum()} "
+      f"points outside the grid), KD-tree + haversine {t_kd:.2f}s; same cell for {agree:.5%} "
+      f"({agree_snap:.3%} of snapped)")
+
+n_sjoin = min(N_POINTS, 200_000)
+cells_27700 = gpd.GeoDataFrame(df_grid, geometry=gpd.points_from_xy(df_grid["query_lon"], df_grid["query_lat"]),
+                               crs=4326).to_crs(27700)
+cells_27700["geometry"] = cells_27700.geometry.buffer(10, cap_style=3)
+pts = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon[:n_sjoin], lat[:n_sjoin]), crs=4326)
+t0 = time.perf_counter()
+gpd.sjoin(pts.to_crs(27700), cells_27700[["grid_id", "geometry"]], predicate="within")
+t_sjoin = (time.perf_counter() - t0) * N_POINTS / n_sjoin
+print(f"point-in-square sjoin (as for the OSM join): ~{t_sjoin:.1f}s for {N_POINTS} points "
+      f"({t_sjoin / t_index:.0f}x the lookup)")
+
+# ---- geometries -> cells ----
+layers = fixtures.osm_layers(fixtures.boundary_27700(RADIUS_M))
+geoms = pd.concat([layers[k].geometry for k in ["roads_all", "buildings", "landuse", "pois"]], ignore_index=True)
+t0 = time.perf_counter()
+ranges = index.geometry_ranges(geoms.values)
+cells = index.geometry_cells(geoms.values)
+t_geom = time.perf_counter() - t0
+
+ci, cj = np.nonzero(index.grid_ids >= 0)
+x, y = index.x0 + cj * index.dx, index.y0 + ci * index.dy
+rects = gpd.GeoDataFrame({"grid_id": index.grid_ids[ci, cj]},
+                         geometry=shapely.box(x, y, x + index.dx, y + index.dy), crs=4326)
+t0 = time.perf_counter()
+ref = gpd.sjoin(gpd.GeoDataFrame(geometry=geoms.values, crs=4326), rects, predicate="intersects")
+t_ref = time.perf_counter() - t0
+got = set(zip(cells["geom"], cells["grid_id"]))
+assert got == set(zip(ref.index, ref["grid_id"])), len(got ^ set(zip(ref.index, ref["grid_id"])))
+print(f"{len(geoms)} geometries -> {len(ranges)} row ranges, {len(cells)} (geometry, cell) pairs in "
+      f"{t_geom:.2f}s, identical to an sjoin with the cell rectangles ({t_ref:.2f}s)")
+
+# ---- 27700 lattice ----
+poly_27700 = fixtures.boundary_27700(RADIUS_M)
+spec = lattice_spec(poly_27700.bounds, spacing_m=20)
+lattice = lattice_tile(poly_27700, spec, 0)
+index_27700 = CellIndex.from_grid(lattice, spec)
+px = rng.uniform(poly_27700.bounds[0], poly_27700.bounds[2], N_POINTS)
+py = rng.uniform(poly_27700.bounds[1], poly_27700.bounds[3], N_POINTS)
+expected = points_to_grid_id(px, py, spec)
+expected = np.where(np.isin(expected, lattice["grid_id"]), expected, -1)
+assert np.array_equal(index_27700.points_to_grid_id(px, py), expected)
+print(f"27700 lattice: {len(lattice)} cells, lookups identical to grid_utils.points_to_grid_id")
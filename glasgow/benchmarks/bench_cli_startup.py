@@ -0,0 +1,66 @@
+'''
+startup of the svi-fairness command (scripts/svi_fairness.py, bin/svi-fairness): wall time of --help and status
+(median of n_runs fresh processes; both must stay under STARTUP_LIMIT_S), and which heavy modules each stage
+command and analysis command loads when run on a synthetic city (fixtures.write_city_inputs): only grid and osm
+may import geopandas, and no command imports pyrosm (the OSM layers are cached), geopy outside grid, or tqdm.
+usage: python glasgow/benchmarks/bench_cli_startup.py [n_runs]
+'''
+# %%
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+sys.path.insert(0, HERE)
+import fixtures  # noqa: E402
+
+N_RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+CLI = os.path.join(HERE, "..", "bin", "svi-fairness")
+STARTUP_LIMIT_S = 0.3
+HEAVY = ["pandas", "shapely", "geopandas", "pyrosm", "geopy", "tqdm"]
+ALLOWED = {"grid": {"pandas", "shapely", "geopandas", "geopy"}, "osm": {"pandas", "shapely", "geopandas"},
+           "fetch": {"pandas", "shapely"}, "filter": {"pandas"}, "merge": {"pandas"}, "analyse": {"pandas"},
+           "status": set(), "recrawl": {"pandas", "shapely"}, "fairness": {"pandas"}, "spatial": {"pandas", "shapely"}}
+# run main() in a fresh interpreter and report the heavy modules it left in sys.modules
+PROBE = f'''
+import sys
+sys.path.insert(0, {os.path.join(HERE, "..", "scripts")!r})
+import svi_fairness
+svi_fairness.main(sys.argv[1:])
+print("HEAVY", ",".join(m for m in {HEAVY!r} if m in sys.modules))
+'''
+
+
+def timed(cmd):
+    t0 = time.perf_counter()
+    out = subprocess.run(cmd, capture_output=True, text=True)
+    if out.returncode:
+        raise RuntimeError(out.stderr)
+    return time.perf_counter() - t0, out.stdout
+
+
+# %%
+with tempfile.TemporaryDirectory() as root:
+    boundary, pbf, streetview, osm_cache = fixtures.write_city_inputs(root, 400)
+    args = ["--results-dir", os.path.join(root, "results"), "--boundary", boundary, "--pbf", pbf,
+            "--streetview", streetview, "--osm-cache", osm_cache, "--rate", "0", "-q"]
+
+    t_python = np.median([timed([sys.executable, "-c", "pass"])[0] for _ in range(N_RUNS)])
+    t_help = np.median([timed([sys.executable, CLI, "--help"])[0] for _ in range(N_RUNS)])
+    t_status = np.median([timed([sys.executable, CLI, "status"] + args)[0] for _ in range(N_RUNS)])
+    print(f"bare interpreter {t_python * 1000:.0f}ms, --help {t_help * 1000:.0f}ms, "
+          f"status {t_status * 1000:.0f}ms (median of {N_RUNS})")
+    assert t_help < STARTUP_LIMIT_S and t_status < STARTUP_LIMIT_S
+
+    for command in ["status", "grid", "fetch", "osm", "filter", "merge", "analyse", "spatial", "fairness", "recrawl"]:
+        extra = {"filter": ["--force"], "merge": ["--force"], "analyse": ["--force"], "fairness": ["--n-boot", "200"],
+                 "spatial": ["--n-perm", "99"]}.get(command, [])
+        t, out = timed([sys.executable, "-c", PROBE, command] + args + extra)
+        loaded = set(filter(None, out.split("HEAVY", 1)[1].strip().split(",")))
+        assert loaded <= ALLOWED[command], (command, loaded - ALLOWED[command])
+        print(f"{command:8s} {t:5.2f}s  heavy modules: {', '.join(sorted(loaded)) or '-'}")
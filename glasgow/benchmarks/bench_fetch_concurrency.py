@@ -0,0 +1,72 @@
+'''
+benchmark: throughput of svi_fetch.fetch_grid_metadata against worker count, offline.
+streetview.panoids is replaced by a fake function that sleeps a simulated network latency and
+fails transiently now and then, so the retry path is exercised too. a last run returns a malformed item
+(lat None) for some points: only those points fail, the crawl goes on and the csv rows stay aligned.
+usage: python glasgow/benchmarks/bench_fetch_concurrency.py
+'''
+# %%
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from svi_fetch import fetch_grid_metadata  # noqa: E402
+
+N_POINTS = 400
+LATENCY_S = 0.05        # simulated round trip per request
+FAIL_RATE = 0.02        # share of requests raising a transient ConnectionError
+WORKER_COUNTS = [1, 4, 8, 16, 32]
+RATE_LIMIT = 100       # req/s for the rate-limited run at the largest worker count
+
+
+def fake_panoids(lat, lon):
+    """stand-in for streetview.panoids: a few panoramas around (lat, lon) after LATENCY_S"""
+    time.sleep(LATENCY_S)
+    if random.random() < FAIL_RATE:
+        raise ConnectionError("simulated network error")
+    return [
+        {"panoid": f"{lat:.5f}_{lon:.5f}_{k}", "lat": lat + 1e-5 * k, "lon": lon, "year": 2020, "month": 1 + k}
+        for k in range(random.randint(0, 5))
+    ]
+
+
+# %%
+grid_centers = [(i, 55.86 + 1e-4 * (i // 20), -4.25 + 1e-4 * (i % 20)) for i in range(N_POINTS)]
+
+print(f"{'workers':>8s} {'rate':>6s} {'elapsed_s':>10s} {'points/s':>9s} {'failed':>7s} {'rows':>6s}")
+runs = [(w, None) for w in WORKER_COUNTS] + [(WORKER_COUNTS[-1], RATE_LIMIT)]
+for workers, rate in runs:
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        out_csv = os.path.join(tmp, "metadata.csv")
+        stats = fetch_grid_metadata(grid_centers, fake_panoids, out_csv, workers=workers, rate=rate,
+                                    retries=3, backoff=0.01, verbose=False)
+    print(f"{workers:>8d} {str(rate or '-'):>6s} {stats['elapsed_s']:>10.2f} {N_POINTS / stats['elapsed_s']:>9.1f} "
+          f"{stats['failed']:>7d} {stats['rows']:>6d}")
+# %%
+import pandas as pd  # noqa: E402
+
+
+def malformed_panoids(lat, lon):
+    """every 10th point returns an item without a position"""
+    items = fake_panoids(lat, lon) or [{"panoid": f"{lat:.5f}_{lon:.5f}", "lat": lat, "lon": lon}]
+    if round((lon + 4.25) * 1e4) % 10 == 0:
+        items.append({"panoid": "broken", "lat": None, "lon": None})
+    return items
+
+
+random.seed(0)
+with tempfile.TemporaryDirectory() as tmp:
+    out_csv = os.path.join(tmp, "metadata.csv")
+    stats = fetch_grid_metadata(grid_centers, malformed_panoids, out_csv, workers=8, retries=3, backoff=0.01,
+                                verbose=False)
+    df = pd.read_csv(out_csv)
+n_malformed = sum(1 for _, _, lon in grid_centers if round((lon + 4.25) * 1e4) % 10 == 0)
+assert stats["failed"] >= n_malformed and stats["done"] + stats["failed"] == N_POINTS, stats
+assert "broken" not in set(df["panoid"]) and len(df) == stats["rows"]
+assert (df["grid_id"] % 20 % 10 != 0).all()
+print(f"malformed responses: {stats['failed']} points failed (>= {n_malformed} malformed), {stats['rows']} rows kept")
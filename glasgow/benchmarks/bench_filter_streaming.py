@@ -0,0 +1,97 @@
+'''
+regression check + memory: metadata_filter.stream_clean_metadata against the in-memory cleaning it replaces in
+filter_svi_metadata.py (read whole csv, dropna, groupby('panoid')['distance_m'].idxmin()) and against
+query_planner.clean_planned_metadata, on a synthetic raw crawl csv: every panorama returned by several grid
+points, exact distance ties, empty points with NaN year / month. each variant runs in its own process so peak
+RSS is its own; the cleaned tables must be identical, and the streamed raw_unique_panoids must equal the
+raw table's panoid nunique (the figure filter_svi_metadata.py printed before streaming).
+usage: python glasgow/benchmarks/bench_filter_streaming.py [n_panos] [chunksize]
+'''
+# %%
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from metadata_filter import stream_clean_metadata  # noqa: E402
+from query_planner import clean_planned_metadata  # noqa: E402
+from storage import read_table  # noqa: E402
+
+N_PANOS = int(sys.argv[1]) if len(sys.argv) > 1 else 400_000
+CHUNKSIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+SIDE = 400  # synthetic grid: SIDE x SIDE cells, 20m apart
+
+
+def synthetic_grid():
+    r, c = np.divmod(np.arange(SIDE * SIDE), SIDE)
+    return pd.DataFrame({"grid_id": np.arange(SIDE * SIDE),
+                         "query_lat": 55.8 + r * 20 / 111_320, "query_lon": -4.3 + c * 20 / 62_600})
+
+
+def synthetic_raw(path, n_panos, seed=0):
+    rng = np.random.default_rng(seed)
+    grid = synthetic_grid()
+    hits = rng.integers(2, 9, n_panos)                      # grid points returning each panorama
+    pano = np.repeat(np.arange(n_panos), hits)
+    gid = rng.integers(0, len(grid), len(pano))
+    dist = np.round(rng.uniform(0, 50, len(pano)), 1)       # rounded: plenty of exact ties
+    year = rng.integers(2008, 2024, n_panos)[pano].astype(float)
+    month = rng.integers(1, 13, n_panos)[pano].astype(float)
+    order = rng.permutation(len(pano))
+    raw = pd.DataFrame({
+        "query_lat": grid["query_lat"].to_numpy()[gid], "query_lon": grid["query_lon"].to_numpy()[gid],
+        "panoid": np.char.add("pano_", pano.astype(str)).astype(object),
+        "lat": grid["query_lat"].to_numpy()[gid] + 1e-4, "lon": grid["query_lon"].to_numpy()[gid],
+        "year": year, "month": month, "distance_m": dist, "grid_id": gid,
+    }).iloc[order]
+    empty = rng.random(len(raw)) < 0.05
+    raw.loc[empty, ["panoid", "lat", "lon", "year", "month", "distance_m"]] = np.nan
+    raw.to_csv(path, index=False)
+    return len(raw)
+
+
+def run(kind, path):
+    t0 = time.perf_counter()
+    if kind == "in-memory":
+        meta_data = read_table(path)
+        filtered = meta_data.dropna(subset=["year", "month"])
+        out = filtered.loc[filtered.groupby("panoid")["distance_m"].idxmin()].reset_index(drop=True)
+    elif kind == "streamed":
+        out, _ = stream_clean_metadata(path, chunksize=CHUNKSIZE)
+    elif kind == "planned, in-memory":
+        out = clean_planned_metadata(read_table(path), synthetic_grid())
+    else:
+        out, _ = stream_clean_metadata(path, chunksize=CHUNKSIZE, df_grid=synthetic_grid())
+    return out, time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def in_child(*args):
+    with ProcessPoolExecutor(1) as p:
+        return p.submit(run, *args).result()
+
+
+# %%
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "raw.csv")
+        n_rows = synthetic_raw(path, N_PANOS)
+        print(f"{n_rows} raw rows ({os.path.getsize(path) / 1e6:.0f} MB csv), {N_PANOS} panoramas, "
+              f"chunks of {CHUNKSIZE}")
+        results = {kind: in_child(kind, path)
+                   for kind in ["in-memory", "streamed", "planned, in-memory", "planned, streamed"]}
+        _, stats = stream_clean_metadata(path, chunksize=CHUNKSIZE)
+        assert stats["raw_unique_panoids"] == read_table(path)["panoid"].nunique(), stats
+
+    pd.testing.assert_frame_equal(results["in-memory"][0], results["streamed"][0])
+    pd.testing.assert_frame_equal(results["planned, in-memory"][0], results["planned, streamed"][0])
+    print("streamed cleaning identical to the in-memory one (min-distance and planned rules)")
+    for kind, (_, t, rss) in results.items():
+        print(f"{kind:<20s} {t:6.2f}s  peak RSS {rss / 1024:6.0f} MB")
+# %%
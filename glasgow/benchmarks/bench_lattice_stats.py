@@ -0,0 +1,129 @@
+'''
+regression check + timing: lattice_stats against generic point-neighbour weights (KD-tree search over the cell
+centres, as a libpysal DistanceBand would build them) on a synthetic disk-shaped city with a smooth coverage
+field. row / col recovered from query_lat / query_lon must match the lattice, Moran's I, the local I_i and the
+window means must equal the KD-tree versions, and the LISA pseudo p-values must agree with a plain per-cell
+permutation loop.
+usage: python glasgow/benchmarks/bench_lattice_stats.py [n_side] [n_perm]
+'''
+# %%
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage, sparse
+from scipy.spatial import cKDTree
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from grid_utils import lattice_spec  # noqa: E402
+from lattice_stats import global_moran, lattice_from_grid, local_moran, neighbourhood_coverage  # noqa: E402
+
+N_SIDE = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+N_PERM = int(sys.argv[2]) if len(sys.argv) > 2 else 999
+SPACING = 20
+
+
+def synthetic_city(n_side, seed=0):
+    """cells of a disk on a SPACING lattice (grid_id = row * n_cols + col) + a smooth grid_summary"""
+    rng = np.random.default_rng(seed)
+    spec = lattice_spec((0, 0, n_side * SPACING, n_side * SPACING), spacing_m=SPACING)
+    row, col = np.divmod(np.arange(n_side * n_side), n_side)
+    inside = (row - n_side / 2) ** 2 + (col - n_side / 2) ** 2 < (n_side / 2) ** 2
+    row, col = row[inside], col[inside]
+    grid = pd.DataFrame({
+        "grid_id": row * spec["n_cols"] + col,
+        "query_lat": 55.8 + row * 0.00018,
+        "query_lon": -4.3 + col * 0.00032,
+        "x": (col + 0.5) * SPACING,
+        "y": (row + 0.5) * SPACING,
+    })
+    field = ndimage.gaussian_filter(rng.normal(size=(n_side, n_side)), 8)[row, col]
+    n_panos = rng.poisson(np.exp(3 * field / field.std()))
+    recency = np.where(n_panos > 0, np.round(30 - 20 * field / field.std() + rng.normal(0, 5, len(row))), np.nan)
+    summary = pd.DataFrame({"n_panos": n_panos, "recency_months": np.abs(recency)},
+                           index=pd.Index(grid["grid_id"], name="grid_id"))
+    return spec, grid, summary
+
+
+def kdtree_weights(xy, radius):
+    """row-standardized distance-band weights (all other centres within radius)"""
+    pairs = cKDTree(xy).query_pairs(radius, output_type="ndarray")
+    i = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    j = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    w = sparse.csr_matrix((np.ones(len(i)), (i, j)), shape=(len(xy), len(xy)))
+    row_sum = np.asarray(w.sum(axis=1)).ravel()
+    return sparse.diags(1 / np.maximum(row_sum, 1)) @ w
+
+
+# %%
+spec, grid, summary = synthetic_city(N_SIDE)
+values = summary["recency_months"].to_numpy()
+print(f"{len(grid)} cells")
+
+t0 = time.perf_counter()
+lat = lattice_from_grid(grid, spec)
+t_lattice = time.perf_counter() - t0
+recovered = lattice_from_grid(grid)
+assert np.array_equal(recovered.rows, lat.rows) and np.array_equal(recovered.cols, lat.cols)
+print("row / col from query_lat / query_lon match the lattice")
+
+# ---- weights + Moran's I ----
+t0 = time.perf_counter()
+valid = ~np.isnan(values)
+xy = grid[["x", "y"]].to_numpy()[valid]
+w_kd = kdtree_weights(xy, SPACING * 1.5)
+z = values[valid] - values[valid].mean()
+i_kd = len(z) / w_kd.sum() * (z @ (w_kd @ z)) / (z @ z)
+t_kd = time.perf_counter() - t0
+
+t0 = time.perf_counter()
+moran = global_moran(lat, values, n_perm=0)
+t_moran = time.perf_counter() - t0
+np.testing.assert_allclose(moran["I"], i_kd, rtol=1e-10)
+print(f"Moran's I {moran['I']:.4f} identical; KD-tree weights {t_kd:.2f}s, lattice {t_lattice + t_moran:.2f}s")
+
+t0 = time.perf_counter()
+moran = global_moran(lat, values, n_perm=N_PERM)
+print(f"global permutation test ({N_PERM}): p_sim {moran['p_sim']:.4f}, z_sim {moran['z_sim']:.1f}, "
+      f"{time.perf_counter() - t0:.2f}s")
+
+# ---- window means ----
+t0 = time.perf_counter()
+local = neighbourhood_coverage(lat, summary, radius=2)
+t_conv = time.perf_counter() - t0
+pairs = cKDTree(grid[["x", "y"]].to_numpy()).query_ball_point(grid[["x", "y"]].to_numpy()[:2000],
+                                                              SPACING * 2 * np.sqrt(2) + 1e-6)
+covered = summary["n_panos"].to_numpy() > 0
+expected = np.array([covered[p].mean() for p in pairs])
+np.testing.assert_allclose(local["local_coverage_rate"].to_numpy()[:2000], expected, rtol=1e-12)
+print(f"5x5 window coverage identical to a KD-tree ball search, convolution {t_conv:.3f}s")
+
+# ---- LISA ----
+t0 = time.perf_counter()
+lisa = local_moran(lat, values, n_perm=N_PERM)
+t_lisa = time.perf_counter() - t0
+lag_kd = w_kd @ z
+np.testing.assert_allclose(lisa["local_i"].dropna().to_numpy(),
+                           (z * lag_kd / (z @ z / len(z)))[np.asarray(w_kd.sum(axis=1)).ravel() > 0], rtol=1e-10)
+
+rng = np.random.default_rng(1)
+cells = rng.choice(np.flatnonzero(np.diff(w_kd.indptr) > 0), 20, replace=False)
+m2 = z @ z / len(z)
+loop_p = []
+for i in cells:
+    nbrs = w_kd.indices[w_kd.indptr[i]:w_kd.indptr[i + 1]]
+    others = np.delete(np.arange(len(z)), i)
+    sims = np.array([z[i] * z[rng.choice(others, len(nbrs), replace=False)].mean() / m2 for _ in range(N_PERM)])
+    larger = (sims >= z[i] * lag_kd[i] / m2).sum()
+    loop_p.append((min(larger, N_PERM - larger) + 1) / (N_PERM + 1))
+got_p = lisa["p_sim"].to_numpy()[valid][cells]
+loop_p = np.array(loop_p)
+# both are Monte Carlo estimates: allow 4 standard errors of the difference
+tol = 4 * np.sqrt(2 * loop_p * (1 - loop_p) / N_PERM) + 2 / N_PERM
+assert np.all(np.abs(got_p - loop_p) < tol), np.c_[got_p, loop_p]
+sig = lisa[lisa["p_sim"] < 0.05]["quadrant"].value_counts().sort_index()
+print(f"LISA with {N_PERM} conditional permutations: {t_lisa:.1f}s, p-values agree with a per-cell loop; "
+      f"significant cells by quadrant {sig.to_dict()}")
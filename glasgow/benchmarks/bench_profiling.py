@@ -0,0 +1,67 @@
+'''
+overhead of profiling.stage: the cost of an instrumented block with profiling off (a no-op context manager) and
+on (one JSON line per stage), and a check that nested stages, rows and errors end up in the jsonl.
+usage: python glasgow/benchmarks/bench_profiling.py [n_calls]
+'''
+# %%
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+import profiling  # noqa: E402
+from profiling import read_profile, record, stage  # noqa: E402
+
+N_CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+
+def instrumented(n):
+    for i in range(n):
+        with stage("step", rows_in=i) as st:
+            st.rows_out = i
+
+
+def bare(n):
+    for i in range(n):
+        pass
+
+
+# %%
+profiling.configure(None)
+t0 = time.perf_counter()
+bare(N_CALLS)
+t_bare = time.perf_counter() - t0
+t0 = time.perf_counter()
+instrumented(N_CALLS)
+t_off = time.perf_counter() - t0
+print(f"disabled: {(t_off - t_bare) / N_CALLS * 1e9:.0f} ns per stage")
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "profile.jsonl")
+    profiling.configure(path, run_id="bench")
+    n_on = min(N_CALLS, 20_000)
+    t0 = time.perf_counter()
+    instrumented(n_on)
+    t_on = time.perf_counter() - t0
+    print(f"enabled:  {t_on / n_on * 1e6:.1f} us per stage (one json line each)")
+
+    os.remove(path)
+    with stage("outer", rows_in=10) as st:
+        with stage("inner"):
+            time.sleep(0.01)
+        record("batch", 0.5, rows_in=4, rows_out=2)
+        st.rows_out = 3
+    try:
+        with stage("broken"):
+            raise ValueError
+    except ValueError:
+        pass
+    profiling.configure(None)
+    df = read_profile(path).set_index("stage")
+    assert list(df.index) == ["outer/inner", "outer/batch", "outer", "broken"], list(df.index)
+    assert df.loc["outer/inner", "wall_s"] >= 0.01 and df.loc["outer/inner", "depth"] == 1
+    assert df.loc["outer", "rows_out"] == 3 and df.loc["outer/batch", "rows_per_s"] == 4
+    assert df.loc["broken", "error"] == "ValueError"
+    print("nested stages, records, rows and errors written as expected")
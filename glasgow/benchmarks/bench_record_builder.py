@@ -0,0 +1,97 @@
+'''
+micro-benchmark: building metadata records from panoids responses.
+old path (fetch_svi_metadata_glasgow.py before svi_fetch.PanoRecordBuilder): scalar math haversine per
+panorama, a list of dicts and one DataFrame per grid point, concatenated every 50 points.
+new path: PanoRecordBuilder, typed arrays across all points, one vectorized distance call per flush.
+usage: python glasgow/benchmarks/bench_record_builder.py
+'''
+# %%
+import os
+import sys
+import time
+from math import radians, sin, cos, sqrt, atan2
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from svi_fetch import PanoRecordBuilder  # noqa: E402
+
+N_POINTS = 20000
+PANOS_PER_POINT = 20
+SAVE_EVERY = 50
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    R = 6371000
+    phi1, phi2 = radians(lat1), radians(lat2)
+    dphi = radians(lat2 - lat1)
+    dlambda = radians(lon2 - lon1)
+    a = sin(dphi/2)**2 + cos(phi1)*cos(phi2)*sin(dlambda/2)**2
+    return 2 * R * atan2(sqrt(a), sqrt(1 - a))
+
+
+def process_panoids_with_distance(panoids_list, query_lat, query_lon):
+    records = []
+    for item in panoids_list:
+        records.append({
+            'query_lat': query_lat,
+            'query_lon': query_lon,
+            'panoid': item.get('panoid'),
+            'lat': item.get('lat'),
+            'lon': item.get('lon'),
+            'year': item.get('year', None),
+            'month': item.get('month', None),
+            'distance_m': haversine(query_lat, query_lon, item.get('lat'), item.get('lon'))
+        })
+    return pd.DataFrame(records)
+
+
+# %%
+rng = np.random.default_rng(0)
+points = [(i, 55.86 + 1e-4 * (i // 100), -4.25 + 1e-4 * (i % 100)) for i in range(N_POINTS)]
+responses = []
+for _, lat, lon in points:
+    responses.append([
+        {"panoid": f"p{rng.integers(1e9)}", "lat": lat + rng.normal(0, 2e-4), "lon": lon + rng.normal(0, 3e-4),
+         "year": int(rng.integers(2008, 2024)), "month": int(rng.integers(1, 13))}
+        for _ in range(PANOS_PER_POINT)
+    ])
+
+t0 = time.perf_counter()
+frames, batch = [], []
+for (gid, lat, lon), panoids in zip(points, responses):
+    df = process_panoids_with_distance(panoids, lat, lon)
+    df["grid_id"] = gid
+    batch.append(df)
+    if len(batch) >= SAVE_EVERY:
+        frames.append(pd.concat(batch))
+        batch = []
+if batch:
+    frames.append(pd.concat(batch))
+t_old = time.perf_counter() - t0
+old = pd.concat(frames, ignore_index=True)
+
+t0 = time.perf_counter()
+frames = []
+builder = PanoRecordBuilder()
+for i, ((gid, lat, lon), panoids) in enumerate(zip(points, responses), 1):
+    builder.add(gid, lat, lon, panoids)
+    if i % SAVE_EVERY == 0:
+        frames.append(builder.to_frame())
+        builder.clear()
+if len(builder):
+    frames.append(builder.to_frame())
+t_new = time.perf_counter() - t0
+new = pd.concat(frames, ignore_index=True)
+
+assert list(old.columns) == list(new.columns)
+assert (old["panoid"].values == new["panoid"].values).all()
+assert np.allclose(old["distance_m"], new["distance_m"], rtol=1e-12, atol=1e-9)
+assert (old["year"].values == new["year"].to_numpy(int)).all()
+
+print(f"{N_POINTS} grid points x {PANOS_PER_POINT} panoramas = {len(new)} rows")
+print(f"old (dicts + DataFrame per point): {t_old:.2f}s")
+print(f"new (PanoRecordBuilder):           {t_new:.2f}s  ({t_old / t_new:.1f}x)")
+# %%
@@ -0,0 +1,136 @@
+'''
+regression check + call counts: incremental re-crawl (recrawl.py) against re-crawling every cell, offline.
+a synthetic world of panoramas is crawled once through svi_fetch.fetch_grid_metadata (fake streetview.panoids
+returning the panoramas within QUERY_RADIUS), then new captures appear, mostly in cells whose coverage is
+stale. each selection mode re-queries only its cells; merge_recrawl(cleaned, refresh rows, grid) must give every
+panorama it finds the row the filter_svi_metadata.py rule gives it over the first crawl + a full re-crawl (its
+nearest cell, even when that cell was not re-queried), and the share of new panoramas each mode finds is compared
+with a full re-crawl.
+usage: python glasgow/benchmarks/bench_recrawl.py [side_cells]
+'''
+# %%
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from checkpoint import CrawlCheckpoint  # noqa: E402
+from query_planner import QUERY_RADIUS  # noqa: E402
+from recrawl import merge_recrawl, select_by_budget, select_by_checked_at, select_by_recency  # noqa: E402
+from svi_fetch import fetch_grid_metadata  # noqa: E402
+from temporal_metrics import temporal_summary  # noqa: E402
+
+SIDE = int(sys.argv[1]) if len(sys.argv) > 1 else 80
+M_PER_DEG_LAT = 111_320.0
+LAT0, LON0 = 55.86, -4.25
+M_PER_DEG_LON = M_PER_DEG_LAT * np.cos(np.radians(LAT0))
+rng = np.random.default_rng(0)
+
+
+class World:
+    """panoramas as (lat, lon, year, month); panoids() answers like streetview.panoids"""
+
+    def __init__(self, lat, lon, year, month):
+        self.lat, self.lon, self.year, self.month = lat, lon, year, month
+        self.tree = cKDTree(np.c_[lat * M_PER_DEG_LAT, lon * M_PER_DEG_LON])
+
+    def panoids(self, lat, lon):
+        hits = self.tree.query_ball_point([lat * M_PER_DEG_LAT, lon * M_PER_DEG_LON], QUERY_RADIUS)
+        return [{"panoid": f"p{i}", "lat": self.lat[i], "lon": self.lon[i],
+                 "year": int(self.year[i]), "month": int(self.month[i])} for i in sorted(hits)]
+
+    def add(self, lat, lon, year, month):
+        return World(np.r_[self.lat, lat], np.r_[self.lon, lon], np.r_[self.year, year], np.r_[self.month, month])
+
+
+def cleaned_rule(raw):
+    filtered = raw.dropna(subset=["year", "month"])
+    return filtered.loc[filtered.groupby("panoid")["distance_m"].idxmin()]
+
+
+def crawl(world, grid, ids, out_csv, checkpoint=None):
+    todo = grid[grid["grid_id"].isin(ids)]
+    fetch_grid_metadata(list(zip(todo["grid_id"], todo["query_lat"], todo["query_lon"])), world.panoids, out_csv,
+                        workers=4, checkpoint=checkpoint, verbose=False)
+    return pd.read_csv(out_csv) if os.path.exists(out_csv) else pd.DataFrame()
+
+
+def canon(df):
+    return df.sort_values("panoid").reset_index(drop=True)[["panoid", "grid_id", "distance_m", "year", "month"]]
+
+
+# %%
+if __name__ == "__main__":
+    r, c = np.divmod(np.arange(SIDE * SIDE), SIDE)
+    grid = pd.DataFrame({"grid_id": np.arange(SIDE * SIDE),
+                         "query_lat": LAT0 + r * 20 / M_PER_DEG_LAT, "query_lon": LON0 + c * 20 / M_PER_DEG_LON})
+    grid["road_type"] = rng.choice(["drivable", "non-drivable", "no-road"], len(grid), p=[0.4, 0.35, 0.25])
+
+    n0 = len(grid) // 2
+    pick = rng.integers(0, len(grid), n0)
+    world = World(grid["query_lat"].to_numpy()[pick] + rng.normal(0, 8, n0) / M_PER_DEG_LAT,
+                  grid["query_lon"].to_numpy()[pick] + rng.normal(0, 8, n0) / M_PER_DEG_LON,
+                  # older imagery on the no-road / non-drivable cells
+                  np.where(grid["road_type"].to_numpy()[pick] == "drivable",
+                           rng.integers(2018, 2024, n0), rng.integers(2009, 2021, n0)),
+                  rng.integers(1, 13, n0))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cp = CrawlCheckpoint(os.path.join(tmp, "crawl.sqlite"))
+        raw1 = crawl(world, grid, grid["grid_id"], os.path.join(tmp, "raw1.csv"), checkpoint=cp)
+        cleaned1 = cleaned_rule(raw1)
+        merged = grid[["grid_id"]].merge(cleaned1, on="grid_id", how="left")
+        merged["date"] = pd.to_datetime(merged["year"].astype("Int64").astype(str) + "-" +
+                                        merged["month"].astype("Int64").astype(str), errors="coerce")
+        grid_summary = temporal_summary(merged)
+
+        # new captures: 80% in cells whose latest imagery is >= 7 years old or missing
+        stale_ids = select_by_recency(grid["grid_id"], grid_summary, 84)
+        n1 = len(grid) // 20
+        where = np.where(rng.random(n1) < 0.8, rng.choice(stale_ids, n1), rng.integers(0, len(grid), n1))
+        world2 = world.add(grid["query_lat"].to_numpy()[where] + rng.normal(0, 8, n1) / M_PER_DEG_LAT,
+                           grid["query_lon"].to_numpy()[where] + rng.normal(0, 8, n1) / M_PER_DEG_LON,
+                           np.full(n1, 2025), rng.integers(1, 13, n1))
+
+        # crawl timestamps: pretend the first half of the grid was last checked 200 days ago
+        status = cp.status_table()
+        status.loc[status["grid_id"] < len(grid) // 2, "checked_at"] -= 200 * 24 * 3600
+        cp.close()
+
+        selections = {
+            "full re-crawl": grid["grid_id"].to_numpy(),
+            "recency >= 84 months": stale_ids,
+            "checked_at > 180 days": select_by_checked_at(grid["grid_id"], status, 180),
+            "budget 600/road_type": select_by_budget(grid, 600, priority=grid_summary["recency_months"]),
+        }
+
+        # reference: the filter rule over the first crawl + a re-crawl of every cell, i.e. every panorama at its
+        # true nearest cell. a partial re-crawl must give the same rows for the panoramas it finds
+        full2 = crawl(world2, grid, grid["grid_id"], os.path.join(tmp, "refresh_full.csv"))
+        expected_all = cleaned_rule(pd.concat([raw1, full2], ignore_index=True))
+        full_new = None
+        print(f"{len(grid)} cells, {len(world.lat)} panoramas at first crawl, {n1} new captures")
+        print(f"{'mode':<24s} {'calls':>7s} {'new panos found':>16s} {'farther cell w/o snap':>22s} {'merge_s':>8s}")
+        for k, (name, ids) in enumerate(selections.items()):
+            raw2 = crawl(world2, grid, ids, os.path.join(tmp, f"refresh_{k}.csv"))
+            t0 = time.perf_counter()
+            merged_meta, stats = merge_recrawl(cleaned1, raw2, grid)
+            t_merge = time.perf_counter() - t0
+            expected = expected_all[expected_all["panoid"].isin(merged_meta["panoid"])]
+            assert len(expected) == len(merged_meta)
+            pd.testing.assert_frame_equal(canon(merged_meta), canon(expected), check_dtype=False)
+            # the raw distance_m rule only chooses among the queried centres
+            unsnapped = cleaned_rule(pd.concat([raw1, raw2], ignore_index=True))
+            farther = (canon(unsnapped)["grid_id"] != canon(expected)["grid_id"]).sum()
+            if full_new is None:
+                full_new = stats["new_panos"]
+            print(f"{name:<24s} {len(ids):>7d} {stats['new_panos']:>7d} ({stats['new_panos'] / full_new:>5.0%})  "
+                  f"{farther:>22d} {t_merge:>8.3f}")
+    print("merge_recrawl puts every panorama it finds at its nearest cell, as a full re-crawl does, for every mode")
+# %%
@@ -0,0 +1,82 @@
+'''
+benchmark: road_type classification on the pyrosm test PBF (ships with pyrosm, offline).
+old: two left sjoins of the full grid against roads_all and roads_drivable, reduced to unique grid ids.
+new: osm_tags.classify_road_type on the roads join that step 4 already made (drivable ways matched by id),
+and the osm_tags.cells_hit sindex variant. the road_type counts of all three must agree.
+usage: python glasgow/benchmarks/bench_road_type.py [spacing_m]
+'''
+# %%
+import os
+import sys
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyrosm
+from shapely.geometry import box
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from grid_utils import lattice_spec, iter_lattice_tiles, cell_boxes  # noqa: E402
+from osm_layers import extract_layers  # noqa: E402
+from osm_tags import ROAD_TYPES, cells_hit, classify_road_type  # noqa: E402
+
+SPACING = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+# %%
+pbf = pyrosm.get_data("test_pbf")
+layers = extract_layers(pbf, box(-180, -90, 180, 90), ["roads_all", "roads_drivable"], workers=1)
+roads_all = layers["roads_all"].to_crs(27700)
+roads_drivable = layers["roads_drivable"].to_crs(27700)
+
+area = box(*roads_all.total_bounds)
+spec = lattice_spec(area.bounds, spacing_m=SPACING)
+df_grid = pd.concat([df for _, df in iter_lattice_tiles(area, spec)], ignore_index=True)
+grid = gpd.GeoDataFrame(df_grid[["grid_id"]], geometry=cell_boxes(df_grid["x"], df_grid["y"], spec), crs=27700)
+print(f"{len(grid)} cells of {SPACING:g}m, {len(roads_all)} roads, {len(roads_drivable)} drivable")
+
+# step 4 join (made anyway for the tags), shared by the new path
+roads_join, t_join = timed(lambda: gpd.sjoin(roads_all, grid, how="inner", predicate="intersects")[["grid_id", "id"]])
+
+
+def old_road_type():
+    join_all = gpd.sjoin(grid[["grid_id", "geometry"]], roads_all[["geometry"]], how="left", predicate="intersects")
+    join_drive = gpd.sjoin(grid[["grid_id", "geometry"]], roads_drivable[["geometry"]], how="left", predicate="intersects")
+    any_road = join_all.loc[join_all["index_right"].notnull(), "grid_id"].unique()
+    drive_road = join_drive.loc[join_drive["index_right"].notnull(), "grid_id"].unique()
+    road_type = pd.Series("no-road", index=grid.index)
+    road_type[grid["grid_id"].isin(any_road)] = "non-drivable"
+    road_type[grid["grid_id"].isin(drive_road)] = "drivable"
+    return road_type
+
+
+def sindex_road_type():
+    any_road = cells_hit(grid, roads_all.geometry)
+    drive_road = cells_hit(grid, roads_drivable.geometry)
+    return pd.Series(pd.Categorical.from_codes(np.where(drive_road, 2, np.where(any_road, 1, 0)), categories=ROAD_TYPES))
+
+
+old, t_old = timed(old_road_type)
+new, t_new = timed(lambda: classify_road_type(grid["grid_id"], roads_join, roads_drivable["id"]))
+hit, t_hit = timed(sindex_road_type)
+
+counts = pd.DataFrame({
+    "two_sjoins": old.value_counts(),
+    "roads_join": new.astype(str).value_counts(),
+    "sindex_hit": hit.astype(str).value_counts(),
+})
+print(counts)
+assert (counts["two_sjoins"] == counts["roads_join"]).all() and (counts["two_sjoins"] == counts["sindex_hit"]).all()
+assert (old.values == new.astype(str).values).all()
+print(f"two full left sjoins:         {t_old:.3f}s")
+print(f"from step-4 roads join:       {t_new:.3f}s (+ {t_join:.3f}s join shared with the tags)")
+print(f"sindex hit / no-hit queries:  {t_hit:.3f}s")
+# %%
@@ -0,0 +1,96 @@
+'''
+check + timing of the stage cache (stage_cache.py, pipeline_stages.py) on a synthetic city (fixtures.py): a stub
+streetview.py file, the boundary as GeoJSON and the OSM layer cache pre-filled for a placeholder PBF
+(fixtures.write_city_inputs), so the six stages run offline. the first run computes everything with fetch and
+osm overlapping in time, a rerun skips everything, changing half only reruns osm -> merge -> analysis, changing
+save_every fetch -> filter -> merge -> analysis, the published links point at the current outputs, a
+re-crawl csv reruns filter -> merge -> analysis, and a missing input (the PBF) only stops the stages that read it.
+usage: python glasgow/benchmarks/bench_stage_cache.py [radius_m]
+'''
+# %%
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+sys.path.insert(0, HERE)
+import fixtures  # noqa: E402
+from pipeline_stages import CLEANED, GRID_TAGS, RAW_METADATA, SUMMARY, build_stages  # noqa: E402
+from stage_cache import MANIFEST, plan, publish, run_stages  # noqa: E402
+from storage import read_table  # noqa: E402
+
+RADIUS_M = float(sys.argv[1]) if len(sys.argv) > 1 else 600
+
+
+def run(stages, cache_dir, **kwargs):
+    t0 = time.perf_counter()
+    before = {n: s.up_to_date for n, s in plan(stages, cache_dir).items()}
+    states = run_stages(stages, cache_dir, verbose=False, **kwargs)
+    return states, sorted(n for n, up in before.items() if not up), time.perf_counter() - t0
+
+
+def span(state):
+    with open(os.path.join(state.out_dir, MANIFEST)) as f:
+        m = json.load(f)
+    return m["finished_at"] - m["elapsed_s"], m["finished_at"]
+
+
+# %%
+with tempfile.TemporaryDirectory() as root:
+    boundary_path, pbf_path, streetview_path, osm_cache = fixtures.write_city_inputs(root, RADIUS_M)
+    cache_dir = os.path.join(root, "stage_cache")
+
+    def stages(**params):
+        return build_stages(boundary_path, pbf_path, streetview_path, osm_cache, rate=None, verbose=False,
+                            **params)
+
+    states, ran, t_first = run(stages(), cache_dir)
+    assert ran == ["analysis", "fetch", "filter", "grid", "merge", "osm"], ran
+    (f0, f1), (o0, o1) = span(states["fetch"]), span(states["osm"])
+    assert f0 < o1 and o0 < f1, "fetch and osm did not overlap"
+    n_cells = len(read_table(os.path.join(states["grid"].out_dir, "glasgow_grid_20m.parquet")))
+    print(f"{n_cells} cells: first run {t_first:.1f}s, fetch {f1 - f0:.1f}s and osm {o1 - o0:.1f}s side by side")
+
+    states, ran, t_rerun = run(stages(), cache_dir)
+    assert ran == [] and all(s.up_to_date for s in states.values())
+    print(f"rerun: nothing stale, {t_rerun * 1000:.0f}ms")
+
+    tags10 = read_table(os.path.join(states["osm"].out_dir, GRID_TAGS))
+    states, ran, t = run(stages(half=12), cache_dir)
+    assert ran == ["analysis", "merge", "osm"], ran
+    tags12 = read_table(os.path.join(states["osm"].out_dir, GRID_TAGS))
+    assert tags12["n_tags"].sum() > tags10["n_tags"].sum()
+    print(f"half=12: reran {ran} in {t:.1f}s")
+
+    states, ran, t = run(stages(half=12, save_every=200), cache_dir)
+    assert ran == ["analysis", "fetch", "filter", "merge"], ran
+    print(f"save_every=200: reran {ran} in {t:.1f}s")
+
+    # back to the first parameters: everything is still cached
+    states, ran, _ = run(stages(), cache_dir)
+    assert ran == []
+    stage_list = stages()
+    linked = publish(stage_list, states, root)
+    summary = read_table(os.path.join(root, SUMMARY))
+    assert os.path.realpath(os.path.join(root, SUMMARY)) == os.path.join(states["analysis"].out_dir, SUMMARY)
+    print(f"original parameters: all cached; {len(linked)} outputs linked, grid_summary {len(summary)} rows")
+
+    # a re-crawl csv is an input file of filter: filter -> merge -> analysis rerun with its panoramas folded in
+    n_cleaned = len(read_table(os.path.join(states["filter"].out_dir, CLEANED)))
+    rows = read_table(os.path.join(states["fetch"].out_dir, RAW_METADATA)).dropna(subset=["year", "month"])
+    rows = rows[rows["panoid"].isin(rows["panoid"].unique()[:50])]
+    refresh_csv = os.path.join(root, "glasgow_streetview_metadata_grid_20m_refresh_test.csv")
+    rows.assign(panoid="new_" + rows["panoid"]).to_csv(refresh_csv, index=False)
+    states, ran, _ = run(stages(refresh=[refresh_csv]), cache_dir)
+    assert ran == ["analysis", "filter", "merge"], ran
+    assert len(read_table(os.path.join(states["filter"].out_dir, CLEANED))) == n_cleaned + 50
+    print(f"re-crawl csv added: reran {ran}, 50 new panoramas in the cleaned table")
+
+    # a run only keys the targets and their upstream stages: without the PBF, filter is still up to date
+    os.rename(pbf_path, pbf_path + ".moved")
+    states = run_stages(stages(), cache_dir, targets=["filter"], verbose=False)
+    assert sorted(states) == ["fetch", "filter", "grid"] and all(s.up_to_date for s in states.values())
+    print("PBF missing: filter and its upstream stages still plan, osm is not keyed")
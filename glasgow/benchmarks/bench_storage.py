@@ -0,0 +1,80 @@
+'''
+benchmark: CSV vs Parquet (storage.write_table / read_table) for a merged_svi_osm-like table.
+reports file size, full load time (csv load includes re-parsing the stringified tag lists),
+projected load (grid_id, panoid, date as in analysis.py) and a pushed-down road_type filter.
+usage: python glasgow/benchmarks/bench_storage.py [n_rows]
+'''
+# %%
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from storage import read_table, write_table  # noqa: E402
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+N_GRIDS = N_ROWS // 4
+
+HIGHWAYS = ["residential", "service", "footway", "primary", "secondary", "tertiary", "path", None]
+KEYS = ["building", "landuse", "amenity", "natural", "shop", "tourism", "highway"]
+
+
+def synthetic_merged(n_rows, n_grids, seed=0):
+    rng = np.random.default_rng(seed)
+    grid_id = np.sort(rng.integers(0, n_grids, n_rows))
+    # per-grid attributes, repeated on every panorama row as in merged_svi_osm
+    n_tags = rng.integers(0, 6, n_grids)
+    key_lists = [[str(k) for k in rng.choice(KEYS, n)] for n in n_tags]
+    value_lists = [[f"v{int(x)}" for x in rng.integers(0, 50, k)] for k in n_tags]
+    road_type = rng.choice(["no-road", "non-drivable", "drivable"], n_grids)
+    highway = rng.choice(np.array(HIGHWAYS, dtype=object), n_grids)
+    year = rng.integers(2008, 2024, n_rows)
+    month = rng.integers(1, 13, n_rows)
+    return pd.DataFrame({
+        "grid_id": grid_id,
+        "query_lat": 55.8 + grid_id * 1e-6,
+        "query_lon": -4.3 + grid_id * 1e-6,
+        "grid_highway": highway[grid_id],
+        "road_type": road_type[grid_id],
+        "n_tags": n_tags[grid_id],
+        "unique_keys": n_tags[grid_id],
+        "tag_key_list": [key_lists[g] for g in grid_id],
+        "tag_value_list": [value_lists[g] for g in grid_id],
+        "panoid": [f"pano{i:012d}" for i in range(n_rows)],
+        "lat": 55.8 + rng.random(n_rows) * 0.1,
+        "lon": -4.3 + rng.random(n_rows) * 0.2,
+        "year": year.astype(float),
+        "month": month.astype(float),
+        "distance_m": rng.random(n_rows) * 14,
+        "date": pd.to_datetime({"year": year, "month": month, "day": 1}),
+    })
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+# %%
+df = synthetic_merged(N_ROWS, N_GRIDS)
+print(f"{N_ROWS} rows, {N_GRIDS} grids")
+print(f"{'format':>8s} {'size_MB':>8s} {'write_s':>8s} {'load_s':>7s} {'project_s':>10s} {'filter_s':>9s}")
+with tempfile.TemporaryDirectory() as tmp:
+    for fmt in ["csv", "parquet"]:
+        path = os.path.join(tmp, f"merged_svi_osm.{fmt}")
+        _, t_write = timed(lambda: write_table(df, path))
+        full, t_load = timed(lambda: read_table(path))
+        _, t_proj = timed(lambda: read_table(path, columns=["grid_id", "panoid", "date"]))
+        sub, t_filter = timed(lambda: read_table(path, columns=["grid_id", "panoid", "date"],
+                                                 filters=[("road_type", "==", "drivable")]))
+        assert list(full["tag_key_list"].iloc[0]) == list(df["tag_key_list"].iloc[0])
+        assert len(sub) == (df["road_type"] == "drivable").sum()
+        size = os.path.getsize(path) / 1e6
+        print(f"{fmt:>8s} {size:>8.1f} {t_write:>8.2f} {t_load:>7.2f} {t_proj:>10.2f} {t_filter:>9.2f}")
+# %%
@@ -0,0 +1,133 @@
+'''
+regression check + RAM / load time: the normalized grid + panorama tables (svi_dataset.py) against the wide
+merged_svi_osm table the old merge_svi_meta_with_osm_tag.py wrote (per-grid columns and tag lists repeated on
+every panorama row), both as Parquet. the joined view must give the same rows as the old merge and the same
+temporal summary as the old analysis.py, and so must temporal_summary_ym on the panorama table alone. the same inputs with grid ids past 2**31 (large 27700 lattices) must come back
+unchanged, stored as int64.
+usage: python glasgow/benchmarks/bench_svi_dataset.py [n_grids]
+'''
+# %%
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from storage import read_table, write_table  # noqa: E402
+from svi_dataset import SVIDataset, write_svi_dataset  # noqa: E402
+from temporal_metrics import temporal_summary, temporal_summary_ym  # noqa: E402
+
+N_GRIDS = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+KEYS = ["building", "landuse", "amenity", "natural", "shop", "tourism", "highway"]
+HIGHWAYS = np.array(["residential", "service", "footway", "primary", "secondary", "tertiary", "path", None],
+                    dtype=object)
+
+
+def synthetic_inputs(n_grids, seed=0):
+    """grid_with_osm_tags_roads + cleaned metadata, ~70% of grids with 1-8 panoramas"""
+    rng = np.random.default_rng(seed)
+    n_tags = rng.integers(0, 8, n_grids)
+    osm_tags = pd.DataFrame({
+        "grid_id": np.arange(n_grids),
+        "query_lat": 55.8 + rng.random(n_grids) * 0.1,
+        "query_lon": -4.3 + rng.random(n_grids) * 0.2,
+        "grid_highway": rng.choice(HIGHWAYS, n_grids),
+        "road_type": rng.choice(["no-road", "non-drivable", "drivable"], n_grids),
+        "n_tags": n_tags,
+        "unique_keys": np.minimum(n_tags, 3),
+        "tag_key_list": [[str(k) for k in rng.choice(KEYS, n)] if n else None for n in n_tags],
+        "tag_value_list": [[f"v{int(x)}" for x in rng.integers(0, 60, n)] if n else None for n in n_tags],
+    })
+    n_per_grid = np.where(rng.random(n_grids) < 0.7, rng.integers(1, 9, n_grids), 0)
+    gid = rng.permutation(np.repeat(np.arange(n_grids), n_per_grid))
+    n = len(gid)
+    svi_meta = pd.DataFrame({
+        "query_lat": osm_tags["query_lat"].to_numpy()[gid], "query_lon": osm_tags["query_lon"].to_numpy()[gid],
+        "panoid": [f"{i:022d}" for i in rng.permutation(n)],
+        "lat": 55.8 + rng.random(n) * 0.1, "lon": -4.3 + rng.random(n) * 0.2,
+        "year": rng.integers(2008, 2025, n).astype(float), "month": rng.integers(1, 13, n).astype(float),
+        "distance_m": rng.random(n) * 50, "grid_id": gid,
+    })
+    return osm_tags, svi_meta
+
+
+def old_merge(osm_tags, svi_meta):
+    """merge_svi_meta_with_osm_tag.py before the split"""
+    svi_meta = svi_meta.copy()
+    svi_meta["date"] = pd.to_datetime(svi_meta["year"].astype(int).astype(str) + "-" +
+                                      svi_meta["month"].astype(int).astype(str))
+    svi_meta.drop(columns=["query_lat", "query_lon"], inplace=True)
+    merged = osm_tags.merge(svi_meta, on="grid_id", how="left")
+    return merged[["grid_id"] + [c for c in merged.columns if c != "grid_id"]]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def mem(df):
+    return df.memory_usage(deep=True).sum()
+
+
+# %%
+if __name__ == "__main__":
+    osm_tags, svi_meta = synthetic_inputs(N_GRIDS)
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = write_table(old_merge(osm_tags, svi_meta), os.path.join(tmp, "merged_svi_osm.parquet"))
+        new_dir = write_svi_dataset(osm_tags, svi_meta, os.path.join(tmp, "merged_svi_osm"))
+
+        old_full, t_old_full = timed(lambda: read_table(old_path))
+        ds = SVIDataset(new_dir)
+        _, t_new_full = timed(lambda: (ds.grid(), ds.panos()))
+        new_full_mem = ds.memory_usage()
+
+        cols = ["grid_id", "panoid", "date"]
+        old_proj, t_old_proj = timed(lambda: read_table(old_path, columns=cols))
+        new_proj, t_new_proj = timed(lambda: SVIDataset(new_dir).joined(cols))
+        summary_joined, t_summary_joined = timed(lambda: temporal_summary(SVIDataset(new_dir).joined(cols)))
+        summary_ym, t_summary_ym = timed(lambda: temporal_summary_ym(
+            SVIDataset(new_dir).grid(["grid_id"])["grid_id"], SVIDataset(new_dir).panos(["grid_id", "panoid", "ym"])))
+
+        joined = ds.joined(list(old_full.columns))
+
+        # ids that do not fit int32 (row * n_cols + col of a large lattice): int64, not wrapped
+        offset = 3_000_000_000
+        wide_dir = write_svi_dataset(osm_tags.assign(grid_id=osm_tags["grid_id"] + offset),
+                                     svi_meta.assign(grid_id=svi_meta["grid_id"] + offset),
+                                     os.path.join(tmp, "merged_svi_osm_wide"))
+        wide = SVIDataset(wide_dir).joined(["grid_id", "panoid"])
+        assert wide["grid_id"].dtype == np.int64
+        assert (wide["grid_id"].to_numpy() - offset == joined["grid_id"].to_numpy()).all()
+        same = wide["panoid"].astype(object) == joined["panoid"].astype(object)
+        assert same.sum() == joined["panoid"].notna().sum()
+
+    # same rows as the old merge
+    for c in ["grid_id", "panoid", "road_type", "grid_highway", "n_tags", "unique_keys", "date", "year", "month"]:
+        a, b = old_full[c].astype(object), joined[c].astype(object)
+        assert ((a == b) | (a.isna() & b.isna())).all(), c
+    for c in ["query_lat", "lat", "distance_m"]:
+        np.testing.assert_allclose(old_full[c], joined[c], rtol=1e-6, atol=1e-4)
+    for c in ["tag_key_list", "tag_value_list"]:
+        assert all((a is None and pd.isna(b)) or list(a) == list(b) for a, b in zip(old_full[c], joined[c])), c
+    old_summary = temporal_summary(old_proj).astype(str)
+    pd.testing.assert_frame_equal(old_summary, temporal_summary(new_proj).astype(str), check_index_type=False)
+    pd.testing.assert_frame_equal(old_summary, summary_ym.astype(str), check_index_type=False)
+    pd.testing.assert_frame_equal(summary_joined, summary_ym)
+
+    print(f"{N_GRIDS} grids, {len(svi_meta)} panoramas, {len(old_full)} merged rows: joined view identical, "
+          f"same temporal summary, ids past int32 kept as int64")
+    print(f"{'':32s} {'old wide':>12s} {'grid+panos':>12s}")
+    print(f"{'full load, RAM (MB)':32s} {mem(old_full) / 1e6:>12.0f} {new_full_mem / 1e6:>12.0f}  "
+          f"({mem(old_full) / new_full_mem:.1f}x)")
+    print(f"{'full load, time (s)':32s} {t_old_full:>12.2f} {t_new_full:>12.2f}  ({t_old_full / t_new_full:.1f}x)")
+    print(f"{'analysis columns, RAM (MB)':32s} {mem(old_proj) / 1e6:>12.0f} {mem(new_proj) / 1e6:>12.0f}")
+    print(f"{'analysis columns, time (s)':32s} {t_old_proj:>12.2f} {t_new_proj:>12.2f}")
+    print(f"temporal summary: joined view {t_summary_joined:.2f}s, panorama table (ym) {t_summary_ym:.2f}s "
+          f"({t_summary_joined / t_summary_ym:.1f}x)")
+# %%
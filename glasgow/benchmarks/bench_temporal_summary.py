@@ -0,0 +1,85 @@
+'''
+regression check + timing: temporal_metrics.temporal_summary against the group.apply(agg_time) it replaces
+in analysis.py, on a synthetic merged table (text dates in %d/%m/%Y, unparseable dates, grids without
+panoramas, repeated months). the two summaries must be identical.
+usage: python glasgow/benchmarks/bench_temporal_summary.py [n_grids]
+'''
+# %%
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from temporal_metrics import temporal_summary  # noqa: E402
+
+N_GRIDS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+def synthetic_merged(n_grids, seed=0):
+    rng = np.random.default_rng(seed)
+    n_per_grid = rng.poisson(3, n_grids)
+    grid_id = np.repeat(np.arange(n_grids), np.maximum(n_per_grid, 1))
+    rng.shuffle(grid_id)
+    n = len(grid_id)
+    year = rng.integers(2008, 2024, n)
+    month = rng.integers(1, 13, n)
+    day = rng.integers(1, 28, n)
+    date = pd.Series([f"{d:02d}/{m:02d}/{y}" for d, m, y in zip(day, month, year)], dtype=object)
+    date[rng.random(n) < 0.05] = np.nan          # grids joined without a panorama
+    date[rng.random(n) < 0.01] = "not a date"    # unparseable
+    panoid = pd.Series([f"p{i % (n // 2)}" for i in range(n)], dtype=object)
+    panoid[date.isna()] = np.nan
+    return pd.DataFrame({"grid_id": grid_id, "panoid": panoid, "date": date})
+
+
+# %%
+merged = synthetic_merged(N_GRIDS)
+
+# ---- old path, verbatim from analysis.py ----
+t0 = time.perf_counter()
+parsed_date = pd.to_datetime(merged["date"], format="%d/%m/%Y", errors="coerce")
+month_index = parsed_date.dt.year * 12 + parsed_date.dt.month
+group = merged.groupby("grid_id")
+
+
+def agg_time(df):
+    idx = (pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce").dt.year * 12 +
+           pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce").dt.month)
+    idx = idx.dropna().astype(int).values
+    if len(idx) == 0:
+        return pd.Series({
+            "first_date": np.nan, "latest_date": np.nan, "n_dates": 0, "n_panos": df["panoid"].nunique(),
+            "max_gap_months": np.nan, "span_months": np.nan, "recency_months": np.nan
+        })
+    idx_sorted = np.sort(idx)
+    first_idx = idx_sorted[0]
+    last_idx = idx_sorted[-1]
+    max_gap = np.max(np.diff(idx_sorted)) if len(idx_sorted) > 1 else np.nan
+    first_text = df.loc[(pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce").dt.year * 12 +
+                         pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce").dt.month) == first_idx, "date"].iloc[0]
+    latest_text = df.loc[(pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce").dt.year * 12 +
+                          pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce").dt.month) == last_idx, "date"].iloc[0]
+    return pd.Series({
+        "first_date": first_text, "latest_date": latest_text, "n_dates": len(np.unique(idx_sorted)),
+        "n_panos": df["panoid"].nunique(), "max_gap_months": max_gap, "span_months": last_idx - first_idx,
+        "recency_months": month_index.max() - last_idx
+    })
+
+
+old = group.apply(agg_time)
+t_old = time.perf_counter() - t0
+
+# ---- new path ----
+t0 = time.perf_counter()
+new = temporal_summary(merged)
+t_new = time.perf_counter() - t0
+
+pd.testing.assert_frame_equal(old.astype(object), new.astype(object), check_dtype=False, check_exact=False)
+print(f"{len(merged)} rows, {N_GRIDS} grids: summaries identical")
+print(f"group.apply(agg_time): {t_old:.2f}s")
+print(f"temporal_summary:      {t_new:.3f}s  ({t_old / t_new:.0f}x)")
+# %%
@@ -0,0 +1,139 @@
+'''
+regression check + timing: tile_pipeline.run_tiles against the same stages run citywide in one process, on the
+pyrosm test PBF (offline) with a synthetic crawl on the lattice: random panoramas, each returned by every cell
+centre within QUERY_RADIUS, plus a few linked panoramas up to LINKED_RADIUS away per cell (the service does
+return panoramas beyond the search radius), cells visited in shuffled order. the tiled merged table and temporal
+summary must equal the citywide ones (including panoramas whose candidate cells straddle tile edges or lie
+several tiles apart), a rerun without changes must recompute no tile, and editing one cell's crawl rows must
+only recompute the tiles whose shard changed.
+usage: python glasgow/benchmarks/bench_tile_pipeline.py [workers] [tile_rows]
+'''
+# %%
+import os
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyrosm
+from pyproj import Transformer
+from shapely.geometry import box
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from grid_utils import iter_lattice_tiles, lattice_spec  # noqa: E402
+from osm_layers import ensure_osm_cache  # noqa: E402
+from query_planner import QUERY_RADIUS  # noqa: E402
+from svi_fetch import haversine_np  # noqa: E402
+import tile_pipeline  # noqa: E402
+from temporal_metrics import temporal_summary  # noqa: E402
+
+WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+TILE_ROWS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+SPACING = 20
+LINKED_RADIUS = 6 * QUERY_RADIUS
+
+
+def synthetic_crawl(df_grid, n_panos, seed=0):
+    """rows as fetch_grid_metadata writes them; cells without panoramas get a NaN row"""
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(seed)
+    px = rng.uniform(df_grid["x"].min(), df_grid["x"].max(), n_panos)
+    py = rng.uniform(df_grid["y"].min(), df_grid["y"].max(), n_panos)
+    plon, plat = Transformer.from_crs(27700, 4326, always_xy=True).transform(px, py)
+    year = rng.integers(2009, 2024, n_panos)
+    month = rng.integers(1, 13, n_panos)
+
+    tree = cKDTree(np.c_[px, py])
+    hits = tree.query_ball_point(df_grid[["x", "y"]].to_numpy(), QUERY_RADIUS)
+    linked = tree.query_ball_point(df_grid[["x", "y"]].to_numpy(), LINKED_RADIUS)
+    rows = []
+    for i in rng.permutation(len(df_grid)):
+        cell = df_grid.iloc[i]
+        if not hits[i]:
+            rows.append((cell.query_lat, cell.query_lon, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, cell.grid_id))
+            continue
+        far = np.setdiff1d(linked[i], hits[i])
+        for p in list(hits[i]) + list(rng.choice(far, min(len(far), 2), replace=False)):
+            d = haversine_np(cell.query_lat, cell.query_lon, plat[p], plon[p])
+            rows.append((cell.query_lat, cell.query_lon, f"pano{p}", plat[p], plon[p], year[p], month[p], d, cell.grid_id))
+    return pd.DataFrame(rows, columns=tile_pipeline.META_COLUMNS)
+
+
+def citywide(df_grid, raw, spec, layer_dir):
+    """the stages in one process over the whole grid (filter_svi_metadata.py idxmin rule)"""
+    tile_pipeline._init_worker(poly_27700.wkb, spec, layer_dir)
+    w = tile_pipeline._WORKER
+    osm = tile_pipeline.tile_osm_attributes(df_grid, spec, w["indexes"], w["drivable_ids"], w["drivable_index"])
+    filtered = raw.dropna(subset=["year", "month"])
+    meta = filtered.loc[filtered.groupby("panoid")["distance_m"].idxmin()]
+    merged = tile_pipeline.merge_tile(osm, meta)
+    ref = int((filtered["year"] * 12 + filtered["month"]).max())
+    return merged, temporal_summary(merged, reference_month=ref)
+
+
+def canon(df):
+    """row order and the order inside the tag lists follow the (per-tile) vocabulary: compare as sorted"""
+    df = df.sort_values(["grid_id", "panoid"]).reset_index(drop=True)
+    tags = [sorted(zip(k, v)) if isinstance(k, (list, np.ndarray)) else None
+            for k, v in zip(df["tag_key_list"], df["tag_value_list"])]
+    return df.drop(columns=["tag_key_list", "tag_value_list"]).assign(tags=tags).astype(str)
+
+
+# %%
+if __name__ == "__main__":
+    pbf = pyrosm.get_data("test_pbf")
+    with tempfile.TemporaryDirectory() as tmp:
+        layer_dir = ensure_osm_cache(pbf, box(-180, -90, 180, 90), os.path.join(tmp, "osm_cache"), verbose=False)
+        bounds = gpd.read_parquet(os.path.join(layer_dir, "roads_all.parquet")).to_crs(27700).total_bounds
+        poly_27700 = box(*bounds).buffer(-50)
+        spec = lattice_spec(bounds, spacing_m=SPACING, tile_rows=TILE_ROWS)
+        df_grid = pd.concat([df for _, df in iter_lattice_tiles(poly_27700, spec)], ignore_index=True)
+
+        crawl = synthetic_crawl(df_grid, n_panos=len(df_grid) // 8)
+        raw_path = os.path.join(tmp, "raw.csv")
+        crawl.to_csv(raw_path, index=False)
+        raw = pd.read_csv(raw_path)  # both sides see the csv round-trip of the floats
+        print(f"{len(df_grid)} cells in {tile_pipeline.n_lattice_tiles(spec)} tiles of {TILE_ROWS} rows, "
+              f"{len(raw)} crawl rows, {raw['panoid'].nunique()} panoramas")
+
+        t0 = time.perf_counter()
+        ref_merged, ref_summary = citywide(df_grid, raw, spec, layer_dir)
+        t_city = time.perf_counter() - t0
+
+        work = os.path.join(tmp, "work")
+        t0 = time.perf_counter()
+        out, stats = tile_pipeline.run_tiles(poly_27700, spec, layer_dir, raw_path, work, workers=WORKERS,
+                                             outputs=("merged", "summary"), verbose=False)
+        t_tiles = time.perf_counter() - t0
+        pd.testing.assert_frame_equal(canon(ref_merged), canon(out["merged"]))
+        pd.testing.assert_frame_equal(ref_summary.sort_index().astype(str), out["summary"].sort_index().astype(str))
+
+        t0 = time.perf_counter()
+        _, stats_noop = tile_pipeline.run_tiles(poly_27700, spec, layer_dir, raw_path, work, workers=WORKERS,
+                                                verbose=False)
+        t_noop = time.perf_counter() - t0
+        assert stats_noop["rerun"] == 0, stats_noop
+
+        # re-crawl one cell in the middle: its panoramas move 1m closer
+        gid = int(df_grid["grid_id"].iloc[len(df_grid) // 2])
+        edited = crawl.copy()
+        edited.loc[edited["grid_id"] == gid, "distance_m"] -= 1
+        edited.to_csv(raw_path, index=False)
+        edited = pd.read_csv(raw_path)
+        t0 = time.perf_counter()
+        out2, stats_edit = tile_pipeline.run_tiles(poly_27700, spec, layer_dir, raw_path, work, workers=WORKERS,
+                                                   outputs=("merged",), verbose=False)
+        t_edit = time.perf_counter() - t0
+        ref_merged2, _ = citywide(df_grid, edited, spec, layer_dir)
+        pd.testing.assert_frame_equal(canon(ref_merged2), canon(out2["merged"]))
+
+    print(f"tiled merged table + temporal summary identical to citywide ({len(ref_merged)} rows)")
+    print(f"citywide, 1 process:           {t_city:.2f}s")
+    print(f"run_tiles, {WORKERS} workers:          {t_tiles:.2f}s ({stats['rerun']} tiles)")
+    print(f"rerun, nothing changed:        {t_noop:.2f}s ({stats_noop['rerun']} tiles)")
+    print(f"rerun, one cell re-crawled:    {t_edit:.2f}s ({stats_edit['rerun']} tiles)")
+# %%
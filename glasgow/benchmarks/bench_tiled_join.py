@@ -0,0 +1,142 @@
+'''
+memory + time: tiled_sjoin (spatial_join.py) against the old step 4 of get_osm_grid_tags_with_road_type.py
+(one gpd.sjoin per layer on the full grid, concat, back_to_wgs84), on a synthetic city: a 20m lattice with
+random street segments and building footprints. each variant runs in its own process so peak RSS is its own.
+the (grid_id, layer, tags) rows of both must be the same multiset. road_type and the tag matrix are then built
+from the tile files one tile at a time (iter_joined) and from the whole join read back (read_joined): same
+results, and the streamed variant never holds more than one tile's join rows.
+usage: python glasgow/benchmarks/bench_tiled_join.py [side_m]
+'''
+# %%
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+from osm_tags import classify_road_type, encode_tags  # noqa: E402
+from spatial_join import LayerIndex, iter_joined, read_joined, tiled_sjoin  # noqa: E402
+
+SIDE_M = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+SPACING = 20
+KEYS = ["building", "highway"]
+
+
+def synthetic_city(side_m, seed=0):
+    rng = np.random.default_rng(seed)
+    c = np.arange(SPACING / 2, side_m, SPACING) + 260000
+    x, y = np.meshgrid(c, c + 660000)
+    x, y = x.ravel(), y.ravel()
+    grid = gpd.GeoDataFrame({"grid_id": np.arange(len(x))},
+                            geometry=shapely.box(x - 10, y - 10, x + 10, y + 10), crs=27700)
+
+    n_roads = side_m * side_m // 20000
+    sx, sy = rng.uniform(260000, 260000 + side_m, (2, n_roads))
+    ang = rng.uniform(0, np.pi, n_roads)
+    length = rng.uniform(30, 300, n_roads)
+    roads = gpd.GeoDataFrame({
+        "id": np.arange(n_roads), "building": None,
+        "highway": rng.choice(["residential", "service", "footway", "primary"], n_roads),
+    }, geometry=shapely.linestrings(np.stack([
+        np.stack([sx, sx + length * np.cos(ang)], 1), np.stack([sy + 660000, sy + 660000 + length * np.sin(ang)], 1)
+    ], -1)), crs=27700)
+
+    n_bld = side_m * side_m // 2000
+    bx, by = rng.uniform(260000, 260000 + side_m, (2, n_bld))
+    w = rng.uniform(5, 30, n_bld)
+    buildings = gpd.GeoDataFrame({
+        "id": np.arange(n_bld) + n_roads, "highway": None,
+        "building": rng.choice(["yes", "house", "apartments"], n_bld),
+        "name": [f"building {i}" for i in range(n_bld)],  # attribute the join does not need
+    }, geometry=shapely.box(bx, by + 660000, bx + w, by + 660000 + w), crs=27700)
+    return grid, {"roads": roads, "buildings": buildings}
+
+
+def run_old(side_m):
+    grid, layers = synthetic_city(side_m)
+    t0 = time.perf_counter()
+    joined_list = []
+    for name, gdf in layers.items():
+        j = gpd.sjoin(gdf, grid[["grid_id", "geometry"]], how="inner", predicate="intersects")
+        j = j.drop(columns=["index_right"])
+        j["layer"] = name
+        joined_list.append(j)
+    joined_all = pd.concat(joined_list, ignore_index=True).to_crs(4326)
+    rows = joined_all.drop(columns=["geometry"])[["grid_id", "layer"] + KEYS]
+    return time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, rows
+
+
+def run_tiled(side_m, out_dir):
+    grid, layers = synthetic_city(side_m)
+    t0 = time.perf_counter()
+    indexes = [LayerIndex(name, gdf, KEYS + ["id"]) for name, gdf in layers.items()]
+    tiled_sjoin(grid, indexes, out_dir, verbose=False)
+    del indexes
+    rows = read_joined(out_dir, columns=["grid_id", "layer"] + KEYS)
+    return time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, rows
+
+
+def run_summaries(out_dir, n_cells, streamed):
+    """road_type + tag matrix from the join files, streamed per tile or read back whole"""
+    grid_ids = np.arange(n_cells)
+    drivable_ids = np.arange(0, n_cells, 2)  # any id set works: both variants get the same one
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    if streamed:
+        roads = (df for _, df in iter_joined(out_dir, columns=["grid_id", "id"], filters=[("layer", "==", "roads")]))
+        tags = (df for _, df in iter_joined(out_dir, columns=["grid_id"] + KEYS))
+    else:
+        roads = read_joined(out_dir, columns=["grid_id", "id"], filters=[("layer", "==", "roads")])
+        tags = read_joined(out_dir, columns=["grid_id"] + KEYS)
+    road_type = classify_road_type(grid_ids, roads, drivable_ids)
+    tm = encode_tags(tags, grid_ids, keys=KEYS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return time.perf_counter() - t0, rss - rss0, road_type.astype(str).to_numpy(), tm
+
+
+def base_rss(side_m):
+    synthetic_city(side_m)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def canon(rows):
+    rows = rows.astype({"layer": str}).fillna("")
+    return rows.sort_values(list(rows.columns)).reset_index(drop=True)
+
+
+# %%
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        # fresh process per variant: ru_maxrss is per-process peak
+        with ProcessPoolExecutor(1) as p:
+            rss0 = p.submit(base_rss, SIDE_M).result()
+        with ProcessPoolExecutor(1) as p:
+            t_old, rss_old, old = p.submit(run_old, SIDE_M).result()
+        with ProcessPoolExecutor(1) as p:
+            t_new, rss_new, new = p.submit(run_tiled, SIDE_M, tmp).result()
+        n_cells = (SIDE_M // SPACING) ** 2
+        summaries = {}
+        for streamed in (False, True):
+            with ProcessPoolExecutor(1) as p:
+                summaries[streamed] = p.submit(run_summaries, tmp, n_cells, streamed).result()
+
+    pd.testing.assert_frame_equal(canon(old), canon(new), check_dtype=False)
+    (t_whole, rss_whole, rt_whole, tm_whole), (t_tile, rss_tile, rt_tile, tm_tile) = summaries[False], summaries[True]
+    assert (rt_whole == rt_tile).all()
+    assert (tm_whole.counts != tm_tile.counts).nnz == 0
+    pd.testing.assert_frame_equal(tm_whole.vocab, tm_tile.vocab)
+    print(f"{n_cells} cells, {len(new)} joined rows: same rows")
+    print(f"fixture only:          peak RSS {rss0 / 1024:.0f} MB")
+    print(f"full sjoin + to_crs:   {t_old:.2f}s  peak RSS {rss_old / 1024:.0f} MB (+{(rss_old - rss0) / 1024:.0f})")
+    print(f"tiled_sjoin:           {t_new:.2f}s  peak RSS {rss_new / 1024:.0f} MB (+{(rss_new - rss0) / 1024:.0f})")
+    print(f"road_type + tag matrix, whole join:  {t_whole:.2f}s  +{rss_whole / 1024:.0f} MB")
+    print(f"road_type + tag matrix, per tile:    {t_tile:.2f}s  +{rss_tile / 1024:.0f} MB (same results)")
+# %%
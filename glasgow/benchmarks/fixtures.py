@@ -0,0 +1,255 @@
+'''
+synthetic city fixtures for the benchmark suite (run_suite.py), all generated offline from a seed:
+- a boundary polygon (a lobed disk around central Glasgow, EPSG:4326) sized by SCALES
+- an OSM layer set shaped like the pyrosm output load_osm_layers returns: a street network (roads_all, with
+  roads_drivable the subset of drivable ways sharing their ids), buildings, landuse, natural and POIs
+- a panorama world: captures every PANO_SPACING metres along the streets, re-driven in several campaigns, so
+  neighbouring cells' queries return heavily overlapping panoids like the real endpoint; a stub streetview
+  module answers panoids(lat, lon) from it
+- a merged table (grid + panorama tables) for timing the analysis on its own
+- the input files of the pipeline stages (write_city_inputs): boundary GeoJSON, a stub streetview.py and an OSM
+  layer cache pre-filled for a placeholder PBF, so the stage cache / CLI run end to end offline
+'''
+import json
+import os
+import sys
+import types
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+
+# name -> boundary radius in metres (~ 11k / 70k / 500k cells of 20m)
+SCALES = {"small": 1200, "medium": 3000, "large": 8000}
+CENTRE_27700 = (259000.0, 665000.0)  # Glasgow city centre
+STREET_EVERY = 120     # metres between the streets of the synthetic network
+PANO_SPACING = 10      # metres between captures along a street
+CAMPAIGNS = (2009, 2012, 2015, 2018, 2021, 2023)
+HIGHWAYS = ["primary", "secondary", "tertiary", "residential", "service", "footway", "path"]
+DRIVABLE = {"primary", "secondary", "tertiary", "residential", "service"}
+
+_TO_WGS84 = Transformer.from_crs(27700, 4326, always_xy=True)
+
+
+def boundary_27700(scale, seed=0):
+    """lobed disk (radius of the scale, +-15%) around CENTRE_27700"""
+    rng = np.random.default_rng(seed)
+    radius = SCALES[scale] if isinstance(scale, str) else float(scale)
+    theta = np.linspace(0, 2 * np.pi, 181)[:-1]
+    phase = rng.uniform(0, 2 * np.pi, 3)
+    r = radius * (1 + 0.15 * sum(np.sin(k * theta + p) / k for k, p in zip((3, 5, 7), phase)))
+    x0, y0 = CENTRE_27700
+    return shapely.Polygon(np.c_[x0 + r * np.cos(theta), y0 + r * np.sin(theta)])
+
+
+def boundary(scale, seed=0):
+    """the boundary as a GeoDataFrame in EPSG:4326 (like glasgow_boundary.geojson)"""
+    return gpd.GeoDataFrame(geometry=[boundary_27700(scale, seed)], crs=27700).to_crs(4326)
+
+
+def _to_4326(gdf):
+    return gdf.set_crs(27700).to_crs(4326)
+
+
+def osm_layers(poly_27700, seed=0):
+    """{layer name: GeoDataFrame (EPSG:4326) or None} as osm_layers.load_osm_layers returns them"""
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = poly_27700.bounds
+
+    # jittered street lattice, each street split into blocks with their own highway class
+    segments = []
+    for y in np.arange(miny, maxy, STREET_EVERY) + rng.uniform(0, STREET_EVERY):
+        xs = np.arange(minx, maxx, STREET_EVERY)
+        segments += [((a, y), (a + STREET_EVERY, y + rng.normal(0, 5))) for a in xs]
+    for x in np.arange(minx, maxx, STREET_EVERY) + rng.uniform(0, STREET_EVERY):
+        ys = np.arange(miny, maxy, STREET_EVERY)
+        segments += [((x, b), (x + rng.normal(0, 5), b + STREET_EVERY)) for b in ys]
+    lines = shapely.linestrings(np.array(segments))
+    keep = shapely.intersects(lines, poly_27700)
+    lines = lines[keep]
+    highway = rng.choice(HIGHWAYS, len(lines), p=[0.05, 0.08, 0.12, 0.35, 0.15, 0.15, 0.10])
+    roads_all = gpd.GeoDataFrame({"id": np.arange(len(lines)), "highway": highway}, geometry=lines)
+    roads_drivable = roads_all[roads_all["highway"].isin(DRIVABLE)].reset_index(drop=True)
+
+    area = poly_27700.area
+    n_bld = int(area / 1500)
+    bx, by = rng.uniform([minx, miny], [maxx, maxy], (n_bld, 2)).T
+    size = rng.uniform(6, 25, n_bld)
+    buildings = gpd.GeoDataFrame({
+        "id": np.arange(n_bld),
+        "building": rng.choice(["yes", "house", "residential", "retail", "commercial"], n_bld),
+    }, geometry=shapely.box(bx, by, bx + size, by + size))
+    buildings = buildings[shapely.intersects(buildings.geometry.values, poly_27700)].reset_index(drop=True)
+
+    n_land = int(area / 60000) + 1
+    lx, ly = rng.uniform([minx, miny], [maxx, maxy], (n_land, 2)).T
+    landuse = gpd.GeoDataFrame({
+        "id": np.arange(n_land),
+        "landuse": rng.choice(["residential", "industrial", "commercial", "grass"], n_land),
+    }, geometry=shapely.buffer(shapely.points(lx, ly), rng.uniform(40, 200, n_land)))
+
+    n_nat = int(area / 200000) + 1
+    nx, ny = rng.uniform([minx, miny], [maxx, maxy], (n_nat, 2)).T
+    natural = gpd.GeoDataFrame({
+        "id": np.arange(n_nat),
+        "natural": rng.choice(["water", "wood", "scrub"], n_nat),
+    }, geometry=shapely.buffer(shapely.points(nx, ny), rng.uniform(30, 150, n_nat)))
+
+    n_poi = int(area / 5000)
+    px, py = rng.uniform([minx, miny], [maxx, maxy], (n_poi, 2)).T
+    kind = rng.choice(["amenity", "shop", "tourism"], n_poi, p=[0.6, 0.3, 0.1])
+    values = {"amenity": ["cafe", "school", "pub", "bench"], "shop": ["convenience", "clothes"],
+              "tourism": ["hotel", "museum"]}
+    pois = gpd.GeoDataFrame({"id": np.arange(n_poi)}, geometry=shapely.points(px, py))
+    for k, vals in values.items():
+        pois[k] = np.where(kind == k, rng.choice(vals, n_poi), None)
+
+    return {name: _to_4326(gdf) for name, gdf in {
+        "roads_all": roads_all, "roads_drivable": roads_drivable, "buildings": buildings,
+        "landuse": landuse, "natural": natural, "pois": pois,
+    }.items()}
+
+
+class PanoWorld:
+    """
+    panoramas along the streets of a layer set: a capture every PANO_SPACING metres, each street block driven
+    in a random subset of CAMPAIGNS (drivable ways more often). panoids(lat, lon) returns every capture within
+    radius metres, with the fields streetview.panoids gives
+    """
+
+    def __init__(self, roads_all, radius=50, seed=0):
+        rng = np.random.default_rng(seed)
+        roads = roads_all.to_crs(27700)
+        lengths = roads.length.to_numpy()
+        n_pts = np.maximum(1, (lengths // PANO_SPACING).astype(int))
+        way = np.repeat(np.arange(len(roads)), n_pts)
+        frac = (np.arange(n_pts.sum()) - np.repeat(np.cumsum(n_pts) - n_pts, n_pts) + 0.5) / np.repeat(n_pts, n_pts)
+        pts = shapely.line_interpolate_point(roads.geometry.to_numpy()[way], frac, normalized=True)
+        x, y = shapely.get_x(pts), shapely.get_y(pts)
+
+        p_drive = np.where(roads["highway"].isin(DRIVABLE).to_numpy(), 0.7, 0.2)[way]
+        driven = rng.random((len(CAMPAIGNS), len(way))) < p_drive  # campaign x capture point
+        camp, point = np.nonzero(driven)
+        self.x = x[point] + rng.normal(0, 1.5, len(point))
+        self.y = y[point] + rng.normal(0, 1.5, len(point))
+        self.lon, self.lat = _TO_WGS84.transform(self.x, self.y)
+        self.year = np.asarray(CAMPAIGNS)[camp]
+        self.month = rng.integers(3, 10, len(point))
+        self.radius = radius
+        # queries come from many fetch threads: a plain local metric projection instead of a shared Transformer
+        self.lat0 = float(np.mean(self.lat)) if len(self.lat) else 55.86
+        self.tree = cKDTree(self._local_xy(self.lat, self.lon))
+
+    def __len__(self):
+        return len(self.x)
+
+    def _local_xy(self, lat, lon):
+        m = 111_320.0
+        return np.c_[np.asarray(lon) * m * np.cos(np.radians(self.lat0)), np.asarray(lat) * m]
+
+    def save(self, path):
+        """arrays the streetview stub of write_city_inputs answers from"""
+        np.savez(path, lat=self.lat, lon=self.lon, year=self.year, month=self.month, lat0=self.lat0,
+                 radius=self.radius)
+        return path
+
+    def panoids(self, lat, lon):
+        hits = sorted(self.tree.query_ball_point(self._local_xy(lat, lon)[0], self.radius))
+        return [{"panoid": f"pano{i:08d}", "lat": float(self.lat[i]), "lon": float(self.lon[i]),
+                 "year": int(self.year[i]), "month": int(self.month[i])} for i in hits]
+
+
+def stub_streetview(world):
+    """a module standing in for streetview.py (registered as sys.modules["streetview"]) backed by world"""
+    module = types.ModuleType("streetview")
+    module.panoids = world.panoids
+    sys.modules["streetview"] = module
+    return module
+
+
+def synthetic_merged(n_grids, seed=0):
+    """grid_with_osm_tags_roads + cleaned metadata for write_svi_dataset, ~70% of grids with 1-8 panoramas"""
+    rng = np.random.default_rng(seed)
+    n_tags = rng.integers(0, 8, n_grids)
+    keys = ["building", "landuse", "amenity", "highway"]
+    osm = pd.DataFrame({
+        "grid_id": np.arange(n_grids),
+        "query_lat": 55.8 + rng.random(n_grids) * 0.1,
+        "query_lon": -4.3 + rng.random(n_grids) * 0.2,
+        "grid_highway": rng.choice(np.array(HIGHWAYS + [None], dtype=object), n_grids),
+        "road_type": rng.choice(["no-road", "non-drivable", "drivable"], n_grids),
+        "n_tags": n_tags,
+        "unique_keys": np.minimum(n_tags, 3),
+        "tag_key_list": [list(rng.choice(keys, k)) if k else None for k in n_tags],
+        "tag_value_list": [list(rng.choice(["yes", "house", "residential"], k)) if k else None for k in n_tags],
+    })
+    n_per_grid = np.where(rng.random(n_grids) < 0.7, rng.integers(1, 9, n_grids), 0)
+    grid_id = np.repeat(np.arange(n_grids), n_per_grid)
+    n = len(grid_id)
+    meta = pd.DataFrame({
+        "query_lat": osm["query_lat"].to_numpy()[grid_id],
+        "query_lon": osm["query_lon"].to_numpy()[grid_id],
+        "panoid": [f"pano{i:08d}" for i in range(n)],
+        "lat": osm["query_lat"].to_numpy()[grid_id] + rng.normal(0, 1e-4, n),
+        "lon": osm["query_lon"].to_numpy()[grid_id] + rng.normal(0, 1e-4, n),
+        "year": rng.integers(2009, 2024, n).astype(float),
+        "month": rng.integers(1, 13, n).astype(float),
+        "distance_m": rng.uniform(0, 50, n),
+        "grid_id": grid_id,
+    })
+    return osm, meta
+
+
+# a self-contained streetview.py answering panoids() from a PanoWorld saved with PanoWorld.save: numpy + scipy only,
+# so the modules a pipeline stage imports are not hidden by the stub's own imports
+STREETVIEW_STUB = """
+import numpy as np
+from scipy.spatial import cKDTree
+
+_w = dict(np.load({path!r}))  # NpzFile re-reads an array on every access
+_scale = np.array([111_320.0 * np.cos(np.radians(float(_w["lat0"]))), 111_320.0])
+_tree = cKDTree(np.c_[_w["lon"], _w["lat"]] * _scale)
+
+
+def panoids(lat, lon):
+    hits = sorted(_tree.query_ball_point(np.array([lon, lat]) * _scale, float(_w["radius"])))
+    return [{{"panoid": f"pano{{i:08d}}", "lat": float(_w["lat"][i]), "lon": float(_w["lon"][i]),
+             "year": int(_w["year"][i]), "month": int(_w["month"][i])}} for i in hits]
+"""
+
+
+def write_city_inputs(root, scale, seed=0):
+    """
+    boundary.geojson, city.osm.pbf (placeholder), streetview.py (stub) and osm_cache/ under root, laid out as
+    load_osm_layers finds them for that PBF + boundary. returns (boundary, pbf, streetview, osm_cache) paths
+    """
+    from osm_layers import LAYERS, cache_key
+    from storage import write_table
+
+    boundary_path = os.path.join(root, "boundary.geojson")
+    boundary(scale, seed).to_file(boundary_path, driver="GeoJSON")
+    pbf_path = os.path.join(root, "city.osm.pbf")
+    with open(pbf_path, "wb") as f:
+        f.write(b"placeholder, the layers are cached")
+    layers = osm_layers(boundary_27700(scale, seed), seed)
+    world_path = PanoWorld(layers["roads_all"], seed=seed).save(os.path.join(root, "pano_world.npz"))
+    streetview_path = os.path.join(root, "streetview.py")
+    with open(streetview_path, "w") as f:
+        f.write(STREETVIEW_STUB.format(path=world_path))
+
+    # keyed on the polygon as read back from the GeoJSON, like the osm stage reads it
+    polygon = gpd.read_file(boundary_path).to_crs(4326).geometry.iloc[0]
+    osm_cache = os.path.join(root, "osm_cache")
+    layer_dir = os.path.join(osm_cache, cache_key(pbf_path, polygon, list(LAYERS)))
+    os.makedirs(layer_dir)
+    manifest = {"pbf": pbf_path, "layers": {}}
+    for name, gdf in layers.items():
+        write_table(gdf, os.path.join(layer_dir, f"{name}.parquet"), categorical=[])
+        manifest["layers"][name] = f"{name}.parquet"
+    with open(os.path.join(layer_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    return boundary_path, pbf_path, streetview_path, osm_cache
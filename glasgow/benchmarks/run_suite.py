@@ -0,0 +1,128 @@
+'''
+reproducible end-to-end benchmark: every pipeline stage (the stage functions of pipeline_stages.py: grid, fetch
+with a stub streetview module, filter, osm, merge, analysis) run on the synthetic cities of fixtures.py, offline,
+in a temporary results directory.
+stage records (profiling.py, with commit / scale / host on every line) are appended to RESULTS, so runs of
+different commits can be compared: --compare prints the median wall time per stage and scale of the last
+commits in the file and the ratio to the oldest of them.
+usage: python glasgow/benchmarks/run_suite.py [small medium large] [--repeat N] [--out RESULTS]
+       python glasgow/benchmarks/run_suite.py --compare [--commits N]
+'''
+# %%
+import argparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+sys.path.insert(0, HERE)
+import fixtures  # noqa: E402
+import profiling  # noqa: E402
+from profiling import read_profile, stage  # noqa: E402
+
+RESULTS = os.path.join(HERE, "results", "suite.jsonl")
+STAGES = ["grid", "fetch", "filter", "osm", "merge", "analysis"]
+SEED = 0
+FETCH_WORKERS = 8
+SAVE_EVERY = 50
+JOIN_TILE_M = 2000
+# counter of each stage's return value recorded as its rows_out
+ROWS_OUT = {"grid": "rows", "fetch": "rows", "filter": "unique_panoids", "osm": "tagged", "analysis": "rows"}
+
+
+def git_commit():
+    """(short commit, dirty) of the working tree, (None, None) outside a git checkout"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def run_scale(scale, work_dir, seed=SEED):
+    """
+    the pipeline_stages stage functions, in order, on one synthetic city (fixtures.write_city_inputs): each
+    stage writes into its own directory and reads its deps' as under the stage cache, without the cache
+    """
+    from pipeline_stages import build_stages
+
+    # fixtures are built outside the timed stages
+    input_dir = os.path.join(work_dir, "inputs")
+    os.makedirs(input_dir)
+    stages = build_stages(*fixtures.write_city_inputs(input_dir, scale, seed), save_every=SAVE_EVERY,
+                          join_tile_m=JOIN_TILE_M, fetch_workers=FETCH_WORKERS, rate=None, verbose=False)
+    assert [st.name for st in stages] == STAGES
+
+    out_dirs, info = {}, {}
+    for st in stages:
+        out_dirs[st.name] = os.path.join(work_dir, st.name)
+        os.makedirs(out_dirs[st.name])
+        inputs = {**{d: out_dirs[d] for d in st.deps}, **st.files}
+        with stage(st.name) as rec:
+            info[st.name] = st.fn(inputs, {**st.params, **st.options}, out_dirs[st.name]) or {}
+            rec.rows_out = info[st.name].get(ROWS_OUT.get(st.name))
+
+    return {"cells": info["grid"]["rows"], "panoramas": info["filter"]["unique_panoids"],
+            "rows": info["fetch"]["rows"]}
+
+
+def run(scales, repeat, out):
+    commit, dirty = git_commit()
+    for i in range(repeat):
+        for scale in scales:
+            profiling.configure(out, commit=commit, dirty=dirty, host=platform.node(),
+                                python=platform.python_version(), scale=scale, repeat=i)
+            work_dir = tempfile.mkdtemp(prefix=f"svi_suite_{scale}_")
+            t0 = time.perf_counter()
+            try:
+                with stage(scale) as st:
+                    sizes = run_scale(scale, work_dir)
+                    st.set(**sizes)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                profiling.configure(None)
+            print(f"{scale} [{i + 1}/{repeat}]: {sizes['cells']} cells, {sizes['rows']} raw rows, "
+                  f"{sizes['panoramas']} panoramas in {time.perf_counter() - t0:.1f}s")
+    print(f"stage records appended to {out} (commit {commit}{' dirty' if dirty else ''})")
+
+
+def compare(path, n_commits=2):
+    """median wall time (s) per scale and stage of the last n_commits in path, and the ratio to the first"""
+    runs = read_profile(path)
+    runs = runs[runs["depth"] == 1].copy()
+    runs["commit"] = runs["commit"].fillna("?") + runs["dirty"].map({True: "+", False: ""}).fillna("")
+    order = runs.groupby("commit")["start"].min().sort_values().index[-n_commits:]
+    runs = runs[runs["commit"].isin(order)]
+    table = (runs.groupby(["scale", "name", "commit"])["wall_s"].median()
+             .unstack("commit")[list(order)])
+    table = table.reindex([(s, n) for s in table.index.levels[0] for n in STAGES if (s, n) in table.index])
+    for c in order[1:]:
+        table[f"{c}/{order[0]}"] = table[c] / table[order[0]]
+    print(table.round(3).to_string())
+    return table
+
+
+# %%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scales", nargs="*", help=f"any of {list(fixtures.SCALES)} (default: small medium)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=RESULTS)
+    parser.add_argument("--compare", action="store_true", help="summarise the stored runs instead of running")
+    parser.add_argument("--commits", type=int, default=2)
+    args = parser.parse_args()
+    unknown = set(args.scales) - set(fixtures.SCALES)
+    if unknown:
+        parser.error(f"unknown scales {sorted(unknown)}")
+    if args.compare:
+        compare(args.out, args.commits)
+    else:
+        run(args.scales or ["small", "medium"], args.repeat, args.out)
@@ -0,0 +1,214 @@
+'''
+persistent cell index of a grid: points and geometries -> grid_id with arithmetic only, no spatial join.
+both grids are regular lattices: generate_grids.py steps in degrees (centres at lat0 + i * lat_step,
+lon0 + j * lon_step, EPSG:4326) and generate_grids_27700.py in metres (grid_utils.lattice_spec). the index keeps
+the lattice origin / steps and a raster holding the grid_id of every lattice node (-1 where the boundary left no
+cell), so a point's cell is floor((x - x0) / step) on both axes plus one array lookup.
+a cell is the lattice rectangle around its centre: on the degree lattice that is the nearest centre, the rule
+filter_svi_metadata.py applies through min distance_m (query_planner.assign_nearest_grid for planned crawls);
+points whose lattice node has no cell (just outside the boundary) can be snapped to the nearest cell instead.
+geometries map to row ranges of their bounding box (geometry_ranges), or to the cells they intersect
+(geometry_cells). saved as a directory (index.json + grid_ids.npy, memory-mapped on load)
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+INDEX_VERSION = 1
+
+
+def _fit_axis(values):
+    """(origin, step) of regularly spaced coordinates: step from the median gap, refined over the whole span"""
+    distinct = np.unique(np.asarray(values, dtype=float))
+    if len(distinct) < 2:
+        return float(distinct[0]), 1.0
+    step = np.median(np.diff(distinct))
+    n = np.rint((distinct[-1] - distinct[0]) / step)
+    return float(distinct[0]), float((distinct[-1] - distinct[0]) / n)
+
+
+class CellIndex:
+    """
+    grid_ids[row, col] = grid_id of the lattice cell whose lower-left corner is (x0 + col * dx, y0 + row * dy)
+    in crs (4326: x = lon, y = lat), -1 for no cell
+    """
+
+    def __init__(self, grid_ids, x0, y0, dx, dy, crs):
+        self.grid_ids = grid_ids
+        self.x0, self.y0, self.dx, self.dy = float(x0), float(y0), float(dx), float(dy)
+        self.crs = int(crs)
+        self._tree = None
+        self._to_index_crs = None
+
+    @property
+    def shape(self):
+        return self.grid_ids.shape
+
+    @classmethod
+    def from_grid(cls, df_grid, spec=None):
+        """
+        index of a grid table: the 27700 lattice of spec (grid_id = row * n_cols + col), or the degree lattice
+        recovered from query_lat / query_lon (generate_grids.py)
+        """
+        if spec is not None:
+            from grid_utils import grid_id_to_rowcol
+
+            grid_ids = np.full((spec["n_rows"], spec["n_cols"]), -1, dtype=np.int64)
+            row, col = grid_id_to_rowcol(df_grid["grid_id"].to_numpy(), spec)
+            grid_ids[row, col] = df_grid["grid_id"].to_numpy()
+            return cls(grid_ids, spec["x0"], spec["y0"], spec["spacing"], spec["spacing"], spec["crs"])
+
+        lat0, dy = _fit_axis(df_grid["query_lat"])
+        lon0, dx = _fit_axis(df_grid["query_lon"])
+        row = np.rint((df_grid["query_lat"].to_numpy(float) - lat0) / dy).astype(np.int64)
+        col = np.rint((df_grid["query_lon"].to_numpy(float) - lon0) / dx).astype(np.int64)
+        off_lattice = max(np.abs((df_grid["query_lat"].to_numpy(float) - lat0) / dy - row).max(initial=0),
+                          np.abs((df_grid["query_lon"].to_numpy(float) - lon0) / dx - col).max(initial=0))
+        grid_ids = np.full((row.max(initial=-1) + 1, col.max(initial=-1) + 1), -1, dtype=np.int64)
+        if off_lattice > 0.01 or len(np.unique(row * grid_ids.shape[1] + col)) < len(row):
+            raise ValueError("grid centres are not distinct nodes of a regular lat / lon lattice")
+        grid_ids[row, col] = df_grid["grid_id"].to_numpy()
+        # corner of node (0, 0): centres sit in the middle of their cells
+        return cls(grid_ids, lon0 - dx / 2, lat0 - dy / 2, dx, dy, 4326)
+
+    # ---------------------------------------------------------------- persistence
+    def save(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        dtype = np.int32 if self.grid_ids.max(initial=-1) < np.iinfo(np.int32).max else np.int64
+        np.save(os.path.join(out_dir, "grid_ids.npy"), self.grid_ids.astype(dtype, copy=False))
+        with open(os.path.join(out_dir, "index.json"), "w") as f:
+            json.dump({"version": INDEX_VERSION, "crs": self.crs, "x0": self.x0, "y0": self.y0, "dx": self.dx,
+                       "dy": self.dy, "shape": list(self.shape),
+                       "n_cells": int(np.count_nonzero(self.grid_ids >= 0))}, f, indent=2)
+        return out_dir
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "index.json")) as f:
+            meta = json.load(f)
+        grid_ids = np.load(os.path.join(path, "grid_ids.npy"), mmap_mode="r" if mmap else None)
+        return cls(grid_ids, meta["x0"], meta["y0"], meta["dx"], meta["dy"], meta["crs"])
+
+    # ---------------------------------------------------------------- points
+    def rowcol(self, x, y):
+        """lattice (row, col) of points in the index crs (may fall outside the raster)"""
+        col = np.floor((np.asarray(x, dtype=float) - self.x0) / self.dx).astype(np.int64)
+        row = np.floor((np.asarray(y, dtype=float) - self.y0) / self.dy).astype(np.int64)
+        return row, col
+
+    def centres(self, row, col):
+        """cell centres (x, y) in the index crs"""
+        return self.x0 + (np.asarray(col) + 0.5) * self.dx, self.y0 + (np.asarray(row) + 0.5) * self.dy
+
+    def _lookup(self, row, col):
+        n_rows, n_cols = self.shape
+        inside = (row >= 0) & (row < n_rows) & (col >= 0) & (col < n_cols)
+        out = np.full(row.shape, -1, dtype=np.int64)
+        out[inside] = self.grid_ids[row[inside], col[inside]]
+        return out
+
+    def _nearest(self, row_f, col_f, max_cells):
+        """grid_id of the nearest cell (distance in cell units, -1 beyond max_cells)"""
+        from scipy.spatial import cKDTree
+
+        if self._tree is None:
+            r, c = np.nonzero(np.asarray(self.grid_ids) >= 0)
+            self._tree = (cKDTree(np.c_[r + 0.5, c + 0.5]), np.asarray(self.grid_ids)[r, c])
+        tree, ids = self._tree
+        d, i = tree.query(np.c_[row_f, col_f], distance_upper_bound=max_cells)
+        return np.where(np.isfinite(d), ids[np.minimum(i, len(ids) - 1)], -1)
+
+    def points_to_grid_id(self, x, y, snap_cells=0):
+        """
+        grid_id of the cell holding each point (x, y in the index crs), -1 for none. snap_cells > 0: points
+        whose node has no cell take the nearest cell within that many cell widths
+        """
+        row, col = self.rowcol(x, y)
+        out = self._lookup(row, col)
+        if snap_cells > 0 and np.any(out < 0):
+            miss = np.flatnonzero(out < 0)
+            row_f = (np.asarray(y, dtype=float)[miss] - self.y0) / self.dy
+            col_f = (np.asarray(x, dtype=float)[miss] - self.x0) / self.dx
+            out[miss] = self._nearest(row_f, col_f, snap_cells)
+        return out
+
+    def to_index_crs(self, lon, lat):
+        """WGS84 lon / lat -> coordinates of the index crs"""
+        if self.crs == 4326:
+            return np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+        if self._to_index_crs is None:
+            from pyproj import Transformer
+
+            self._to_index_crs = Transformer.from_crs(4326, self.crs, always_xy=True)
+        return self._to_index_crs.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+
+    def latlon_to_grid_id(self, lat, lon, snap_cells=0):
+        """points_to_grid_id for WGS84 points (panorama lat / lon)"""
+        return self.points_to_grid_id(*self.to_index_crs(lon, lat), snap_cells=snap_cells)
+
+    # ---------------------------------------------------------------- geometries
+    def _bbox_rowcol(self, geoms):
+        bounds = shapely.bounds(np.asarray(geoms))
+        empty = np.isnan(bounds).any(axis=1)
+        bounds[empty] = 0
+        r0, c0 = self.rowcol(bounds[:, 0], bounds[:, 1])
+        r1, c1 = self.rowcol(bounds[:, 2], bounds[:, 3])
+        r1[empty] = r0[empty] - 1  # no rows
+        n_rows, n_cols = self.shape
+        return np.clip(r0, 0, n_rows), np.clip(r1 + 1, 0, n_rows), np.clip(c0, 0, n_cols), np.clip(c1 + 1, 0, n_cols)
+
+    def geometry_ranges(self, geoms):
+        """
+        lattice rows each geometry's bounding box covers, as DataFrame[geom, row, col_start, col_stop]
+        (geom = position in geoms, columns col_start <= col < col_stop); rows outside the raster are dropped
+        """
+        r0, r1, c0, c1 = self._bbox_rowcol(geoms)
+        n = np.maximum(r1 - r0, 0) * (c1 > c0)
+        geom = np.repeat(np.arange(len(n)), n)
+        row = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(r0, n)
+        return pd.DataFrame({"geom": geom, "row": row, "col_start": c0[geom], "col_stop": c1[geom]})
+
+    def geometry_cells(self, geoms, exact=True, batch_cells=2_000_000):
+        """
+        DataFrame[geom, grid_id] of the cells each geometry touches (geometries in the index crs): every cell
+        of the bounding-box ranges, or with exact=True those whose rectangle intersects the geometry.
+        candidates are tested batch_cells at a time
+        """
+        geoms = np.asarray(geoms)
+        ranges = self.geometry_ranges(geoms)
+        width = (ranges["col_stop"] - ranges["col_start"]).to_numpy()
+        parts = []
+        # batches of whole row ranges, about batch_cells candidate cells each
+        cuts = np.searchsorted(np.cumsum(width), np.arange(batch_cells, width.sum(), batch_cells), side="right")
+        edges = np.unique(np.r_[0, cuts, len(ranges)])
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            part = ranges.iloc[lo:hi]
+            w = width[lo:hi]
+            geom = np.repeat(part["geom"].to_numpy(), w)
+            row = np.repeat(part["row"].to_numpy(), w)
+            col = np.arange(w.sum()) - np.repeat(np.cumsum(w) - w, w) + np.repeat(part["col_start"].to_numpy(), w)
+            gid = np.asarray(self.grid_ids)[row, col]
+            keep = gid >= 0
+            geom, row, col, gid = geom[keep], row[keep], col[keep], gid[keep]
+            if exact and len(gid):
+                x, y = self.x0 + col * self.dx, self.y0 + row * self.dy
+                hit = shapely.intersects(geoms[geom], shapely.box(x, y, x + self.dx, y + self.dy))
+                geom, gid = geom[hit], gid[hit]
+            parts.append(pd.DataFrame({"geom": geom, "grid_id": gid}))
+        if not parts:
+            return pd.DataFrame({"geom": np.empty(0, np.int64), "grid_id": np.empty(0, np.int64)})
+        return pd.concat(parts, ignore_index=True)
+
+
+def build_cell_index(grid_path, out_dir=None):
+    """CellIndex of a grid table (generate_grids.py) or tile directory (generate_grids_27700.py), saved to out_dir"""
+    from grid_utils import load_grid, read_lattice_spec
+
+    spec = read_lattice_spec(grid_path) if os.path.isdir(grid_path) else None
+    index = CellIndex.from_grid(load_grid(grid_path, columns=["grid_id", "query_lat", "query_lon"]), spec)
+    if out_dir is not None:
+        index.save(out_dir)
+    return index
@@ -0,0 +1,76 @@
+'''
+crash-safe checkpoint store for the metadata crawl, keyed on grid_id.
+every queried grid point is recorded as done (returned panoramas), empty (returned nothing) or failed,
+in a small SQLite file next to the output csv. rows are committed only after the matching csv batch is
+flushed and fsync'ed, so a crash loses at most the batch in flight (re-queried on the next run);
+failed points are retried on the next run
+'''
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+DONE, EMPTY, FAILED = "done", "empty", "failed"
+
+
+class CrawlCheckpoint:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS grid_status (
+                   grid_id    INTEGER PRIMARY KEY,
+                   status     TEXT NOT NULL,
+                   n_panos    INTEGER NOT NULL DEFAULT 0,
+                   attempts   INTEGER NOT NULL DEFAULT 1,
+                   checked_at REAL NOT NULL,
+                   error      TEXT
+               )"""
+        )
+        self.conn.commit()
+
+    def mark(self, records):
+        """record [(grid_id, status, n_panos, error), ...] in one transaction"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO grid_status (grid_id, status, n_panos, attempts, checked_at, error)
+                   VALUES (?, ?, ?, 1, ?, ?)
+                   ON CONFLICT(grid_id) DO UPDATE SET
+                       status = excluded.status, n_panos = excluded.n_panos,
+                       attempts = grid_status.attempts + 1,
+                       checked_at = excluded.checked_at, error = excluded.error""",
+                [(int(gid), status, int(n), now, err) for gid, status, n, err in records],
+            )
+
+    def finished_ids(self):
+        """grid_ids that need no further query (done or empty)"""
+        cur = self.conn.execute("SELECT grid_id FROM grid_status WHERE status IN (?, ?)", (DONE, EMPTY))
+        return {gid for (gid,) in cur}
+
+    def status_table(self):
+        return pd.read_sql_query("SELECT * FROM grid_status", self.conn)
+
+    def counts(self):
+        cur = self.conn.execute("SELECT status, COUNT(*) FROM grid_status GROUP BY status")
+        return dict(cur.fetchall())
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM grid_status LIMIT 1").fetchone() is None
+
+    def seed_from_csv(self, out_csv, chunksize=1_000_000):
+        """mark grid_ids already present in an existing output csv (crawl started before the checkpoint) as done"""
+        if not os.path.exists(out_csv):
+            return 0
+        counts = {}
+        for chunk in pd.read_csv(out_csv, usecols=["grid_id"], chunksize=chunksize):
+            for gid, n in chunk["grid_id"].value_counts().items():
+                counts[gid] = counts.get(gid, 0) + n
+        self.mark([(gid, DONE, n, None) for gid, n in counts.items()])
+        return len(counts)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,59 @@
+'''
+coverage disparity across road_type, grid_highway and tag keys (fairness_metrics.py), on the grid_summary
+written by analysis.py and the grid table of merged_svi_osm, with stratified bootstrap CIs.
+writes fairness_groups (one row per grouping x group x statistic) and fairness_disparity (one row per
+grouping x statistic: highest / lowest group, range and max / min ratio). also `svi-fairness fairness`
+'''
+# %%
+import os
+import time
+
+from profiling import stage
+from storage import RESULTS_DIR, STORAGE_FORMAT
+
+N_BOOT = 10000
+CI = 0.95
+SEED = 0
+WORKERS = 8
+REFERENCE = "(all)"    # group the others are compared with, the pooled cells by default
+
+
+def fairness_analysis(results_dir=RESULTS_DIR, n_boot=N_BOOT, ci=CI, seed=SEED, workers=WORKERS,
+                      reference=REFERENCE):
+    """disparity report on the outputs in results_dir, written back next to them; returns (groups, disparity)"""
+    from fairness_metrics import cell_table, disparity_report, tag_key_groups
+    from osm_tags import SEMANTIC_KEYS, load_tag_matrix
+    from pipeline_stages import MERGED, SUMMARY, TAG_MATRIX
+    from storage import read_table, write_table
+    from svi_dataset import SVIDataset
+
+    tag_keys = [k for k in SEMANTIC_KEYS if k != "highway"]  # highway is covered by grid_highway
+    grid_summary = read_table(os.path.join(results_dir, SUMMARY)).set_index("grid_id")
+    grid = SVIDataset(os.path.join(results_dir, MERGED)).grid(["grid_id", "road_type", "grid_highway"])
+    tag_groups = tag_key_groups(load_tag_matrix(os.path.join(results_dir, TAG_MATRIX)), tag_keys)
+    cells = cell_table(grid_summary, grid, tag_groups)
+    group_cols = ["road_type", "grid_highway"] + [f"has_{k}" for k in tag_keys]
+    print(f"{len(cells)} cells, groupings: {group_cols}")
+
+    t0 = time.perf_counter()
+    with stage("disparity_report", rows_in=len(cells), n_boot=n_boot, groupings=len(group_cols)) as st:
+        groups, disparity = disparity_report(cells, group_cols, reference=reference, n_boot=n_boot, ci=ci, seed=seed,
+                                             workers=workers)
+        st.rows_out = len(groups)
+    print(f"✅ {n_boot} bootstrap replicates in {time.perf_counter() - t0:.1f}s")
+    print(disparity[disparity["statistic"] == "coverage_rate"].to_string(index=False))
+
+    # group labels mix road types / highway values with the True / False of the has_<key> groupings
+    groups = groups.astype({"group": str, "reference": str})
+    disparity = disparity.astype({"max_group": str, "min_group": str})
+    write_table(groups, os.path.join(results_dir, f"fairness_groups.{STORAGE_FORMAT}"), categorical=[])
+    write_table(disparity, os.path.join(results_dir, f"fairness_disparity.{STORAGE_FORMAT}"), categorical=[])
+    return groups, disparity
+
+
+# %%
+if __name__ == "__main__":
+    # disparity_report starts a process pool: under spawn / forkserver every worker imports this module, so the
+    # workload must not run at import
+    fairness_analysis()
+# %%
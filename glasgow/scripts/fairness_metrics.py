@@ -0,0 +1,260 @@
+'''
+coverage disparity across groups of grid cells (road_type, grid_highway, tag keys) from the grid_summary of
+analysis.py, with stratified bootstrap confidence intervals.
+every cell field is a small non-negative integer (n_panos, recency_months, max_gap_months), so each group is
+reduced to one histogram per field and every statistic (coverage rate, means, quantiles) is read off the
+histograms. a bootstrap batch draws an index matrix (replicates x group size) per group and bincounts the
+resampled values into per-replicate histograms: no python loop per replicate. replicates are cut into chunks
+with their own SeedSequence child, so the intervals only depend on the seed, not on the number of workers
+'''
+import warnings
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ["n_panos", "recency_months", "max_gap_months"]
+# (name, field, kind, q): kind is "coverage" (share of cells with n_panos > 0), "mean" or "quantile"
+STATISTICS = [
+    ("coverage_rate", "n_panos", "coverage", None),
+    ("mean_n_panos", "n_panos", "mean", None),
+    ("mean_recency_months", "recency_months", "mean", None),
+    ("median_recency_months", "recency_months", "quantile", 0.5),
+    ("p90_recency_months", "recency_months", "quantile", 0.9),
+    ("mean_max_gap_months", "max_gap_months", "mean", None),
+    ("median_max_gap_months", "max_gap_months", "quantile", 0.5),
+]
+ALL_LABEL = "(all)"
+MISSING_LABEL = "none"
+
+
+# ============================================================
+# cell table
+# ============================================================
+def tag_key_groups(tm, keys=None):
+    """has_<key> (bool) per cell of a TagMatrix (osm_tags.py): does any OSM feature in the cell carry the key"""
+    from osm_tags import key_matrix
+
+    categories = list(tm.vocab["tag_key"].cat.categories)
+    keys = categories if keys is None else list(keys)
+    km = key_matrix(tm).tocsc()
+    out = {"grid_id": tm.grid_ids}
+    for key in keys:
+        j = categories.index(key)
+        out[f"has_{key}"] = np.diff(km[:, j].tocsr().indptr) > 0
+    return pd.DataFrame(out)
+
+
+def cell_table(grid_summary, grid, tag_groups=None):
+    """
+    one row per grid cell: the FIELDS of grid_summary (indexed by grid_id) and the group columns of grid
+    (e.g. SVIDataset.grid(["grid_id", "road_type", "grid_highway"])) and of tag_groups, joined on grid_id.
+    missing group labels (cells without a highway) become MISSING_LABEL
+    """
+    cells = grid.merge(grid_summary[FIELDS].reset_index(), on="grid_id", how="left")
+    if tag_groups is not None:
+        cells = cells.merge(tag_groups, on="grid_id", how="left")
+        for c in tag_groups.columns:
+            if c != "grid_id":
+                cells[c] = cells[c].fillna(False).astype(bool)
+    cells["n_panos"] = cells["n_panos"].fillna(0)
+    for c in cells.columns:
+        if isinstance(cells[c].dtype, pd.CategoricalDtype):
+            if MISSING_LABEL not in cells[c].cat.categories:
+                cells[c] = cells[c].cat.add_categories(MISSING_LABEL)
+            cells[c] = cells[c].fillna(MISSING_LABEL)
+        elif cells[c].dtype == object:
+            cells[c] = cells[c].fillna(MISSING_LABEL)
+    return cells
+
+
+# ============================================================
+# histogram kernel
+# ============================================================
+def _strata(cells, group_col):
+    """
+    cells sorted by group: per field the values + 1 (0 = missing) in the smallest unsigned dtype that holds them
+    (the random gathers stay in cache), group bounds and labels
+    """
+    codes, labels = pd.factorize(cells[group_col], sort=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+    values, n_bins = [], []
+    for field in FIELDS:
+        v = cells[field].to_numpy(dtype=float)[order]
+        if np.any(v[~np.isnan(v)] < 0) or np.any(v[~np.isnan(v)] % 1):
+            raise ValueError(f"{field} must hold non-negative whole numbers")
+        v = np.where(np.isnan(v), 0, v + 1).astype(np.int64)
+        n_bins.append(int(v.max(initial=0)) + 1)
+        values.append(v.astype(np.min_scalar_type(n_bins[-1] - 1)))
+    return {"values": values, "n_bins": n_bins, "bounds": bounds, "labels": list(labels)}
+
+
+def _full_hists(state):
+    """histograms of the observed cells, shaped (1, n_groups, n_bins) per field"""
+    bounds = state["bounds"]
+    return [
+        np.stack([np.bincount(v[lo:hi], minlength=k) for lo, hi in zip(bounds[:-1], bounds[1:])])[None]
+        for v, k in zip(state["values"], state["n_bins"])
+    ]
+
+
+def _boot_hists(state, seed, n_rep, batch_elems=8_000_000):
+    """
+    histograms of n_rep stratified bootstrap replicates, shaped (n_rep, n_groups, n_bins) per field.
+    each group is resampled with replacement to its own size, batch_elems bounds the index matrix
+    """
+    rng = np.random.default_rng(seed)
+    bounds = state["bounds"]
+    hists = [np.zeros((n_rep, len(bounds) - 1, k), dtype=np.int64) for k in state["n_bins"]]
+    for g, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        n = hi - lo
+        step = max(1, batch_elems // n)
+        for r0 in range(0, n_rep, step):
+            b = min(step, n_rep - r0)
+            idx = rng.integers(0, n, size=(b, n), dtype=np.int32)
+            for h, v, k in zip(hists, state["values"], state["n_bins"]):
+                # offset each replicate's bins so one bincount fills the whole batch
+                flat = (v[lo:hi][idx] + np.arange(b, dtype=np.int64)[:, None] * k).ravel()
+                h[r0:r0 + b, g] = np.bincount(flat, minlength=b * k).reshape(b, k)
+    return hists
+
+
+def _hist_quantile(h, q):
+    """smallest value whose cumulative share reaches q (numpy's "inverted_cdf"), NaN for empty histograms"""
+    c = h.sum(-1)
+    k = (np.cumsum(h, -1) < q * c[..., None]).sum(-1)
+    return np.where(c > 0, k, np.nan)
+
+
+def _hist_stats(hists):
+    """
+    STATISTICS from per-field histograms (bin 0 = missing, bin i = value i - 1), shaped (..., n_groups, n_bins).
+    a pooled ALL_LABEL group is appended; returns (..., n_groups + 1, len(STATISTICS))
+    """
+    hists = {f: np.concatenate([h, h.sum(-2, keepdims=True)], axis=-2)[..., 1:] for f, h in zip(FIELDS, hists)}
+    out = []
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _, field, kind, q in STATISTICS:
+            h = hists[field]
+            c = h.sum(-1)
+            if kind == "coverage":
+                out.append(1 - h[..., 0] / c)
+            elif kind == "mean":
+                out.append(h @ np.arange(h.shape[-1]) / c)
+            else:
+                out.append(_hist_quantile(h, q))
+    return np.stack(out, axis=-1)
+
+
+# ============================================================
+# bootstrap driver
+# ============================================================
+_WORKER = {}
+
+
+def _init_worker(states, batch_elems):
+    _WORKER.update(states=states, batch_elems=batch_elems)
+
+
+def _replicate_chunk(group_col, seed, n_rep):
+    return _hist_stats(_boot_hists(_WORKER["states"][group_col], seed, n_rep, _WORKER["batch_elems"]))
+
+
+def _chunk_seeds(seed, group_col, n_boot, chunk_reps):
+    """SeedSequence children per chunk, keyed on the grouping so results do not depend on which others run"""
+    root = np.random.SeedSequence([seed, zlib.crc32(group_col.encode())])
+    sizes = [min(chunk_reps, n_boot - r0) for r0 in range(0, n_boot, chunk_reps)]
+    return list(zip(root.spawn(len(sizes)), sizes))
+
+
+def bootstrap_stats(cells, group_cols, n_boot=1000, seed=0, workers=1, chunk_reps=250,
+                    batch_elems=8_000_000):
+    """
+    point estimates and stratified bootstrap replicates of STATISTICS per group of each column in group_cols.
+    returns {group_col: (labels + [ALL_LABEL], n_cells per group, estimates (n_groups + 1, n_stats),
+    replicates (n_boot, n_groups + 1, n_stats))}. workers > 1 spreads the replicate chunks over processes
+    """
+    states = {c: _strata(cells, c) for c in group_cols}
+    tasks = [(c, s, n) for c in group_cols for s, n in _chunk_seeds(seed, c, n_boot, chunk_reps)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker,
+                                 initargs=(states, batch_elems)) as pool:
+            reps = list(pool.map(_replicate_chunk, *zip(*tasks)))
+    else:
+        _init_worker(states, batch_elems)
+        reps = [_replicate_chunk(*t) for t in tasks]
+        _WORKER.clear()
+
+    out = {}
+    for c, state in states.items():
+        mine = [r for t, r in zip(tasks, reps) if t[0] == c]
+        n_cells = np.append(np.diff(state["bounds"]), len(cells))
+        replicates = np.concatenate(mine) if mine else np.empty((0, len(n_cells), len(STATISTICS)))
+        out[c] = (state["labels"] + [ALL_LABEL], n_cells, _hist_stats(_full_hists(state))[0], replicates)
+    return out
+
+
+def _interval(x, ci):
+    """percentile interval over the replicate axis"""
+    alpha = (1 - ci) / 2
+    if len(x) == 0:
+        return np.full(x.shape[1:], np.nan), np.full(x.shape[1:], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN slices (empty groups) stay NaN
+        lo, hi = np.nanquantile(x, [alpha, 1 - alpha], axis=0)
+    return lo, hi
+
+
+def disparity_report(cells, group_cols, reference=ALL_LABEL, n_boot=1000, ci=0.95, seed=0, workers=1,
+                     chunk_reps=250, batch_elems=8_000_000):
+    """
+    coverage disparity of every group column with percentile bootstrap CIs.
+    reference is the group the others are compared with (the pooled ALL_LABEL by default; a label missing
+    from a column falls back to ALL_LABEL). returns
+    - groups: one row per (grouping, group, statistic): estimate, diff / ratio against the reference, CIs
+    - summary: one row per (grouping, statistic): groups with the highest / lowest estimate, range
+      (max - min over groups) and max / min ratio, CIs
+    """
+    names = [s[0] for s in STATISTICS]
+    group_rows, summary_rows = [], []
+    for c, (labels, n_cells, est, reps) in bootstrap_stats(
+            cells, group_cols, n_boot=n_boot, seed=seed, workers=workers, chunk_reps=chunk_reps,
+            batch_elems=batch_elems).items():
+        ref = labels.index(reference) if reference in labels else len(labels) - 1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            diff, ratio = est - est[ref], est / est[ref]
+            rep_diff, rep_ratio = reps - reps[:, ref:ref + 1], reps / reps[:, ref:ref + 1]
+        bounds = [_interval(x, ci) for x in (reps, rep_diff, rep_ratio)]
+        for g, label in enumerate(labels):
+            for s, name in enumerate(names):
+                group_rows.append({
+                    "grouping": c, "group": label, "n_cells": int(n_cells[g]), "statistic": name,
+                    "reference": labels[ref], "estimate": est[g, s],
+                    "ci_low": bounds[0][0][g, s], "ci_high": bounds[0][1][g, s],
+                    "diff": diff[g, s], "diff_ci_low": bounds[1][0][g, s], "diff_ci_high": bounds[1][1][g, s],
+                    "ratio": ratio[g, s], "ratio_ci_low": bounds[2][0][g, s], "ratio_ci_high": bounds[2][1][g, s],
+                })
+
+        # spread between groups, ALL_LABEL excluded
+        groups_est, groups_reps = est[:-1], reps[:, :-1]
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            top, bottom = np.nanmax(groups_reps, axis=1), np.nanmin(groups_reps, axis=1)
+        rng_lo, rng_hi = _interval(top - bottom, ci)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mm_lo, mm_hi = _interval(top / bottom, ci)
+        for s, name in enumerate(names):
+            col = groups_est[:, s]
+            if np.all(np.isnan(col)):
+                continue
+            hi, lo = np.nanargmax(col), np.nanargmin(col)
+            summary_rows.append({
+                "grouping": c, "statistic": name, "n_groups": len(labels) - 1,
+                "max_group": labels[hi], "max_estimate": col[hi], "min_group": labels[lo], "min_estimate": col[lo],
+                "range": col[hi] - col[lo], "range_ci_low": rng_lo[s], "range_ci_high": rng_hi[s],
+                "max_min_ratio": col[hi] / col[lo] if col[lo] else np.nan,
+                "ratio_ci_low": mm_lo[s], "ratio_ci_high": mm_hi[s],
+            })
+    return pd.DataFrame(group_rows), pd.DataFrame(summary_rows)
@@ -0,0 +1,10 @@
+'''content hashes of input files, shared by the OSM layer cache (osm_layers.py) and the stage cache (stage_cache.py)'''
+import hashlib
+
+
+def file_sha256(path, chunk_size=8 * 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
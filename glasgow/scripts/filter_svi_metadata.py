@@ -2,50 +2,42 @@
 filter glasgow_streetview_metadata_grid_20m.csv to ensure each panoid only appears once,
 keeping the entry with the smallest distance_m (i.e., snapped to its nearest grid point)
 and removing entries with NaN year or month
-save to glasgow_streetview_metadata_grid_20m_cleaned.csv
+save to glasgow_streetview_metadata_grid_20m_cleaned.parquet (storage.STORAGE_FORMAT)
+for a planned crawl (USE_QUERY_PLANNER in fetch_svi_metadata_glasgow.py) set PLANNED_CRAWL = True: the query
+centre is not the nearest grid point there, so panoramas are snapped to their nearest grid_id locally
+the raw csv is streamed in CHUNKSIZE-row chunks (metadata_filter.py), so the whole crawl is never in memory
 '''
 
 # %%
-import pandas as pd
+from pipeline_stages import filter_stage, grid_names
+from storage import RESULTS_DIR
 
-meta_data = pd.read_csv(r"/mnt/home/2715439w/sharedscratch/fairness/glasgow/results/glasgow_streetview_metadata_grid_20m.csv") 
+CHUNKSIZE = 1_000_000
+PLANNED_CRAWL = False
+# True: the EPSG:27700 lattice of generate_grids_27700.py (tile directory) with SPACING, instead of glasgow_grid_20m
+LATTICE = False
+SPACING = 20
 
 # %%
-meta_data[:10]
-
-# %%
-# example of a panoid with multiple entries
-meta_data[meta_data['panoid']=='gEwac6dZ153bgC4Z_6YgtA']
-
-# %%
-print('total number of entries:\n')
-print(meta_data.shape[0])
-print('number of non-na entries:\n')
-print(meta_data[meta_data['year'].notna()].shape[0])
-print('\nnumber of unique panoids:\n')
-print(meta_data['panoid'].nunique())
-print('\n')
-print(f"meaning there are {meta_data[meta_data['year'].notna()].shape[0] - meta_data['panoid'].nunique()} panoids are given to several grids.")
-# %%
-import pandas as pd
-
-# 1️⃣ Drop NaN values in year OR month 
-filtered = meta_data.dropna(subset=['year', 'month'])
-
-# 2️⃣ keep unique panoid with min distance_m (snapped to its nearest grid point)
-filtered_unique = filtered.loc[filtered.groupby('panoid')['distance_m'].idxmin()]
-
-# ✅ example of the same panoid after filtering
-filtered_unique[filtered_unique['panoid']=='gEwac6dZ153bgC4Z_6YgtA']
-
-print('total number of entries after filtering:\n')
-print(filtered_unique.shape[0])
-print('number of non-na entries after filtering:\n')
-print(filtered_unique[filtered_unique['year'].notna()].shape[0])
-print('\nnumber of unique panoids after filtering:\n')
-print(filtered_unique['panoid'].nunique())
-print('\n')
-print(f"meaning there are {filtered_unique[filtered_unique['year'].notna()].shape[0] - filtered_unique['panoid'].nunique()} panoids are given to several grids.")
-# %%
-filtered_unique.to_csv(r"/mnt/home/2715439w/sharedscratch/fairness/glasgow/results/glasgow_streetview_metadata_grid_20m_cleaned.csv", index=False)
+if __name__ == "__main__":
+    # 1️⃣ Drop NaN values in year OR month
+    # 2️⃣ keep unique panoid with min distance_m (snapped to its nearest grid point)
+    #    both done chunk by chunk, with a running min-distance row per panoid
+    grid_file, _, raw_file = grid_names(SPACING, LATTICE)
+    stats = filter_stage({"fetch": RESULTS_DIR, "grid": RESULTS_DIR},
+                         {"planned_crawl": PLANNED_CRAWL, "chunksize": CHUNKSIZE, "grid_file": grid_file,
+                          "raw_file": raw_file}, RESULTS_DIR)
+
+    print('total number of entries:\n')
+    print(stats['total_rows'])
+    print('number of non-na entries:\n')
+    print(stats['dated_rows'])
+    print('\nnumber of unique panoids:\n')
+    print(stats['raw_unique_panoids'])
+    print('\n')
+    print(f"meaning there are {stats['dated_rows'] - stats['raw_unique_panoids']} panoids are given to several grids.")
+
+    # after filtering every row is a distinct, dated panoid
+    print('\nnumber of unique panoids after filtering:\n')
+    print(stats['unique_panoids'])
 # %%
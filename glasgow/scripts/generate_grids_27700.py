@@ -0,0 +1,21 @@
+'''
+generate grid cells within Glasgow boundary directly on an EPSG:27700 (British National Grid) lattice.
+unlike generate_grids.py (fixed degree steps from the middle latitude), every cell is exactly SPACING metres
+wide, and grid_id = row * n_cols + col so any 27700 point maps to its cell without a spatial join.
+the grid is written as row-band tiles (tile_XXXXX.parquet) + lattice.json, so later stages can stream one tile at a
+time; the same as `svi-fairness grid --lattice` (pipeline_stages.grid_stage)
+'''
+# %%
+from pipeline_stages import grid_stage
+from storage import RESULTS_DIR
+
+BOUNDARY_PATH = "/mnt/home/2715439w/sharedscratch/fairness/glasgow/boundary/glasgow_boundary.geojson"
+SPACING = 20     # meter, any of 5 / 10 / 20 / 50
+TILE_ROWS = 100  # lattice rows per tile
+
+# %%
+if __name__ == "__main__":
+    # writes glasgow_grid_27700_<SPACING>m (tiles + lattice.json) and its cell index next to it in RESULTS_DIR
+    grid_stage({"boundary": BOUNDARY_PATH},
+               {"spacing_m": SPACING, "lattice": True, "tile_rows": TILE_ROWS, "verbose": True}, RESULTS_DIR)
+# %%
@@ -0,0 +1,218 @@
+'''
+helpers for building grid points inside a boundary polygon
+the lattice is built with numpy and tested against the polygon in bulk (shapely 2 contains_xy),
+one band of rows at a time so memory stays bounded for fine spacings / large areas
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from profiling import stage
+from storage import STORAGE_FORMAT, read_table, write_table
+
+
+def grid_steps(bounds, spacing_m=20):
+    """lat/lon step (degrees) for a given spacing, measured with geodesic at the middle latitude"""
+    from geopy.distance import geodesic
+
+    minx, miny, maxx, maxy = bounds
+    ref_lat = (miny + maxy) / 2
+    # N-S meter
+    north_south_dist = geodesic((maxy, ref_lat), (miny, ref_lat)).meters
+    # E-W meter
+    east_west_dist = geodesic((ref_lat, minx), (ref_lat, maxx)).meters
+
+    lat_step = (maxy - miny) / (north_south_dist / spacing_m)
+    lon_step = (maxx - minx) / (east_west_dist / spacing_m)
+    return lat_step, lon_step
+
+
+def iter_grid_chunks(poly, lat_vals, lon_vals, chunk_rows=200):
+    """
+    yield (start, lat, lon): index of the first lat row of the chunk and the lat / lon arrays of the lattice
+    points inside poly, chunk_rows lat rows at a time.
+    points come out in the same order as the nested lat/lon loop (row by row, west to east)
+    """
+    shapely.prepare(poly)
+    for start in range(0, len(lat_vals), chunk_rows):
+        with stage("grid_chunk", rows_in=len(lon_vals) * len(lat_vals[start:start + chunk_rows])) as st:
+            lon_mesh, lat_mesh = np.meshgrid(lon_vals, lat_vals[start:start + chunk_rows])
+            lon_mesh = lon_mesh.ravel()
+            lat_mesh = lat_mesh.ravel()
+            inside = shapely.contains_xy(poly, lon_mesh, lat_mesh)
+            lat_in, lon_in = lat_mesh[inside], lon_mesh[inside]
+            st.rows_out = len(lat_in)
+        yield start, lat_in, lon_in
+
+
+def generate_grid_points(poly, bounds, lat_step, lon_step, chunk_rows=200, verbose=True):
+    """
+    vectorized replacement of the Point/contains loop in generate_grids.py.
+    returns DataFrame[query_lat, query_lon, grid_id], identical to the loop output
+    """
+    minx, miny, maxx, maxy = bounds
+    lat_vals = np.arange(miny, maxy, lat_step)
+    lon_vals = np.arange(minx, maxx, lon_step)
+
+    lat_parts, lon_parts = [], []
+    n_points = 0
+    for start, lat, lon in iter_grid_chunks(poly, lat_vals, lon_vals, chunk_rows=chunk_rows):
+        lat_parts.append(lat)
+        lon_parts.append(lon)
+        n_points += len(lat)
+        if verbose:
+            print(f"Row {min(start + chunk_rows, len(lat_vals))}/{len(lat_vals)} done, total grids: {n_points}")
+
+    df = pd.DataFrame({
+        "query_lat": np.concatenate(lat_parts) if lat_parts else np.empty(0),
+        "query_lon": np.concatenate(lon_parts) if lon_parts else np.empty(0),
+    })
+    df["grid_id"] = range(len(df))
+    return df
+
+
+# ============================================================
+# projected lattice (EPSG:27700)
+# ============================================================
+# cells are squares of `spacing` metres on the British National Grid, with the origin snapped to a
+# multiple of the spacing so 5/10/20/50m lattices nest. grid_id = row * n_cols + col, so any
+# 27700 point maps to its cell with arithmetic only (see points_to_grid_id).
+LATTICE_CRS = 27700
+
+
+def lattice_spec(bounds_27700, spacing_m=20, tile_rows=None):
+    """lattice parameters covering bounds_27700 = (minx, miny, maxx, maxy) in EPSG:27700"""
+    minx, miny, maxx, maxy = bounds_27700
+    x0 = np.floor(minx / spacing_m) * spacing_m
+    y0 = np.floor(miny / spacing_m) * spacing_m
+    n_cols = int(np.ceil((maxx - x0) / spacing_m))
+    n_rows = int(np.ceil((maxy - y0) / spacing_m))
+    return {
+        "crs": LATTICE_CRS,
+        "spacing": float(spacing_m),
+        "x0": float(x0),
+        "y0": float(y0),
+        "n_rows": n_rows,
+        "n_cols": n_cols,
+        "tile_rows": int(tile_rows) if tile_rows else n_rows,
+    }
+
+
+def grid_id_to_rowcol(grid_id, spec):
+    grid_id = np.asarray(grid_id, dtype=np.int64)
+    return grid_id // spec["n_cols"], grid_id % spec["n_cols"]
+
+
+def rowcol_to_xy(row, col, spec):
+    """cell centres in EPSG:27700"""
+    s = spec["spacing"]
+    return spec["x0"] + (np.asarray(col) + 0.5) * s, spec["y0"] + (np.asarray(row) + 0.5) * s
+
+
+def points_to_grid_id(x, y, spec):
+    """EPSG:27700 coordinates -> grid_id (-1 outside the lattice); no spatial join needed"""
+    s = spec["spacing"]
+    col = np.floor((np.asarray(x, dtype=float) - spec["x0"]) / s).astype(np.int64)
+    row = np.floor((np.asarray(y, dtype=float) - spec["y0"]) / s).astype(np.int64)
+    valid = (row >= 0) & (row < spec["n_rows"]) & (col >= 0) & (col < spec["n_cols"])
+    return np.where(valid, row * spec["n_cols"] + col, -1)
+
+
+def cell_boxes(x, y, spec):
+    """square cell polygons (EPSG:27700) around centres x, y"""
+    half = spec["spacing"] / 2
+    x = np.asarray(x)
+    y = np.asarray(y)
+    return shapely.box(x - half, y - half, x + half, y + half)
+
+
+def lattice_tile(poly_27700, spec, tile, to_wgs84=None):
+    """
+    cells of one band of spec['tile_rows'] rows as a DataFrame.
+    columns: grid_id, row, col, x, y (EPSG:27700) and query_lat, query_lon (WGS84) of the centres.
+    a cell is kept when its centre falls inside poly_27700
+    """
+    if to_wgs84 is None:
+        from pyproj import Transformer
+
+        to_wgs84 = Transformer.from_crs(LATTICE_CRS, 4326, always_xy=True)
+    start = tile * spec["tile_rows"]
+    rows = np.arange(start, min(start + spec["tile_rows"], spec["n_rows"]), dtype=np.int64)
+    col_mesh, row_mesh = np.meshgrid(np.arange(spec["n_cols"], dtype=np.int64), rows)
+    col_mesh = col_mesh.ravel()
+    row_mesh = row_mesh.ravel()
+    x, y = rowcol_to_xy(row_mesh, col_mesh, spec)
+    inside = shapely.contains_xy(poly_27700, x, y)
+    row_mesh, col_mesh, x, y = row_mesh[inside], col_mesh[inside], x[inside], y[inside]
+    lon, lat = to_wgs84.transform(x, y)
+    return pd.DataFrame({
+        "grid_id": row_mesh * spec["n_cols"] + col_mesh,
+        "row": row_mesh.astype(np.int32),
+        "col": col_mesh.astype(np.int32),
+        "x": x,
+        "y": y,
+        "query_lat": lat,
+        "query_lon": lon,
+    })
+
+
+def n_lattice_tiles(spec):
+    return -(-spec["n_rows"] // spec["tile_rows"])
+
+
+def iter_lattice_tiles(poly_27700, spec):
+    """yield (tile_index, DataFrame) for each band of spec['tile_rows'] rows (see lattice_tile)"""
+    from pyproj import Transformer
+
+    to_wgs84 = Transformer.from_crs(LATTICE_CRS, 4326, always_xy=True)
+    shapely.prepare(poly_27700)
+    for tile in range(n_lattice_tiles(spec)):
+        with stage("lattice_tile", rows_in=spec["tile_rows"] * spec["n_cols"], tile=tile) as st:
+            df = lattice_tile(poly_27700, spec, tile, to_wgs84=to_wgs84)
+            st.rows_out = len(df)
+        yield tile, df
+
+
+def tile_filename(tile, fmt=STORAGE_FORMAT):
+    return f"tile_{tile:05d}.{fmt}"
+
+
+def write_lattice_tiles(poly_27700, spec, out_dir, verbose=True):
+    """write the lattice as row-band tiles + lattice.json into out_dir; returns total cell count"""
+    os.makedirs(out_dir, exist_ok=True)
+    tiles = []
+    n_cells = 0
+    for tile, df in iter_lattice_tiles(poly_27700, spec):
+        if df.empty:
+            continue
+        with stage("write_tile", rows_in=len(df), tile=tile):
+            write_table(df, os.path.join(out_dir, tile_filename(tile)))
+        tiles.append({"tile": tile, "file": tile_filename(tile), "n_cells": len(df)})
+        n_cells += len(df)
+        if verbose:
+            print(f"tile {tile} written, {len(df)} cells (total {n_cells})")
+
+    with open(os.path.join(out_dir, "lattice.json"), "w") as f:
+        json.dump({**spec, "tiles": tiles}, f, indent=2)
+    return n_cells
+
+
+def read_lattice_spec(grid_dir):
+    with open(os.path.join(grid_dir, "lattice.json")) as f:
+        return json.load(f)
+
+
+def iter_grid_tiles(grid_dir, columns=None):
+    """stream a tiled grid one tile at a time: yields (tile_index, DataFrame)"""
+    for t in read_lattice_spec(grid_dir)["tiles"]:
+        yield t["tile"], read_table(os.path.join(grid_dir, t["file"]), columns=columns)
+
+
+def load_grid(path, columns=None):
+    """load a grid either from a single table (generate_grids.py) or a tile directory (generate_grids_27700.py)"""
+    if os.path.isdir(path):
+        return pd.concat([df for _, df in iter_grid_tiles(path, columns=columns)], ignore_index=True)
+    return read_table(path, columns=columns)
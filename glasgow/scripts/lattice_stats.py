@@ -0,0 +1,256 @@
+'''
+neighbourhood statistics on the regular grid: local coverage smoothing, global Moran's I and LISA
+(local Moran) of per-cell fields such as n_panos and recency_months.
+every cell gets its (row, col) on the lattice, either from grid_id (EPSG:27700 lattice, grid_utils.lattice_spec)
+or from the query_lat / query_lon steps (generate_grids.py), so fields become 2-D arrays. smoothing is a
+NaN-aware convolution of those arrays, and the spatial weights are sparse matrices built from kernel offsets
+on the raster of cell positions instead of geometry neighbour searches. permutation tests run in batches of
+permutations as numpy index matrices
+'''
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage, sparse
+
+
+class Lattice(NamedTuple):
+    """cell grid_ids[i] sits at (rows[i], cols[i]) of a shape = (n_rows, n_cols) raster"""
+    grid_ids: np.ndarray
+    rows: np.ndarray
+    cols: np.ndarray
+    shape: tuple
+
+
+def _axis_index(values):
+    """positions of regularly spaced coordinates along their axis (step = median gap between distinct values)"""
+    values = np.asarray(values, dtype=float)
+    distinct = np.unique(values)
+    if len(distinct) < 2:
+        return np.zeros(len(values), dtype=np.int64)
+    step = np.median(np.diff(distinct))
+    return np.rint((values - distinct[0]) / step).astype(np.int64)
+
+
+def lattice_from_grid(grid, spec=None):
+    """
+    Lattice of a grid table: rows / cols from grid_id with a lattice spec (generate_grids_27700.py,
+    grid_utils.read_lattice_spec), otherwise recovered from the query_lat / query_lon steps (generate_grids.py).
+    the raster is cropped to the cells present
+    """
+    from grid_utils import grid_id_to_rowcol
+
+    grid_ids = grid["grid_id"].to_numpy()
+    if spec is not None:
+        rows, cols = grid_id_to_rowcol(grid_ids, spec)
+    else:
+        rows, cols = _axis_index(grid["query_lat"]), _axis_index(grid["query_lon"])
+    if len(grid_ids):
+        rows, cols = rows - rows.min(), cols - cols.min()
+    shape = (int(rows.max(initial=-1)) + 1, int(cols.max(initial=-1)) + 1)
+    return Lattice(grid_ids, rows.astype(np.int64), cols.astype(np.int64), shape)
+
+
+def align(lat, table, column):
+    """values of table[column] (indexed by grid_id) for the cells of lat, NaN for cells not in table"""
+    return table[column].reindex(lat.grid_ids).to_numpy(dtype=float)
+
+
+def to_raster(lat, values, fill=np.nan):
+    """2-D array of per-cell values; raster positions without a cell hold fill"""
+    out = np.full(lat.shape, fill, dtype=float)
+    out[lat.rows, lat.cols] = values
+    return out
+
+
+def window_kernel(radius=1, kind="queen"):
+    """
+    0/1 kernel of a (2 radius + 1)^2 window: "queen" (square), "rook" (|dr| + |dc| <= radius) or
+    "disk" (dr^2 + dc^2 <= radius^2). the centre is included
+    """
+    dr, dc = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    if kind == "queen":
+        k = np.ones_like(dr, dtype=bool)
+    elif kind == "rook":
+        k = np.abs(dr) + np.abs(dc) <= radius
+    elif kind == "disk":
+        k = dr ** 2 + dc ** 2 <= radius ** 2
+    else:
+        raise ValueError(f"unknown kernel kind {kind!r}")
+    return k.astype(float)
+
+
+def neighbourhood_mean(lat, values, kernel):
+    """
+    kernel-weighted mean of values over each cell's window (normalized convolution: cells outside the grid
+    and NaN values are left out of both sums). returns (mean, weight of the cells used) per cell
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    num = ndimage.correlate(to_raster(lat, np.where(valid, values, 0), fill=0), kernel, mode="constant")
+    den = ndimage.correlate(to_raster(lat, valid.astype(float), fill=0), kernel, mode="constant")
+    num, den = num[lat.rows, lat.cols], den[lat.rows, lat.cols]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan), den
+
+
+def neighbourhood_coverage(lat, grid_summary, radius=2, kind="queen"):
+    """
+    local coverage per cell over its window: local_n_cells (cells of the grid in the window),
+    local_coverage_rate (share with n_panos > 0), local_mean_n_panos and local_mean_recency_months
+    (over the cells with a recency). grid_summary is indexed by grid_id; cells missing from it have no panoramas
+    """
+    kernel = window_kernel(radius, kind)
+    n_panos = np.nan_to_num(align(lat, grid_summary, "n_panos"))
+    coverage, n_cells = neighbourhood_mean(lat, (n_panos > 0).astype(float), kernel)
+    mean_panos, _ = neighbourhood_mean(lat, n_panos, kernel)
+    mean_recency, _ = neighbourhood_mean(lat, align(lat, grid_summary, "recency_months"), kernel)
+    return pd.DataFrame({
+        "local_n_cells": n_cells.astype(np.int64),
+        "local_coverage_rate": coverage,
+        "local_mean_n_panos": mean_panos,
+        "local_mean_recency_months": mean_recency,
+    }, index=pd.Index(lat.grid_ids, name="grid_id"))
+
+
+# ============================================================
+# sparse lattice weights
+# ============================================================
+def lattice_weights(lat, kernel, mask=None, row_standardize=True):
+    """
+    n_cells x n_cells CSR weights: cell j is a neighbour of cell i with weight kernel[dr, dc] when it sits at
+    offset (dr, dc) from i (the kernel centre is ignored). cells outside mask get no links in either direction.
+    rows without neighbours stay empty
+    """
+    n = len(lat.grid_ids)
+    mask = np.ones(n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+    position = np.full(lat.shape, -1, dtype=np.int64)
+    position[lat.rows[mask], lat.cols[mask]] = np.flatnonzero(mask)
+    radius_r, radius_c = kernel.shape[0] // 2, kernel.shape[1] // 2
+    src = np.flatnonzero(mask)
+
+    ii, jj, ww = [], [], []
+    for (kr, kc) in zip(*np.nonzero(kernel)):
+        dr, dc = kr - radius_r, kc - radius_c
+        if dr == 0 and dc == 0:
+            continue
+        r, c = lat.rows[src] + dr, lat.cols[src] + dc
+        inside = (r >= 0) & (r < lat.shape[0]) & (c >= 0) & (c < lat.shape[1])
+        j = np.full(len(src), -1, dtype=np.int64)
+        j[inside] = position[r[inside], c[inside]]
+        hit = j >= 0
+        ii.append(src[hit])
+        jj.append(j[hit])
+        ww.append(np.full(hit.sum(), kernel[kr, kc]))
+    if ii:
+        ii, jj, ww = np.concatenate(ii), np.concatenate(jj), np.concatenate(ww)
+    else:
+        ii = jj = np.empty(0, dtype=np.int64)
+        ww = np.empty(0)
+    w = sparse.csr_matrix((ww, (ii, jj)), shape=(n, n))
+    if row_standardize:
+        row_sum = np.asarray(w.sum(axis=1)).ravel()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            w = sparse.diags(np.where(row_sum > 0, 1 / row_sum, 0)) @ w
+    return w.tocsr()
+
+
+# ============================================================
+# Moran's I / LISA with batched permutations
+# ============================================================
+def _valid_weights(lat, values, kernel):
+    """standardized values of the non-NaN cells and row-standardized weights among them"""
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    w = lattice_weights(lat, kernel, mask=valid)[valid][:, valid].tocsr()
+    z = values[valid] - values[valid].mean()
+    return valid, z, w
+
+
+def _folded_p(larger, n_perm):
+    """pseudo p-value of the more extreme tail, as in PySAL: (min(larger, n_perm - larger) + 1) / (n_perm + 1)"""
+    return (np.minimum(larger, n_perm - larger) + 1) / (n_perm + 1)
+
+
+def global_moran(lat, values, kernel=None, n_perm=999, seed=0, batch_elems=8_000_000):
+    """
+    Moran's I of values (NaN cells left out) under row-standardized lattice weights (queen neighbours by
+    default), with a permutation test: batches of full permutations of the values as an index matrix, one
+    sparse matmul per batch. returns {I, expected_I, p_sim, z_sim, n}
+    """
+    kernel = window_kernel(1, "queen") if kernel is None else kernel
+    _, z, w = _valid_weights(lat, values, kernel)
+    n, s0 = len(z), w.sum()
+    m2 = z @ z
+    out = {"I": np.nan, "expected_I": -1 / (n - 1) if n > 1 else np.nan, "p_sim": np.nan, "z_sim": np.nan, "n": n}
+    if n < 2 or s0 == 0 or m2 == 0:
+        return out
+    out["I"] = n / s0 * (z @ (w @ z)) / m2
+
+    if n_perm:
+        rng = np.random.default_rng(seed)
+        step = max(1, batch_elems // n)
+        sims = []
+        for p0 in range(0, n_perm, step):
+            b = min(step, n_perm - p0)
+            zp = z[rng.permuted(np.tile(np.arange(n), (b, 1)), axis=1)].T  # (n, b)
+            sims.append(n / s0 * np.einsum("ij,ij->j", zp, w @ zp) / m2)
+        sims = np.concatenate(sims)
+        out["p_sim"] = _folded_p((sims >= out["I"]).sum(), n_perm)
+        out["z_sim"] = (out["I"] - sims.mean()) / sims.std()
+    return out
+
+
+def local_moran(lat, values, kernel=None, n_perm=999, seed=0, batch_elems=8_000_000):
+    """
+    LISA (local Moran's I_i = z_i * lag_i / m2) of values under row-standardized lattice weights, with
+    conditional permutation: for every cell its neighbours' values are replaced by values of randomly drawn other
+    cells (drawn with replacement, so the at most kernel-size draws per cell are almost always distinct on a
+    city grid). one batch of permutations is an index matrix over all weight entries.
+    returns a DataFrame indexed by grid_id: value, lag, local_i, p_sim and quadrant (1 HH, 2 LH, 3 LL, 4 HL,
+    0 for cells without a value or neighbours)
+    """
+    kernel = window_kernel(1, "queen") if kernel is None else kernel
+    values = np.asarray(values, dtype=float)
+    valid, z, w = _valid_weights(lat, values, kernel)
+    n = len(z)
+    m2 = z @ z / n if n else 0.0
+    lag = w @ z
+    has_nbr = np.diff(w.indptr) > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        local_i = np.where(has_nbr, z * lag / m2, np.nan)
+
+    p_sim = np.full(n, np.nan)
+    if n_perm and n > 1 and m2 > 0 and w.nnz:
+        rng = np.random.default_rng(seed)
+        owner = np.repeat(np.arange(n), np.diff(w.indptr))
+        starts = w.indptr[:-1][has_nbr]
+        larger = np.zeros(has_nbr.sum(), dtype=np.int64)
+        step = max(1, batch_elems // w.nnz)
+        for p0 in range(0, n_perm, step):
+            b = min(step, n_perm - p0)
+            draw = rng.integers(0, n - 1, size=(b, w.nnz))
+            draw += draw >= owner  # skip the cell itself
+            lag_sim = np.add.reduceat(z[draw] * w.data, starts, axis=1)
+            larger += (z[has_nbr] * lag_sim / m2 >= local_i[has_nbr]).sum(axis=0)
+        p_sim[has_nbr] = _folded_p(larger, n_perm)
+
+    quadrant = np.zeros(n, dtype=np.int8)
+    quadrant[(z > 0) & (lag > 0)] = 1
+    quadrant[(z < 0) & (lag > 0)] = 2
+    quadrant[(z < 0) & (lag < 0)] = 3
+    quadrant[(z > 0) & (lag < 0)] = 4
+    quadrant[~has_nbr] = 0
+
+    out = pd.DataFrame({
+        "value": values,
+        "lag": np.nan,
+        "local_i": np.nan,
+        "p_sim": np.nan,
+        "quadrant": np.zeros(len(values), dtype=np.int8),
+    }, index=pd.Index(lat.grid_ids, name="grid_id"))
+    out.loc[valid, "lag"] = np.where(has_nbr, lag + values[valid].mean(), np.nan)
+    out.loc[valid, "local_i"] = local_i
+    out.loc[valid, "p_sim"] = p_sim
+    out.loc[valid, "quadrant"] = quadrant
+    return out
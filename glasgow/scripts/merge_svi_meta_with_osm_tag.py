@@ -1,34 +1,23 @@
+'''
+store svi metadata (filter_svi_metadata.py) and osm_tags (get_osm_grid_tags_with_road_type.py) as two tables
+joined on grid_id (svi_dataset.py): per-grid columns (tag lists included) are stored once per grid instead of on
+every panorama row; year / month are packed into one int16 month index, ids are int32 and coordinates float32.
+SVIDataset(...).joined() gives the old merged table (same rows, grids without panoramas included)
+'''
 # %%
-import pandas as pd 
+import os
 
-# %%
-osm_tags = pd.read_csv(r"/mnt/home/2715439w/sharedscratch/fairness/glasgow/results/grid_with_osm_tags_roads.csv")
-svi_meta = pd.read_csv(r"/mnt/home/2715439w/sharedscratch/fairness/glasgow/results/glasgow_streetview_metadata_grid_20m_cleaned.csv")
-
-# %%
-print(f"OSM tags shape: {osm_tags.shape}")
-print(f"SVI metadata shape: {svi_meta.shape}\n")
+from pipeline_stages import MERGED, merge_stage
+from storage import RESULTS_DIR
 
-print(osm_tags.columns)
-print("\n")
-print(svi_meta.columns)
-print("\n")
-print(osm_tags.head(5))
-print("\n")
-print(svi_meta.head(5))
-print("\n")
 # %%
-svi_meta["date"] = pd.to_datetime(svi_meta["year"].astype(int).astype(str) + "-" + svi_meta["month"].astype(int).astype(str))
-'''merge svi_summary with osm_tags on grid_id'''
-svi_meta.drop(columns=["query_lat", "query_lon"], inplace=True)
-merged = osm_tags.merge(svi_meta, on="grid_id", how="left")
+if __name__ == "__main__":
+    from svi_dataset import SVIDataset
 
-# move grid_id to the front
-cols = ["grid_id"] + [c for c in merged.columns if c != "grid_id"]
-merged = merged[cols]
-
-print(merged.head())
-# %%
-merged.to_csv(r"/mnt/home/2715439w/sharedscratch/fairness/glasgow/results/merged_svi_osm.csv", index=False)
+    info = merge_stage({"osm": RESULTS_DIR, "filter": RESULTS_DIR}, {}, RESULTS_DIR)
+    print(f"OSM tags: {info['grids']} grids, SVI metadata: {info['panoramas']} panoramas\n")
 
+    merged_dir = os.path.join(RESULTS_DIR, MERGED)
+    print(SVIDataset(merged_dir).joined(["grid_id", "road_type", "grid_highway", "panoid", "date"]).head())
+    print(f"✅ saved grid + panorama tables to {merged_dir}")
 # %%
@@ -0,0 +1,94 @@
+'''
+out-of-core cleaning of the raw metadata crawl for filter_svi_metadata.py.
+the raw table is read in chunks with fixed dtypes, and a running record keeps one row per panoid: the row with
+the smallest distance_m seen so far (a later row only replaces it when strictly nearer, so ties keep the
+earliest row, as groupby('panoid')['distance_m'].idxmin() does). memory is one chunk + one row per panoid
+instead of the whole crawl; the result is the same table, sorted by panoid like the groupby output.
+for a planned crawl the record keeps the first row per panoid instead, snapped to its nearest grid at the end
+'''
+import pandas as pd
+
+from profiling import stage
+from storage import is_parquet
+
+RAW_DTYPES = {
+    "query_lat": "float64",
+    "query_lon": "float64",
+    "panoid": str,  # the default string dtype of read_csv
+    "lat": "float64",
+    "lon": "float64",
+    "year": "float64",
+    "month": "float64",
+    "distance_m": "float64",
+    "grid_id": "int64",
+}
+
+
+def iter_raw_chunks(path, chunksize=1_000_000):
+    """raw crawl rows in chunks with RAW_DTYPES; the index keeps counting across chunks (row number in file)"""
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        start = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            df = batch.to_pandas().astype(RAW_DTYPES)
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
+        return
+    yield from pd.read_csv(path, dtype=RAW_DTYPES, chunksize=chunksize)
+
+
+def keep_nearest(best, chunk):
+    """
+    running record of the nearest row per panoid: best (the record so far, or None) updated with the rows of
+    chunk. the record goes first, so on equal distance its (earlier) row wins
+    """
+    rows = chunk if best is None else pd.concat([best, chunk], ignore_index=True)
+    return rows.loc[rows.groupby("panoid", sort=False)["distance_m"].idxmin()].reset_index(drop=True)
+
+
+def stream_clean_metadata(path, chunksize=1_000_000, df_grid=None):
+    """
+    cleaned metadata (NaN year / month dropped, one row per panoid) from the raw crawl at path, read chunk by chunk.
+    df_grid given -> planned crawl rule (first row per panoid, snapped with query_planner.assign_nearest_grid).
+    returns (cleaned, stats) with stats total_rows / dated_rows / raw_unique_panoids (distinct panoids over all
+    raw rows, dated or not) / unique_panoids (rows of cleaned)
+    """
+    best = None
+    columns = None
+    total_rows = dated_rows = 0
+    raw_panoids = set()
+    for chunk in iter_raw_chunks(path, chunksize):
+        columns = list(chunk.columns)
+        total_rows += len(chunk)
+        raw_panoids.update(chunk["panoid"].dropna().unique())
+        with stage("clean_chunk", rows_in=len(chunk)) as st:
+            chunk = chunk.dropna(subset=["year", "month"])
+            dated_rows += len(chunk)
+            if chunk.empty:
+                continue
+
+            chunk = chunk.rename_axis("_row").reset_index()
+            if df_grid is None:
+                best = keep_nearest(best, chunk)
+            else:
+                rows = chunk if best is None else pd.concat([best, chunk], ignore_index=True)
+                best = rows.drop_duplicates("panoid").reset_index(drop=True)
+            st.rows_out = len(best)
+
+    columns = columns or list(RAW_DTYPES)
+    if best is None:
+        cleaned = pd.DataFrame({c: pd.Series(dtype=t) for c, t in RAW_DTYPES.items()})
+    else:
+        # groupby output is sorted by panoid; the planned rule keeps first-appearance order
+        best = best.sort_values("panoid" if df_grid is None else "_row", kind="stable")
+        cleaned = best[columns].reset_index(drop=True)
+    if df_grid is not None and len(cleaned):
+        from query_planner import assign_nearest_grid
+
+        cleaned = assign_nearest_grid(cleaned, df_grid)[columns].reset_index(drop=True)
+
+    stats = {"total_rows": total_rows, "dated_rows": dated_rows, "raw_unique_panoids": len(raw_panoids),
+             "unique_panoids": len(cleaned)}
+    return cleaned.astype({c: RAW_DTYPES[c] for c in columns if c in RAW_DTYPES}), stats
@@ -0,0 +1,157 @@
+'''
+OSM layer extraction for the grid tagging stage, with a GeoParquet cache.
+the clipped layers (roads_all, roads_drivable, buildings, landuse, natural, pois) are cached under a key made
+from the content hash of the PBF file and the WKB of the bounding polygon, so reruns skip PBF parsing entirely
+unless either input changes. on a cache miss the layers are extracted in a process pool (one pyrosm reader per
+worker), or sequentially from a single reader with workers=1. the pool starts its workers with forkserver (spawn
+where that is missing), never fork: the osm stage runs in a thread next to the crawl's network threads and
+SQLite connection (stage_cache.run_stages), and forking a multi-threaded process can deadlock the children
+'''
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from file_hash import file_sha256
+from profiling import stage
+from storage import write_table
+
+# bump when the extraction itself changes, so old caches are not reused
+EXTRACT_VERSION = 1
+
+# layer name -> (pyrosm method, kwargs)
+LAYERS = {
+    "roads_all": ("get_network", {"network_type": "all"}),
+    "roads_drivable": ("get_network", {"network_type": "driving"}),
+    "buildings": ("get_buildings", {}),
+    "landuse": ("get_landuse", {}),
+    "natural": ("get_natural", {}),
+    "pois": ("get_pois", {}),
+}
+
+
+def cache_key(pbf_path, bounding_polygon, layer_names):
+    h = hashlib.sha256()
+    h.update(file_sha256(pbf_path).encode())
+    h.update(bounding_polygon.wkb)
+    h.update(json.dumps({"layers": sorted(layer_names), "version": EXTRACT_VERSION}).encode())
+    return h.hexdigest()[:16]
+
+
+def _arrow_safe(gdf):
+    """pyrosm object columns can mix str with numbers / dicts; store them as str (None stays missing)"""
+    gdf = gdf.copy()
+    for c in gdf.columns:
+        if c != gdf.geometry.name and gdf[c].dtype == object:
+            gdf[c] = gdf[c].map(lambda v: v if v is None or isinstance(v, str) else str(v))
+    return gdf
+
+
+def _extract(pbf_path, bounding_polygon, names):
+    from pyrosm import OSM
+
+    osm = OSM(pbf_path, bounding_box=bounding_polygon)
+    out = {}
+    for name in names:
+        method, kwargs = LAYERS[name]
+        out[name] = getattr(osm, method)(**kwargs)
+    return out
+
+
+def extract_layers(pbf_path, bounding_polygon, layer_names=None, workers=None):
+    """extract the requested layers from the PBF: {name: GeoDataFrame or None}"""
+    names = list(layer_names or LAYERS)
+    if workers is None:
+        workers = min(len(names), os.cpu_count() or 1)
+    if workers <= 1:
+        return _extract(pbf_path, bounding_polygon, names)
+
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as pool:
+        futures = {name: pool.submit(_extract, pbf_path, bounding_polygon, [name]) for name in names}
+        return {name: fut.result()[name] for name, fut in futures.items()}
+
+
+def semantic_layers(osm_layers):
+    """
+    the layers joined to the grid for tagging: roads (all), buildings, landuse, natural and the POIs split into
+    amenities / shops / tourism (None when the POI layer has no such column)
+    """
+    pois = osm_layers.get("pois")
+
+    def pois_with(col):
+        if pois is None or col not in pois.columns:
+            return None
+        return pois[pois[col].notnull()]
+
+    return {
+        "roads": osm_layers.get("roads_all"),
+        "buildings": osm_layers.get("buildings"),
+        "landuse": osm_layers.get("landuse"),
+        "amenities": pois_with("amenity"),
+        "natural": osm_layers.get("natural"),
+        "shops": pois_with("shop"),
+        "tourism": pois_with("tourism"),
+    }
+
+
+def read_cached_layers(layer_dir, layer_names=None):
+    """layers of a complete cache directory (one written by load_osm_layers): {name: GeoDataFrame or None}"""
+    import geopandas as gpd
+
+    with open(os.path.join(layer_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    names = list(layer_names or manifest["layers"])
+    return {
+        name: gpd.read_parquet(os.path.join(layer_dir, manifest["layers"][name]))
+        if manifest["layers"].get(name) else None
+        for name in names
+    }
+
+
+def ensure_osm_cache(pbf_path, bounding_polygon, cache_dir, layer_names=None, workers=None, verbose=True):
+    """
+    make sure the layers for bounding_polygon (EPSG:4326) are cached, extracting them on a miss.
+    returns the cache directory (its name is the cache key, so it changes whenever the PBF or polygon does)
+    """
+    names = list(layer_names or LAYERS)
+    key = cache_key(pbf_path, bounding_polygon, names)
+    layer_dir = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(layer_dir, "manifest.json")):
+        return layer_dir
+
+    t0 = time.perf_counter()
+    layers = extract_layers(pbf_path, bounding_polygon, names, workers=workers)
+    os.makedirs(layer_dir, exist_ok=True)
+    manifest = {"pbf": os.path.abspath(pbf_path), "version": EXTRACT_VERSION, "layers": {}}
+    for name, gdf in layers.items():
+        if gdf is None or len(gdf) == 0:
+            manifest["layers"][name] = None
+            continue
+        write_table(_arrow_safe(gdf), os.path.join(layer_dir, f"{name}.parquet"), categorical=[])
+        manifest["layers"][name] = f"{name}.parquet"
+    # manifest written last: a cache directory without it is incomplete and gets rebuilt
+    with open(os.path.join(layer_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    if verbose:
+        print(f"✅ OSM layers extracted from {pbf_path} in {time.perf_counter() - t0:.1f}s, cached to {layer_dir}")
+    return layer_dir
+
+
+def load_osm_layers(pbf_path, bounding_polygon, cache_dir, layer_names=None, workers=None, verbose=True):
+    """
+    clipped OSM layers for bounding_polygon (EPSG:4326), read from the GeoParquet cache in cache_dir when the PBF
+    and polygon are unchanged, otherwise extracted and cached. returns {name: GeoDataFrame or None}
+    """
+    names = list(layer_names or LAYERS)
+    t0 = time.perf_counter()
+    with stage("pbf_extract"):
+        layer_dir = ensure_osm_cache(pbf_path, bounding_polygon, cache_dir, names, workers=workers, verbose=verbose)
+    with stage("read_cached_layers") as st:
+        layers = read_cached_layers(layer_dir, names)
+        st.rows_out = sum(len(gdf) for gdf in layers.values() if gdf is not None)
+    if verbose:
+        print(f"✅ OSM layers loaded from cache {layer_dir} in {time.perf_counter() - t0:.1f}s")
+    return layers
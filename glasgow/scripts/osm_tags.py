@@ -0,0 +1,224 @@
+'''
+helpers for turning the OSM x grid joins into per-grid attributes.
+- road_type from the roads join
+- tags: key=value pairs of the SEMANTIC_KEYS columns are dictionary-encoded to integer codes and counted in a
+  sparse grid x tag matrix (scipy CSR). n_tags / unique_keys / tag lists / main highway are all derived from it,
+  and the matrix is saved as a compact feature store for the fairness analysis
+'''
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from storage import read_table, write_table
+
+ROAD_TYPES = ["no-road", "non-drivable", "drivable"]
+SEMANTIC_KEYS = ["building", "landuse", "amenity", "natural", "shop", "tourism", "highway"]
+# main road class of a cell: first of these present among its highway tags
+HIGHWAY_PRIORITY = [
+    "motorway", "trunk", "primary", "secondary", "tertiary",
+    "residential", "service", "unclassified", "pedestrian", "track", "path", "footway"
+]
+
+
+def cells_hit(grid_27700, geoms_27700):
+    """boolean per grid row: does any of geoms_27700 intersect the cell (one sindex.query, no joined frame)"""
+    hit = np.zeros(len(grid_27700), dtype=bool)
+    if geoms_27700 is None or len(geoms_27700) == 0:
+        return hit
+    _, grid_idx = grid_27700.sindex.query(geoms_27700, predicate="intersects")
+    hit[grid_idx] = True
+    return hit
+
+
+def _frames(joined):
+    """a joined frame, or an iterable of per-tile frames (spatial_join.iter_joined), as an iterator of frames"""
+    return iter([joined]) if isinstance(joined, pd.DataFrame) else iter(joined)
+
+
+def _positions(grid_ids):
+    """lookup grid_id -> row position in grid_ids: (argsort order, sorted ids)"""
+    order = np.argsort(grid_ids, kind="stable")
+    return order, grid_ids[order]
+
+
+def classify_road_type(grid_ids, roads_join, drivable_ids, id_col="id"):
+    """
+    road_type per grid from the single roads x grid join (rows of grid_id + OSM way id, as one frame or one
+    frame per tile): drivable if a drivable way (id in drivable_ids) touches the cell, non-drivable if only
+    other roads do, no-road otherwise. returns a categorical Series aligned with grid_ids.
+    per-tile parts are consumed one at a time, so only one tile's join rows are held in memory
+    """
+    grid_ids = pd.Series(np.asarray(grid_ids))
+    order, sorted_ids = _positions(grid_ids.to_numpy())
+    drivable = pd.Index(drivable_ids).unique()
+    any_road = np.zeros(len(grid_ids), dtype=bool)
+    drive_road = np.zeros(len(grid_ids), dtype=bool)
+    for part in _frames(roads_join):
+        if len(part) == 0:
+            continue
+        pos = order[np.searchsorted(sorted_ids, part["grid_id"].to_numpy())]
+        any_road[pos] = True
+        drive_road[pos[drivable.get_indexer(part[id_col]) >= 0]] = True
+    codes = np.where(drive_road, 2, np.where(any_road, 1, 0))
+    return pd.Series(pd.Categorical.from_codes(codes, categories=ROAD_TYPES), index=grid_ids.index)
+
+
+class TagMatrix(NamedTuple):
+    """counts[i, j] = number of OSM features in cell grid_ids[i] carrying tag vocab.iloc[j] (tag_key, tag_value)"""
+    counts: sparse.csr_matrix
+    grid_ids: np.ndarray
+    vocab: pd.DataFrame
+
+
+def encode_tags(joined, grid_ids, keys=SEMANTIC_KEYS):
+    """
+    build the TagMatrix from joined OSM x grid rows (grid_id + one column per tag key), given as one frame or
+    as an iterable of per-tile frames (spatial_join.iter_joined). parts are consumed one at a time: each adds
+    its values to a per-key vocabulary and its (cell, tag, count) triplets to a list of sparse parts, which are
+    stacked at the end, so only one tile's joined rows are in memory.
+    rows follow grid_ids; values are compared as str, like the old melt_tags
+    """
+    grid_ids = np.asarray(grid_ids)
+    order, sorted_ids = _positions(grid_ids)
+
+    # per key: value -> code in order of first appearance, and (row, code, count) parts
+    vocabs = {key: {} for key in keys}
+    parts = {key: [] for key in keys}
+    for part in _frames(joined):
+        pos = None
+        for key in keys:
+            if key not in part.columns:
+                continue
+            col = part[key]
+            mask = col.notna().to_numpy()
+            if not mask.any():
+                continue
+            if pos is None:
+                pos = order[np.searchsorted(sorted_ids, part["grid_id"].to_numpy())]
+            codes, uniques = pd.factorize(col[mask].astype(str))
+            vocab = vocabs[key]
+            codes = np.array([vocab.setdefault(u, len(vocab)) for u in uniques], dtype=np.int64)[codes]
+            # (cell, code) pairs counted per part; sum_duplicates merges a cell split over several parts
+            pairs, counts = np.unique(pos[mask] * len(vocab) + codes, return_counts=True)
+            parts[key].append((pairs // len(vocab), pairs % len(vocab), counts.astype(np.int32)))
+
+    rows, cols, data, vocab_keys, vocab_values = [], [], [], [], []
+    for key in keys:
+        for r, c, n in parts[key]:
+            rows.append(r)
+            cols.append(c + len(vocab_values))
+            data.append(n)
+        vocab_keys.extend([key] * len(vocabs[key]))
+        vocab_values.extend(vocabs[key])
+
+    vocab = pd.DataFrame({"tag_key": pd.Categorical(vocab_keys, categories=list(keys)),
+                          "tag_value": np.asarray(vocab_values, dtype=object)})
+    if rows:
+        rows, cols, data = np.concatenate(rows), np.concatenate(cols), np.concatenate(data)
+    else:
+        rows = cols = np.empty(0, dtype=np.int64)
+        data = np.empty(0, dtype=np.int32)
+    counts = sparse.coo_matrix((data, (rows, cols)), shape=(len(grid_ids), len(vocab))).tocsr()
+    counts.sum_duplicates()
+    return TagMatrix(counts, grid_ids, vocab)
+
+
+def key_matrix(tm):
+    """grid x key counts (number of features per cell carrying each key)"""
+    codes = tm.vocab["tag_key"].cat.codes.to_numpy()
+    onehot = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int32), (np.arange(len(codes)), codes)),
+        shape=(len(codes), len(tm.vocab["tag_key"].cat.categories)),
+    )
+    km = (tm.counts @ onehot).tocsr()
+    km.eliminate_zeros()
+    return km
+
+
+def tag_summary(tm):
+    """
+    per-grid summary for cells with at least one tag, as the old melt + groupby produced:
+    grid_id, tag_key_list, tag_value_list (one entry per feature x key), n_tags, unique_keys
+    """
+    counts = tm.counts
+    n_tags = np.asarray(counts.sum(axis=1)).ravel()
+    unique_keys = np.diff(key_matrix(tm).indptr)
+    has_tags = n_tags > 0
+
+    # expand each stored (cell, tag) count into that many list entries, then cut per cell
+    entries = np.repeat(counts.indices, counts.data)
+    bounds = np.cumsum(n_tags)[:-1]
+    keys = tm.vocab["tag_key"].astype(object).to_numpy()[entries]
+    values = tm.vocab["tag_value"].to_numpy()[entries]
+    key_lists = [k.tolist() for k in np.split(keys, bounds)]
+    value_lists = [v.tolist() for v in np.split(values, bounds)]
+
+    return pd.DataFrame({
+        "grid_id": tm.grid_ids[has_tags],
+        "tag_key_list": [key_lists[i] for i in np.flatnonzero(has_tags)],
+        "tag_value_list": [value_lists[i] for i in np.flatnonzero(has_tags)],
+        "n_tags": n_tags[has_tags],
+        "unique_keys": unique_keys[has_tags],
+    })
+
+
+def highway_ranks(values, priority=HIGHWAY_PRIORITY):
+    """
+    rank of each highway value: its position in priority, unranked values after all of them in alphabetical
+    order (the deterministic fallback)
+    """
+    values = np.asarray(values, dtype=object)
+    lookup = {v: i for i, v in enumerate(priority)}
+    rank = np.array([lookup.get(v, -1) for v in values], dtype=np.int64)
+    unranked = rank < 0
+    if unranked.any():
+        _, alpha = np.unique(values[unranked].astype(str), return_inverse=True)
+        rank[unranked] = len(priority) + alpha
+    return rank
+
+
+def main_highway(tm, priority=HIGHWAY_PRIORITY):
+    """
+    grid_highway per cell carrying a highway tag: the highest-priority value among its highway tags,
+    a row-wise min over the sparse matrix (no per-cell python lists)
+    """
+    sel = np.flatnonzero((tm.vocab["tag_key"] == "highway").to_numpy())
+    if len(sel) == 0:
+        return pd.DataFrame({"grid_id": tm.grid_ids[:0], "grid_highway": pd.Series([], dtype=object)})
+    values = tm.vocab["tag_value"].to_numpy()[sel]
+    rank = highway_ranks(values, priority)
+
+    sub = tm.counts[:, sel].tocsr()
+    sub.eliminate_zeros()
+    rows = np.flatnonzero(np.diff(sub.indptr))
+    best = np.minimum.reduceat(rank[sub.indices], sub.indptr[rows])
+
+    by_rank = np.empty(rank.max() + 1, dtype=object)
+    by_rank[rank] = values
+    return pd.DataFrame({"grid_id": tm.grid_ids[rows], "grid_highway": by_rank[best]})
+
+
+def save_tag_matrix(tm, out_dir):
+    """feature store: counts.npz + grid_ids.npy + vocab table"""
+    os.makedirs(out_dir, exist_ok=True)
+    sparse.save_npz(os.path.join(out_dir, "counts.npz"), tm.counts)
+    np.save(os.path.join(out_dir, "grid_ids.npy"), tm.grid_ids)
+    write_table(tm.vocab, os.path.join(out_dir, "vocab.parquet"), categorical=[])
+    with open(os.path.join(out_dir, "keys.json"), "w") as f:
+        json.dump(list(tm.vocab["tag_key"].cat.categories), f)
+
+
+def load_tag_matrix(out_dir):
+    with open(os.path.join(out_dir, "keys.json")) as f:
+        keys = json.load(f)
+    vocab = read_table(os.path.join(out_dir, "vocab.parquet"))
+    vocab["tag_key"] = pd.Categorical(vocab["tag_key"].astype(str), categories=keys)
+    return TagMatrix(
+        sparse.load_npz(os.path.join(out_dir, "counts.npz")).tocsr(),
+        np.load(os.path.join(out_dir, "grid_ids.npy"), allow_pickle=False),
+        vocab,
+    )
@@ -0,0 +1,393 @@
+'''
+the pipeline scripts as stages of the stage cache (stage_cache.py):
+grid -> fetch -> filter, grid -> osm, (osm, filter) -> merge -> analysis.
+the scripts (generate_grids.py, fetch_svi_metadata_glasgow.py, filter_svi_metadata.py,
+get_osm_grid_tags_with_road_type.py, merge_svi_meta_with_osm_tag.py, analysis.py) are thin wrappers that run their
+stage function on RESULTS_DIR. a stage function reads its inputs from the output directories of its deps and writes
+the same file names into its own directory; verbose (optional) prints the scripts' progress messages.
+build_stages() declares which settings are parameters (they enter the cache key) and which are only options.
+heavy dependencies (pandas, geopandas, pyrosm, geopy) are imported inside the stage functions, so declaring the
+stages and checking which are up to date (svi_fairness.py status) imports none of them
+'''
+import glob
+import os
+import shutil
+
+from profiling import stage
+from stage_cache import PipelineStage
+from storage import STORAGE_FORMAT, read_table, write_table
+
+GRID = f"glasgow_grid_20m.{STORAGE_FORMAT}"
+CELL_INDEX = "glasgow_grid_20m_index"
+RAW_METADATA = "glasgow_streetview_metadata_grid_20m.csv"
+REFRESH_GLOB = "glasgow_streetview_metadata_grid_20m_refresh_*.csv"  # re-crawls (recrawl_svi_metadata_glasgow.py)
+CLEANED = f"glasgow_streetview_metadata_grid_20m_cleaned.{STORAGE_FORMAT}"
+GRID_TAGS = f"grid_with_osm_tags_roads.{STORAGE_FORMAT}"
+TAG_MATRIX = "grid_tag_matrix"
+MERGED = "merged_svi_osm"
+SUMMARY = f"grid_summary.{STORAGE_FORMAT}"
+def grid_names(spacing_m=20, lattice=False):
+    """
+    (grid, cell index, raw crawl) names of the degree grid (generate_grids.py: one table) or, with lattice, of the
+    EPSG:27700 lattice (generate_grids_27700.py: a tile directory + lattice.json, read by tile_pipeline.py too)
+    """
+    if not lattice:
+        return GRID, CELL_INDEX, RAW_METADATA
+    stem = f"glasgow_grid_27700_{spacing_m:g}m"
+    return stem, f"{stem}_index", f"glasgow_streetview_metadata_grid_27700_{spacing_m:g}m.csv"
+
+
+GRID_TAG_COLUMNS = ["grid_id", "query_lat", "query_lon", "grid_highway", "road_type",
+                    "n_tags", "unique_keys", "tag_key_list", "tag_value_list"]
+
+
+def _to_27700(gdf):
+    return (gdf if gdf.crs is not None else gdf.set_crs(4326)).to_crs(27700)
+
+
+def tag_grid(df_grid, osm_layers, join_dir, half=10, tile_m=2000, spec=None, verbose=False):
+    """
+    steps 3-6 of get_osm_grid_tags_with_road_type.py: cells of df_grid (squares of half-width half around the
+    centres, or the lattice cells of spec when df_grid has x / y), tiled join with the semantic layers,
+    road_type, tag matrix, tag summary and main highway. returns (grid table with GRID_TAG_COLUMNS, TagMatrix)
+    """
+    import geopandas as gpd
+    import numpy as np
+    import pandas as pd
+
+    from grid_utils import cell_boxes
+    from osm_layers import semantic_layers
+    from osm_tags import (HIGHWAY_PRIORITY, ROAD_TYPES, SEMANTIC_KEYS, cells_hit, classify_road_type, encode_tags,
+                          main_highway, tag_summary)
+    from spatial_join import LayerIndex, iter_joined, tiled_sjoin
+
+    layers = semantic_layers(osm_layers)
+    if verbose:
+        for k, v in layers.items():
+            print(f"{k:9s} ->", "None" if v is None else f"{len(v)} features")
+
+    # 3) cells
+    if spec is not None and {"x", "y"}.issubset(df_grid.columns):
+        # EPSG:27700 lattice: cells are built straight from the projected centres, no reprojection
+        grid = gpd.GeoDataFrame(df_grid, geometry=cell_boxes(df_grid["x"], df_grid["y"], spec), crs=27700)
+    else:
+        grid = gpd.GeoDataFrame(df_grid, geometry=gpd.points_from_xy(df_grid["query_lon"], df_grid["query_lat"]),
+                                crs=4326).to_crs(27700)
+        # cap_style=3 -> square buffers
+        grid["geometry"] = grid.geometry.buffer(half, cap_style=3)
+    if "grid_id" not in grid.columns:
+        grid["grid_id"] = range(len(grid))
+    if verbose:
+        print(f"✅ generate {len(grid)} grids from center points.")
+
+    # 4) tiled join: each layer is projected + STRtree-indexed once, then queried one grid tile at a time; per-tile
+    # rows (grid_id, layer, tag columns + OSM id only, no geometry) are streamed to join_dir
+    layer_indexes = []
+    for name, gdf in layers.items():
+        if gdf is None or len(gdf) == 0:
+            continue
+        with stage("layer_index", rows_in=len(gdf), layer=name):
+            layer_indexes.append(LayerIndex(name, _to_27700(gdf), SEMANTIC_KEYS + ["id"]))
+    n_joined = tiled_sjoin(grid, layer_indexes, join_dir, tile_m=tile_m, columns=SEMANTIC_KEYS + ["id"],
+                           verbose=verbose)
+    del layer_indexes
+    if n_joined == 0:
+        raise RuntimeError("no intersection between the OSM layers and the grid")
+
+    # 5) road_type: no-road, non-drivable, drivable. the drivable network is a subset of the same OSM ways, so a
+    # cell is drivable when one of the way ids of the roads join touching it is in roads_drivable (no extra sjoin).
+    # road_type and the tag matrix are built one join tile at a time: memory follows tile_m, not the city
+    drivable = osm_layers.get("roads_drivable")
+    if drivable is not None and "id" in drivable.columns:
+        roads_join = (df for _, df in iter_joined(join_dir, columns=["grid_id", "id"],
+                                                  filters=[("layer", "==", "roads")]))
+        with stage("road_type", rows_in=len(grid)):
+            grid["road_type"] = classify_road_type(grid["grid_id"], roads_join, drivable["id"]).values
+    else:
+        # no way ids to match on: one hit / no-hit sindex query per road layer instead
+        roads_all = osm_layers.get("roads_all")
+        with stage("road_type", rows_in=len(grid)):
+            any_road = cells_hit(grid, None if roads_all is None else _to_27700(roads_all).geometry)
+            drive_road = cells_hit(grid, None if drivable is None else _to_27700(drivable).geometry)
+            grid["road_type"] = pd.Categorical.from_codes(np.where(drive_road, 2, np.where(any_road, 1, 0)),
+                                                          categories=ROAD_TYPES)
+    if verbose:
+        counts = grid["road_type"].value_counts()
+        print("✅ Road type classification completed. " + ", ".join(f"{t}={counts.get(t, 0)}" for t in ROAD_TYPES))
+
+    # 6) tags: key=value pairs dictionary-encoded into a sparse grid x tag count matrix; n_tags, unique_keys, the
+    # tag lists and the main highway (highest-priority value, alphabetical fallback) are all read off it
+    joined_tags = (df for _, df in iter_joined(join_dir, columns=["grid_id"] + SEMANTIC_KEYS))
+    with stage("encode_tags", rows_in=n_joined) as st:
+        tag_matrix = encode_tags(joined_tags, grid["grid_id"].to_numpy(), keys=SEMANTIC_KEYS)
+        st.rows_out = tag_matrix.counts.nnz
+    if verbose:
+        print("✅ tag matrix completed:", tag_matrix.counts.sum(), "(grid_id, tag_key, tag_value) entries,",
+              len(tag_matrix.vocab), "distinct tags")
+    with stage("tag_summary", rows_in=len(grid)) as st:
+        summary = tag_summary(tag_matrix)
+        st.rows_out = len(summary)
+    with stage("main_highway", rows_in=len(grid)) as st:
+        highway_summary = main_highway(tag_matrix, priority=HIGHWAY_PRIORITY)
+        st.rows_out = len(highway_summary)
+    grid = grid.merge(summary.merge(highway_summary, on="grid_id", how="left"), on="grid_id", how="left")
+    for c in ["n_tags", "unique_keys"]:
+        grid[c] = grid[c].fillna(0).astype(int)
+    if verbose:
+        print("✅ Summary completed: number of grids with tags =", grid["n_tags"].gt(0).sum())
+    return grid[GRID_TAG_COLUMNS].copy(), tag_matrix
+
+
+# ============================================================
+# stage functions: fn(inputs, params, out_dir)
+# ============================================================
+def _boundary(path):
+    import geopandas as gpd
+
+    return gpd.read_file(path).to_crs(4326)
+
+
+def grid_stage(inputs, params, out_dir):
+    """degree grid table, or with lattice the EPSG:27700 lattice as tiles of tile_rows rows; plus its cell index"""
+    from cell_index import CellIndex, build_cell_index
+
+    verbose = params.get("verbose", False)
+    grid_file, index_file, _ = grid_names(params["spacing_m"], params.get("lattice", False))
+    out_path = os.path.join(out_dir, grid_file)
+    if params.get("lattice", False):
+        import geopandas as gpd
+
+        from grid_utils import lattice_spec, write_lattice_tiles
+
+        boundary = gpd.read_file(inputs["boundary"]).to_crs(27700)
+        if verbose:
+            print("✅ Glasgow polygon loaded")
+            print(f"boundaries (EPSG:27700): {boundary.total_bounds}")
+        spec = lattice_spec(boundary.total_bounds, spacing_m=params["spacing_m"], tile_rows=params["tile_rows"])
+        if verbose:
+            print(f"lattice: {spec['n_rows']} rows x {spec['n_cols']} cols of {params['spacing_m']}m, "
+                  f"origin ({spec['x0']}, {spec['y0']})")
+        with stage("write_lattice_tiles") as st:
+            n_cells = st.rows_out = write_lattice_tiles(boundary.union_all(), spec, out_path, verbose=verbose)
+        index_dir = build_cell_index(out_path).save(os.path.join(out_dir, index_file))
+    else:
+        from grid_utils import generate_grid_points, grid_steps
+
+        boundary = _boundary(inputs["boundary"])
+        bounds = boundary.total_bounds
+        if verbose:
+            print("✅ Glasgow polygon loaded")
+            print(f"boundaries: {bounds}")  # [minx, miny, maxx, maxy]
+        lat_step, lon_step = grid_steps(bounds, spacing_m=params["spacing_m"])
+        if verbose:
+            print(f"step length:  {lat_step:.7f}° (lat), {lon_step:.7f}° (lon)")
+
+        # lattice is tested against the polygon in bulk, 200 rows at a time
+        with stage("generate_grid_points") as st:
+            df = generate_grid_points(boundary.union_all(), bounds, lat_step, lon_step, verbose=verbose)
+            n_cells = st.rows_out = len(df)
+        with stage("write_grid", rows_in=len(df)):
+            write_table(df, out_path)
+        # lattice lookup index (cell_index.py): later stages map points / geometries to grid_id without a spatial join
+        index_dir = CellIndex.from_grid(df).save(os.path.join(out_dir, index_file))
+    if verbose:
+        print(f"\n✅ Glasgow generates {n_cells} grids of {params['spacing_m']}m")
+        print(f"✅ saved to {out_path}")
+        print(f"✅ cell index saved to {index_dir}")
+    return {"rows": n_cells}
+
+
+def fetch_stage(inputs, params, out_dir):
+    """
+    resumable: rerun after a failure, the checkpoint in the partial directory skips finished points.
+    planned_crawl -> only the centres picked by the query planner are queried (filter_stage snaps them back);
+    experiment_n -> only the first n grid points (quick test runs)
+    """
+    from checkpoint import CrawlCheckpoint
+    from grid_utils import load_grid
+    from svi_fetch import RECORD_COLUMNS, fetch_grid_metadata, load_streetview
+
+    verbose = params.get("verbose", False)
+    streetview = load_streetview(inputs["streetview"])
+    df_grid = load_grid(os.path.join(inputs["grid"], params.get("grid_file", GRID)),
+                        columns=["grid_id", "query_lat", "query_lon"])
+    grid_centers = list(zip(df_grid["grid_id"], df_grid["query_lat"], df_grid["query_lon"]))
+    if verbose:
+        print(f"✅ Loaded Glasgow grid, in total: {len(grid_centers)} with grid_id")
+
+    # checkpoint store keyed on grid_id (done / empty / failed), committed after every csv batch:
+    # done and empty points are skipped on resume, failed points are retried
+    out_csv = os.path.join(out_dir, params.get("raw_file", RAW_METADATA))
+    checkpoint = CrawlCheckpoint(out_csv.replace(".csv", "_checkpoint.sqlite"))
+    if checkpoint.is_empty() and os.path.exists(out_csv):
+        # crawl started before the checkpoint existed: seed it once from the grid_ids in the csv
+        n_seeded = checkpoint.seed_from_csv(out_csv)
+        if verbose:
+            print(f"🔁 checkpoint seeded from existing csv with {n_seeded} grid points")
+    done = checkpoint.finished_ids()
+    if verbose:
+        print(f"🔁 existing {len(done)} ({checkpoint.counts()}), these points will be skipped")
+
+    if params.get("experiment_n"):
+        grid_centers = grid_centers[:params["experiment_n"]]
+        if verbose:
+            print(f"🧪 Exp mode is on: only test for {params['experiment_n']} points")
+    if params.get("planned_crawl"):
+        # neighbouring centres return the same panoramas, so only a subset of centres that still covers every
+        # cell is queried (query_planner.py)
+        from query_planner import plan_queries, print_report
+
+        planned, plan_report = plan_queries(df_grid)
+        planned_ids = set(planned["grid_id"])
+        grid_centers = [c for c in grid_centers if c[0] in planned_ids]
+        if verbose:
+            print_report(plan_report)
+
+    todo = [c for c in grid_centers if c[0] not in done]
+    if verbose:
+        print(f"🚀 fetching {len(todo)} points with {params['workers']} workers")
+    stats = fetch_grid_metadata(todo, streetview.panoids, out_csv, workers=params["workers"], rate=params["rate"],
+                                save_every=params["save_every"], retries=params["retries"],
+                                checkpoint=checkpoint, distance=params["distance"], verbose=verbose)
+    counts = checkpoint.counts()
+    checkpoint.close()
+    if verbose:
+        print(f"\n✅ Task completed. {stats['done']} points done ({stats['empty']} empty), {stats['failed']} failed, "
+              f"{stats['rows']} rows in {stats['elapsed_s']:.0f}s")
+    if stats["failed"]:
+        raise RuntimeError(f"{stats['failed']} grid points failed, rerun to retry them")
+    if not os.path.exists(out_csv):  # no point returned a panorama: header only
+        with open(out_csv, "w") as f:
+            f.write(",".join(RECORD_COLUMNS) + "\n")
+    return {"points": counts, "rows": stats["rows"]}
+
+
+def refresh_paths(results_dir):
+    """re-crawl csvs in results_dir, oldest first: extra inputs of the filter stage"""
+    return sorted(glob.glob(os.path.join(results_dir, REFRESH_GLOB)))
+
+
+def filter_stage(inputs, params, out_dir):
+    """re-crawl csvs (refresh:<name> inputs) are folded into the cleaned table with recrawl.merge_recrawl"""
+    from metadata_filter import stream_clean_metadata
+
+    refresh = [inputs[k] for k in sorted(inputs) if k.startswith("refresh:")]
+    df_grid = None
+    if params["planned_crawl"] or refresh:
+        from grid_utils import load_grid
+
+        df_grid = load_grid(os.path.join(inputs["grid"], params.get("grid_file", GRID)))
+    # NaN year / month dropped and one row per panoid kept, chunk by chunk (metadata_filter.py)
+    with stage("stream_clean_metadata") as st:
+        cleaned, stats = stream_clean_metadata(os.path.join(inputs["fetch"], params.get("raw_file", RAW_METADATA)),
+                                               chunksize=params["chunksize"],
+                                               df_grid=df_grid if params["planned_crawl"] else None)
+        st.rows_in, st.rows_out = stats["total_rows"], stats["unique_panoids"]
+    if refresh:
+        from recrawl import merge_recrawl
+
+        stats["refresh_new_panos"] = 0
+        for path in refresh:
+            with stage("merge_recrawl", rows_in=len(cleaned)) as st:
+                cleaned, merge_stats = merge_recrawl(cleaned, read_table(path), df_grid)
+                st.rows_out = len(cleaned)
+            stats["refresh_new_panos"] += merge_stats["new_panos"]
+        stats["unique_panoids"] = len(cleaned)
+    with stage("write_cleaned", rows_in=len(cleaned)):
+        write_table(cleaned, os.path.join(out_dir, CLEANED))
+    return stats
+
+
+def osm_stage(inputs, params, out_dir):
+    from grid_utils import load_grid, read_lattice_spec
+    from osm_layers import load_osm_layers
+    from osm_tags import save_tag_matrix
+
+    verbose = params.get("verbose", False)
+    with stage("osm_load"):
+        layers = load_osm_layers(inputs["pbf"], _boundary(inputs["boundary"]).geometry.iloc[0],
+                                 params["osm_cache_dir"], workers=params["osm_workers"], verbose=verbose)
+    grid_path = os.path.join(inputs["grid"], params.get("grid_file", GRID))
+    df_grid = load_grid(grid_path)
+    spec = read_lattice_spec(grid_path) if os.path.isdir(grid_path) else None
+    join_dir = os.path.join(out_dir, "osm_grid_join")
+    grid_tags, tag_matrix = tag_grid(df_grid, layers, join_dir, half=params["half"], tile_m=params["join_tile_m"],
+                                     spec=spec, verbose=verbose)
+    shutil.rmtree(join_dir, ignore_errors=True)  # per-tile join rows are only needed for the summary
+    save_tag_matrix(tag_matrix, os.path.join(out_dir, TAG_MATRIX))
+    output_path = os.path.join(out_dir, GRID_TAGS)
+    with stage("write_grid_tags", rows_in=len(grid_tags)):
+        write_table(grid_tags, output_path)
+    if verbose:
+        print(f"✅ Saved simplified grid with road_type classification to: {output_path}")
+    return {"rows": len(grid_tags), "tagged": int((grid_tags["n_tags"] > 0).sum())}
+
+
+def merge_stage(inputs, params, out_dir):
+    from svi_dataset import write_svi_dataset
+
+    with stage("read_inputs") as st:
+        osm_tags = read_table(os.path.join(inputs["osm"], GRID_TAGS))
+        svi_meta = read_table(os.path.join(inputs["filter"], CLEANED))
+        st.rows_out = len(osm_tags) + len(svi_meta)
+    with stage("write_svi_dataset", rows_in=len(osm_tags) + len(svi_meta)):
+        write_svi_dataset(osm_tags, svi_meta, os.path.join(out_dir, MERGED))
+    return {"grids": len(osm_tags), "panoramas": len(svi_meta)}
+
+
+def analysis_stage(inputs, params, out_dir):
+    from svi_dataset import SVIDataset
+    from temporal_metrics import temporal_summary_ym
+
+    # month indices straight from the panorama table, no joined view
+    with stage("load_merged") as st:
+        ds = SVIDataset(os.path.join(inputs["merge"], MERGED))
+        grid_ids, panos = ds.grid(["grid_id"])["grid_id"], ds.panos(["grid_id", "panoid", "ym"])
+        st.rows_out = len(panos)
+    with stage("temporal_summary", rows_in=len(panos)) as st:
+        grid_summary = temporal_summary_ym(grid_ids, panos)
+        st.rows_out = len(grid_summary)
+    if params.get("verbose", False):
+        print(grid_summary.head())
+    write_table(grid_summary.reset_index(), os.path.join(out_dir, SUMMARY))
+    return {"rows": len(grid_summary)}
+
+
+def build_stages(boundary_path, pbf_path, streetview_path, osm_cache_dir, spacing_m=20, half=10,
+                 join_tile_m=2000, save_every=50, retries=3, distance="haversine", planned_crawl=False,
+                 chunksize=1_000_000, fetch_workers=8, rate=20, osm_workers=6, refresh=(), lattice=False,
+                 tile_rows=100, verbose=True):
+    """
+    the six stages with their inputs. parameters (keyed): spacing_m, half, save_every, retries, distance,
+    planned_crawl (fetch queries the query planner's centres, filter snaps them back); options (not keyed, they
+    change memory or speed but not the outputs): join_tile_m, chunksize, workers, rate, the OSM layer cache (keyed
+    by PBF + boundary on its own), verbosity. refresh: re-crawl csvs (refresh_paths), input files of the filter
+    stage, so a new or grown re-crawl makes filter -> merge -> analysis stale. lattice (keyed): the grid is the
+    EPSG:27700 lattice as a tile directory of tile_rows rows per tile (an option), fetch / filter / osm read it
+    and the crawl is written under the lattice name (grid_names)
+    """
+    grid_file, index_file, raw_file = grid_names(spacing_m, lattice)
+    # the file names follow from the grid's parameters, which are in the keys of every downstream stage already
+    names = {"grid_file": grid_file, "raw_file": raw_file}
+    # lattice / tile_rows only enter the grid parameters for a lattice, so degree-grid keys stay as they were
+    grid_params = {"spacing_m": spacing_m, **({"lattice": True} if lattice else {})}
+    return [
+        PipelineStage("grid", grid_stage, files={"boundary": boundary_path}, params=grid_params,
+                      options={"tile_rows": tile_rows}, outputs=(grid_file, index_file)),
+        PipelineStage("fetch", fetch_stage, deps=("grid",), files={"streetview": streetview_path},
+                      params={"save_every": save_every, "retries": retries, "distance": distance,
+                              "planned_crawl": planned_crawl},
+                      options={"workers": fetch_workers, "rate": rate, "verbose": verbose, **names},
+                      outputs=(raw_file,), resumable=True),
+        PipelineStage("filter", filter_stage, deps=("grid", "fetch"),
+                      files={f"refresh:{os.path.basename(p)}": p for p in refresh},
+                      params={"planned_crawl": planned_crawl},
+                      options={"chunksize": chunksize, **names}, outputs=(CLEANED,)),
+        PipelineStage("osm", osm_stage, deps=("grid",), files={"boundary": boundary_path, "pbf": pbf_path},
+                      params={"half": half},
+                      options={"join_tile_m": join_tile_m, "osm_cache_dir": osm_cache_dir, "osm_workers": osm_workers,
+                               **names},
+                      outputs=(GRID_TAGS, TAG_MATRIX)),
+        PipelineStage("merge", merge_stage, deps=("osm", "filter"), outputs=(MERGED,)),
+        PipelineStage("analysis", analysis_stage, deps=("merge",), outputs=(SUMMARY,)),
+    ]
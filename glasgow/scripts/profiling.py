@@ -0,0 +1,231 @@
+'''
+stage-level instrumentation shared by the pipeline scripts.
+a stage records wall time, cpu time, resident memory (current and the process high-water mark), rows in / out
+and throughput, and is written as one JSON line; stages nest ("osm/sjoin/buildings"). turned on with
+SVI_PROFILE=<jsonl path> ("-" for stderr) or configure(); SVI_PROFILE_CPU=cprofile|pyinstrument also saves a
+cpu profile of every top-level stage next to the jsonl. disabled, stage() hands back one shared no-op object:
+an instrumented block costs about a microsecond and nothing is measured or written
+'''
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+
+PROFILE_PATH = os.environ.get("SVI_PROFILE")
+CPU_PROFILER = os.environ.get("SVI_PROFILE_CPU")  # None | "cprofile" | "pyinstrument"
+
+_PROFILER = None
+_MB = 1024 * 1024
+
+
+def rss_mb():
+    """current resident set size in MB (None where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / _MB
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    """process high-water mark in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (_MB if sys.platform == "darwin" else 1024)
+
+
+class _NullStage:
+    """what stage() returns when profiling is off: every call and attribute write is ignored"""
+    rows_in = rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+    def set(self, **fields):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """one timed span; set rows_in / rows_out (or extra fields with set()) before it exits"""
+
+    def __init__(self, profiler, name, rows_in=None, fields=None):
+        self.profiler = profiler
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.fields = dict(fields or {})
+        self.cpu = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = self.profiler.stack()
+        self.path = "/".join([s.name for s in stack] + [self.name])
+        self.depth = len(stack)
+        stack.append(self)
+        if self.depth == 0 and self.profiler.cpu:
+            self.cpu = self.profiler.start_cpu()
+        self.rss0 = rss_mb()
+        self.t0 = time.time()
+        self.p0 = time.perf_counter()
+        self.c0 = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.p0
+        cpu = time.process_time() - self.c0
+        self.profiler.stack().pop()
+        if self.cpu is not None:
+            self.profiler.stop_cpu(self.cpu, self.path)
+        rss = rss_mb()
+        self.profiler.emit(
+            self.path, self.name, self.depth, wall, rows_in=self.rows_in, rows_out=self.rows_out, start=self.t0,
+            cpu_s=cpu, rss_mb=rss, rss_delta_mb=None if rss is None or self.rss0 is None else rss - self.rss0,
+            error=None if exc_type is None else exc_type.__name__, **self.fields,
+        )
+        return False
+
+
+class Profiler:
+    """writes stage records of one run (run_id) as JSON lines to path; context fields go on every record"""
+
+    def __init__(self, path, cpu=None, run_id=None, context=None):
+        self.path = path
+        self.cpu = cpu
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.context = dict(context or {})
+        self.script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if path != "-":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def stack(self):
+        """open stages of the calling thread (worker threads nest on their own)"""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def emit(self, path, name, depth, wall_s, rows_in=None, rows_out=None, start=None, **fields):
+        rows = rows_out if rows_out is not None else rows_in
+        record = {
+            "run_id": self.run_id, "script": self.script, "pid": os.getpid(), "stage": path, "name": name,
+            "depth": depth, "start": start if start is not None else time.time() - wall_s,
+            "wall_s": round(wall_s, 6), "rows_in": rows_in, "rows_out": rows_out,
+            "rows_per_s": rows / wall_s if rows is not None and wall_s > 0 else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            **self.context,
+        }
+        record.update({k: round(v, 6) if isinstance(v, float) else v for k, v in fields.items()})
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self.path == "-":
+                sys.stderr.write(line)
+            else:
+                with open(self.path, "a") as f:
+                    f.write(line)
+
+    def _cpu_path(self, stage_path, ext):
+        base = os.path.splitext(self.path)[0] if self.path != "-" else "profile"
+        return f"{base}.{self.run_id}.{stage_path.replace('/', '.')}.{ext}"
+
+    def start_cpu(self):
+        if self.cpu == "cprofile":
+            import cProfile
+
+            prof = cProfile.Profile()
+            prof.enable()
+        elif self.cpu == "pyinstrument":
+            from pyinstrument import Profiler as PyinstrumentProfiler
+
+            prof = PyinstrumentProfiler()
+            prof.start()
+        else:
+            raise ValueError(f"unknown cpu profiler {self.cpu!r}")
+        return prof
+
+    def stop_cpu(self, prof, stage_path):
+        if self.cpu == "cprofile":
+            prof.disable()
+            prof.dump_stats(self._cpu_path(stage_path, "prof"))
+        else:
+            prof.stop()
+            with open(self._cpu_path(stage_path, "html"), "w") as f:
+                f.write(prof.output_html())
+
+
+def configure(path=None, cpu=None, run_id=None, **context):
+    """
+    turn profiling on (records appended to path, "-" for stderr) or off (path=None); context fields
+    (e.g. commit=...) are added to every record. returns the profiler
+    """
+    global _PROFILER
+    _PROFILER = Profiler(path, cpu=cpu, run_id=run_id, context=context) if path else None
+    return _PROFILER
+
+
+def enabled():
+    return _PROFILER is not None
+
+
+def stage(name, rows_in=None, **fields):
+    """
+    context manager timing one stage, e.g.
+        with stage("encode_tags", rows_in=len(joined)) as st:
+            tm = encode_tags(...)
+            st.rows_out = tm.counts.nnz
+    """
+    if _PROFILER is None:
+        return NULL_STAGE
+    return Stage(_PROFILER, name, rows_in, fields)
+
+
+def record(name, wall_s, rows_in=None, rows_out=None, **fields):
+    """
+    a stage measured elsewhere (spans that are not one block: a fetch batch, one layer summed over tiles),
+    nested under the stages open in the calling thread
+    """
+    if _PROFILER is None:
+        return
+    stack = _PROFILER.stack()
+    path = "/".join([s.name for s in stack] + [name])
+    _PROFILER.emit(path, name, len(stack), wall_s, rows_in=rows_in, rows_out=rows_out, **fields)
+
+
+def profiled(name=None):
+    """decorator: run the function inside stage(name or the function name)"""
+    def wrap(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if _PROFILER is None:
+                return fn(*args, **kwargs)
+            with stage(label):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def read_profile(path):
+    """stage records of a jsonl file as a DataFrame"""
+    import pandas as pd
+
+    return pd.read_json(path, lines=True)
+
+
+if PROFILE_PATH:
+    configure(PROFILE_PATH, cpu=CPU_PROFILER)
@@ -0,0 +1,167 @@
+'''
+plan streetview metadata queries so neighbouring grid centres do not re-request the same panoramas.
+
+a panoids query at centre q returns (at least) every panorama within QUERY_RADIUS of q. the panoramas that
+end up snapped to a grid centre c lie within its cell, i.e. within cell_radius (half diagonal) of c, so c
+does not need its own query once a queried centre lies within QUERY_RADIUS - cell_radius of it.
+plan_queries keeps every k-th row/col of the lattice (k as large as that distance allows) plus the centres
+on the grid edge (they also pick up panoramas just outside the boundary), then adds back any centre still
+uncovered. after fetching, assign_nearest_grid snaps every panorama to its nearest grid_id locally
+(cKDTree over the centres), which is the rule filter_svi_metadata.py applies to the naive crawl
+'''
+import numpy as np
+from scipy.spatial import cKDTree
+
+from svi_fetch import haversine_np
+
+QUERY_RADIUS = 50  # meter, distance within which a panoids query reliably returns all panoramas
+
+
+def grid_xy(df_grid):
+    """metric (EPSG:27700) centre coordinates; reuses x/y of a lattice grid when present"""
+    if {"x", "y"}.issubset(df_grid.columns):
+        return df_grid["x"].to_numpy(float), df_grid["y"].to_numpy(float)
+    from pyproj import Transformer
+
+    to_27700 = Transformer.from_crs(4326, 27700, always_xy=True)
+    return to_27700.transform(df_grid["query_lon"].to_numpy(float), df_grid["query_lat"].to_numpy(float))
+
+
+def grid_rowcol(df_grid):
+    """(row, col) lattice indices of each centre, from row/col columns or recovered from the lat/lon steps"""
+    if {"row", "col"}.issubset(df_grid.columns):
+        return df_grid["row"].to_numpy(np.int64), df_grid["col"].to_numpy(np.int64)
+    out = []
+    for c in ["query_lat", "query_lon"]:
+        v = df_grid[c].to_numpy(float)
+        step = np.median(np.diff(np.unique(v)))
+        out.append(np.rint((v - v.min()) / step).astype(np.int64))
+    return out[0], out[1]
+
+
+def grid_spacing(x, y):
+    """median nearest-neighbour distance between centres (meter)"""
+    d, _ = cKDTree(np.column_stack([x, y])).query(np.column_stack([x, y]), k=2)
+    return float(np.median(d[:, 1]))
+
+
+def grid_edge(row, col):
+    """centres missing at least one of their 8 lattice neighbours"""
+    width = col.max() + 3
+    key = (row + 1) * width + (col + 1)
+    present = np.sort(key)
+    edge = np.zeros(len(key), dtype=bool)
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            if dr or dc:
+                nb = key + dr * width + dc
+                pos = np.minimum(np.searchsorted(present, nb), len(present) - 1)
+                edge |= present[pos] != nb
+    return edge
+
+
+def plan_queries(df_grid, query_radius=QUERY_RADIUS, cell_radius=None):
+    """
+    choose the subset of grid centres to query. returns (planned DataFrame, report dict).
+    every grid centre ends up within cover_m = query_radius - cell_radius of a planned centre
+    """
+    x, y = grid_xy(df_grid)
+    spacing = grid_spacing(x, y)
+    if cell_radius is None:
+        cell_radius = spacing * np.sqrt(2) / 2
+    cover_m = query_radius - cell_radius
+    if cover_m < 0:
+        raise ValueError(f"query_radius={query_radius} is smaller than the cell radius {cell_radius:.1f}m")
+
+    # 1) strided lattice: the farthest centre from a kept one is (k // 2) steps away on both axes
+    k = 2 * int(cover_m // (spacing * np.sqrt(2))) + 1
+    row, col = grid_rowcol(df_grid)
+    keep = (row % k == k // 2) & (col % k == k // 2)
+    edge = grid_edge(row, col)
+    keep |= edge
+
+    # 2) add back centres that the stride leaves uncovered (mostly along the boundary), greedily
+    xy = np.column_stack([x, y])
+    if keep.any():
+        d, _ = cKDTree(xy[keep]).query(xy, distance_upper_bound=cover_m * (1 + 1e-9))
+        uncovered = np.flatnonzero(np.isinf(d))
+    else:
+        uncovered = np.arange(len(xy))
+    bucket = max(cover_m, spacing)
+    added = {}
+    for i in uncovered:
+        bx, by = int(x[i] // bucket), int(y[i] // bucket)
+        covered = False
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in added.get((bx + dx, by + dy), ()):
+                    if (x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 <= cover_m ** 2:
+                        covered = True
+                        break
+                if covered:
+                    break
+            if covered:
+                break
+        if not covered:
+            added.setdefault((bx, by), []).append(i)
+            keep[i] = True
+
+    planned = df_grid[keep]
+    report = {
+        "naive_calls": len(df_grid),
+        "planned_calls": len(planned),
+        "stride": k,
+        "edge": int(edge.sum()),
+        "boundary_fill": sum(len(v) for v in added.values()),
+        "calls_saved": len(df_grid) - len(planned),
+        "reduction": len(df_grid) / max(len(planned), 1),
+        "cover_m": cover_m,
+    }
+    return planned, report
+
+
+def assign_nearest_grid(panos, df_grid, k=4):
+    """
+    snap each panorama (lat, lon) to its nearest grid centre: sets grid_id, query_lat, query_lon, distance_m.
+    the k nearest centres in EPSG:27700 are re-ranked by haversine distance, the metric of the naive crawl
+    """
+    from pyproj import Transformer
+
+    gx, gy = grid_xy(df_grid)
+    to_27700 = Transformer.from_crs(4326, 27700, always_xy=True)
+    plat = panos["lat"].to_numpy(float)
+    plon = panos["lon"].to_numpy(float)
+    px, py = to_27700.transform(plon, plat)
+    k = min(k, len(df_grid))
+    _, cand = cKDTree(np.column_stack([gx, gy])).query(np.column_stack([px, py]), k=k)
+    cand = cand.reshape(len(plat), k)
+
+    glat = df_grid["query_lat"].to_numpy(float)
+    glon = df_grid["query_lon"].to_numpy(float)
+    dist = haversine_np(glat[cand], glon[cand], plat[:, None], plon[:, None])
+    best = dist.argmin(axis=1)
+    rows = np.arange(len(plat))
+    idx = cand[rows, best]
+
+    out = panos.copy()
+    out["query_lat"] = glat[idx]
+    out["query_lon"] = glon[idx]
+    out["grid_id"] = df_grid["grid_id"].to_numpy()[idx]
+    out["distance_m"] = dist[rows, best]
+    return out
+
+
+def clean_planned_metadata(meta_data, df_grid):
+    """
+    cleaned metadata from a planned crawl, same columns / rule as filter_svi_metadata.py:
+    drop NaN year or month, one row per panoid, snapped to its nearest grid point
+    """
+    filtered = meta_data.dropna(subset=["year", "month"]).drop_duplicates("panoid")
+    cleaned = assign_nearest_grid(filtered, df_grid)
+    return cleaned[list(meta_data.columns)].reset_index(drop=True)
+
+
+def print_report(report):
+    print(f"📉 naive plan: {report['naive_calls']} calls, planned: {report['planned_calls']} calls "
+          f"(stride {report['stride']} + {report['edge']} edge + {report['boundary_fill']} fill-in centres), "
+          f"saved {report['calls_saved']} calls ({report['reduction']:.1f}x fewer)")
@@ -0,0 +1,90 @@
+'''
+incremental re-crawl of the Street View metadata: choose the cells worth re-querying from the existing outputs,
+then fold the new panoramas into the cleaned metadata.
+cells are selected by
+- recency: recency_months of the grid summary (analysis.py) at or above a threshold, plus cells that never had
+  a panorama (new coverage is what the fairness comparison is after)
+- checked_at: last time the crawl checkpoint queried the cell is older than a cutoff (never-queried cells too)
+- budget: a fixed number of cells per road_type, stalest first or at random with a fixed seed
+merging snaps the new rows to their nearest grid point (only the selected centres were queried, so the raw
+distance_m is not the nearest-grid distance), then keeps one row per panoid with the smallest distance_m, the rule
+of filter_svi_metadata.py; the minimum over (old cleaned rows + snapped new rows) is the minimum over all raw rows
+ever crawled, so no old raw csv is needed
+'''
+import time
+
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def select_by_recency(grid_ids, grid_summary, min_recency_months, include_uncovered=True):
+    """grid_ids whose latest panorama is at least min_recency_months old (grid_summary indexed by grid_id)"""
+    grid_ids = pd.Index(np.asarray(grid_ids))
+    recency = grid_summary["recency_months"].reindex(grid_ids)
+    stale = recency.to_numpy() >= min_recency_months
+    if include_uncovered:
+        stale |= recency.isna().to_numpy()
+    return grid_ids[stale].to_numpy()
+
+
+def select_by_checked_at(grid_ids, status_table, older_than_days, now=None):
+    """grid_ids last queried more than older_than_days ago, or never (status_table from CrawlCheckpoint)"""
+    now = time.time() if now is None else now
+    grid_ids = pd.Index(np.asarray(grid_ids))
+    checked_at = status_table.set_index("grid_id")["checked_at"].reindex(grid_ids)
+    stale = ~(checked_at.to_numpy() > now - older_than_days * SECONDS_PER_DAY)
+    return grid_ids[stale].to_numpy()
+
+
+def select_by_budget(grid_tags, budget, priority=None, seed=0):
+    """
+    up to budget cells per road_type (an int for every type, or {road_type: n}).
+    grid_tags has grid_id + road_type; priority (Series indexed by grid_id, higher first, e.g. recency_months)
+    picks the stalest cells, otherwise cells are sampled uniformly with a fixed seed
+    """
+    rng = np.random.default_rng(seed)
+    tags = grid_tags[["grid_id", "road_type"]].copy()
+    tags["road_type"] = tags["road_type"].astype(str)
+    if priority is not None:
+        # never-covered cells (NaN) first, then the largest priority
+        tags["priority"] = priority.reindex(tags["grid_id"]).fillna(np.inf).to_numpy()
+    else:
+        tags["priority"] = rng.random(len(tags))
+
+    picked = []
+    for road_type, group in tags.groupby("road_type", sort=True):
+        n = budget.get(road_type, 0) if isinstance(budget, dict) else budget
+        if n > 0:
+            picked.append(group.sort_values("priority", ascending=False, kind="stable")["grid_id"].to_numpy()[:n])
+    return np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
+
+
+def merge_recrawl(cleaned, new_raw, df_grid):
+    """
+    cleaned metadata updated with the rows of a re-crawl: NaN year / month dropped, then one row per panoid with
+    the smallest distance_m over old and new rows (old row kept on ties).
+    a re-crawl only queries some centres, so the nearest cell of a new panorama may not have been queried: the new
+    rows are first snapped to their nearest grid point of df_grid (query_planner.clean_planned_metadata), which is
+    the cell a full crawl would have given them.
+    returns (merged, stats)
+    """
+    from query_planner import clean_planned_metadata
+
+    new = clean_planned_metadata(new_raw, df_grid) if len(new_raw) else new_raw.dropna(subset=["year", "month"])
+    new = new[list(cleaned.columns)]
+
+    combined = pd.concat([cleaned, new], ignore_index=True)
+    merged = combined.loc[combined.groupby("panoid")["distance_m"].idxmin()]
+
+    old_grid = cleaned.set_index("panoid")["grid_id"]
+    new_grid = merged.set_index("panoid")["grid_id"]
+    known = new_grid.index.isin(old_grid.index)
+    stats = {
+        "new_rows": len(new),
+        "new_panos": int((~known).sum()),
+        "moved_panos": int((new_grid[known] != old_grid.reindex(new_grid.index[known])).sum()),
+        "total_panos": len(merged),
+    }
+    return merged, stats
@@ -0,0 +1,129 @@
+'''
+incremental refresh of the Glasgow Street View metadata (see recrawl.py).
+only the cells chosen by SELECT_BY are re-queried; their raw rows go to a per-refresh csv with its own
+checkpoint (so an interrupted refresh resumes), the crawl checkpoint's checked_at is updated for them, and the
+new panoramas are merged into glasgow_streetview_metadata_grid_20m_cleaned with the nearest-grid rule.
+rerun merge_svi_meta_with_osm_tag.py and analysis.py afterwards. when the cleaned table is a link published by
+the stage cache, it is left alone: the refresh csv (pipeline_stages.REFRESH_GLOB) is an input of the filter
+stage, and svi-fairness analyse folds it in. also `svi-fairness recrawl`
+'''
+# %%
+import os
+import time
+
+from storage import RESULTS_DIR
+
+# ============================================================
+# 1️⃣ settings
+# ============================================================
+STREETVIEW_PATH = os.environ.get(
+    "SVI_STREETVIEW",
+    '/mnt/home/2715439w/sharedscratch/svi_bias/tiles_to_pano/advanced_streetview_stitch/streetview_utils/streetview.py'
+)
+SELECT_BY = "recency"          # "recency" | "checked_at" | "budget"
+MIN_RECENCY_MONTHS = 24        # recency: cells whose latest panorama is at least this old
+INCLUDE_UNCOVERED = True       # recency: also cells that never had a panorama
+OLDER_THAN_DAYS = 180          # checked_at: cells not queried for this long
+BUDGET = {"drivable": 20000, "non-drivable": 10000, "no-road": 5000}  # budget: cells per road_type
+BUDGET_STALEST_FIRST = True    # budget: by recency_months (else uniform sample, fixed seed)
+LATTICE = False                # True: the generate_grids_27700.py tile directory (pipeline_stages.grid_names)
+SPACING = 20
+
+WORKERS = 8
+RATE_PER_SEC = 20
+RETRIES = 3
+SAVE_EVERY = 50
+
+
+def recrawl_metadata(results_dir=RESULTS_DIR, streetview_path=STREETVIEW_PATH, select_by=SELECT_BY,
+                     min_recency_months=MIN_RECENCY_MONTHS, include_uncovered=INCLUDE_UNCOVERED,
+                     older_than_days=OLDER_THAN_DAYS, budget=BUDGET, budget_stalest_first=BUDGET_STALEST_FIRST,
+                     spacing_m=SPACING, lattice=LATTICE, workers=WORKERS, rate=RATE_PER_SEC, retries=RETRIES,
+                     save_every=SAVE_EVERY, refresh_tag=None):
+    """
+    re-query the cells chosen by select_by into results_dir/<REFRESH_GLOB with refresh_tag> (one refresh per
+    month by default; rerunning in the same month resumes it). returns the refresh csv path
+    """
+    from checkpoint import CrawlCheckpoint
+    from grid_utils import load_grid
+    from pipeline_stages import CLEANED, GRID_TAGS, REFRESH_GLOB, SUMMARY, grid_names
+    from recrawl import merge_recrawl, select_by_budget, select_by_checked_at, select_by_recency
+    from storage import read_table, write_table
+    from svi_fetch import fetch_grid_metadata, load_streetview
+
+    grid_file, _, raw_file = grid_names(spacing_m, lattice)
+    refresh_csv = os.path.join(results_dir, REFRESH_GLOB.replace("*", refresh_tag or time.strftime("%Y%m")))
+    cleaned_path = os.path.join(results_dir, CLEANED)
+    # the crawl checkpoint sits next to the raw crawl (in the stage cache when the crawl is a published link)
+    raw_csv = os.path.realpath(os.path.join(results_dir, raw_file))
+
+    # ============================================================
+    # 2️⃣ select cells
+    # ============================================================
+    df_grid = load_grid(os.path.join(results_dir, grid_file), columns=["grid_id", "query_lat", "query_lon"])
+    crawl_checkpoint = CrawlCheckpoint(raw_csv.replace(".csv", "_checkpoint.sqlite"))
+
+    if select_by == "recency":
+        grid_summary = read_table(os.path.join(results_dir, SUMMARY)).set_index("grid_id")
+        selected = select_by_recency(df_grid["grid_id"], grid_summary, min_recency_months, include_uncovered)
+    elif select_by == "checked_at":
+        selected = select_by_checked_at(df_grid["grid_id"], crawl_checkpoint.status_table(), older_than_days)
+    elif select_by == "budget":
+        grid_tags = read_table(os.path.join(results_dir, GRID_TAGS), columns=["grid_id", "road_type"])
+        priority = None
+        if budget_stalest_first:
+            priority = read_table(os.path.join(results_dir, SUMMARY)).set_index("grid_id")["recency_months"]
+        selected = select_by_budget(grid_tags, budget, priority=priority)
+    else:
+        raise ValueError(f"unknown select_by {select_by!r}")
+    print(f"✅ {len(selected)} of {len(df_grid)} cells selected by {select_by}")
+
+    # ============================================================
+    # 3️⃣ fetch the selected cells (resumable per refresh)
+    # ============================================================
+    streetview = load_streetview(streetview_path)
+    refresh_checkpoint = CrawlCheckpoint(refresh_csv.replace(".csv", "_checkpoint.sqlite"))
+    done_set = refresh_checkpoint.finished_ids()
+    todo_grid = df_grid[df_grid["grid_id"].isin(selected) & ~df_grid["grid_id"].isin(done_set)]
+    todo = list(zip(todo_grid["grid_id"], todo_grid["query_lat"], todo_grid["query_lon"]))
+    print(f"🚀 fetching {len(todo)} points ({len(done_set)} already refreshed) with {workers} workers")
+
+    stats = fetch_grid_metadata(todo, streetview.panoids, refresh_csv, workers=workers, rate=rate,
+                                save_every=save_every, retries=retries, checkpoint=refresh_checkpoint)
+    print(f"✅ refresh fetch: {stats['done']} points done ({stats['empty']} empty), {stats['failed']} failed, "
+          f"{stats['rows']} rows in {stats['elapsed_s']:.0f}s")
+
+    # the crawl checkpoint records when each refreshed cell was last queried (drives select_by = "checked_at")
+    refreshed = refresh_checkpoint.status_table()
+    refreshed["error"] = refreshed["error"].astype(object).where(refreshed["error"].notna(), None)
+    crawl_checkpoint.mark(refreshed[["grid_id", "status", "n_panos", "error"]].itertuples(index=False, name=None))
+    refresh_checkpoint.close()
+    crawl_checkpoint.close()
+
+    # ============================================================
+    # 4️⃣ merge new panoramas into the cleaned metadata
+    # ============================================================
+    if os.path.islink(cleaned_path):
+        # published by the stage cache (svi_fairness.py / run_pipeline.py): the refresh csv is an input of the
+        # filter stage there, replacing the link with a file would hide the refresh from the cached merge stage
+        print(f"✅ {refresh_csv} is an input of the filter stage: run `svi-fairness analyse` to fold it in")
+        return refresh_csv
+
+    cleaned = read_table(cleaned_path)
+    new_raw = read_table(refresh_csv) if os.path.exists(refresh_csv) else cleaned.iloc[:0]
+    merged, merge_stats = merge_recrawl(cleaned, new_raw, df_grid)
+
+    # written next to the old file first, then swapped in, so a crash never leaves a half-written table
+    tmp_path = os.path.join(os.path.dirname(cleaned_path), "tmp_" + os.path.basename(cleaned_path))
+    write_table(merged, tmp_path)
+    os.replace(tmp_path, cleaned_path)
+    print(f"✅ cleaned metadata updated: {merge_stats['new_panos']} new panoramas, "
+          f"{merge_stats['moved_panos']} moved to a nearer grid, {merge_stats['total_panos']} in total -> "
+          f"{cleaned_path}")
+    return refresh_csv
+
+
+# %%
+if __name__ == "__main__":
+    recrawl_metadata()
+# %%
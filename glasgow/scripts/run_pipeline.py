@@ -0,0 +1,55 @@
+'''
+the whole pipeline (grid -> fetch -> filter, grid -> osm, merge -> analysis) through the stage cache
+(stage_cache.py, pipeline_stages.py): only stages whose inputs or parameters changed since the last run are
+recomputed, the metadata fetch and the OSM tagging run side by side, and the current outputs are linked into
+RESULTS_DIR under their usual names for the downstream scripts (fairness_analysis.py, spatial_analysis.py, ...).
+usage: python run_pipeline.py [stage ...] [--force stage ...] [--status]
+'''
+# %%
+import argparse
+import os
+
+from pipeline_stages import build_stages, refresh_paths
+from stage_cache import plan, publish, run_stages
+from storage import RESULTS_DIR
+
+BOUNDARY_PATH = "/mnt/home/2715439w/sharedscratch/fairness/glasgow/boundary/glasgow_boundary.geojson"
+PBF_PATH = "/mnt/home/2715439w/sharedscratch/fairness/glasgow/boundary/scotland-251101.osm.pbf"
+STREETVIEW_PATH = ('/mnt/home/2715439w/sharedscratch/svi_bias/tiles_to_pano/advanced_streetview_stitch/'
+                   'streetview_utils/streetview.py')
+CACHE_DIR = os.path.join(RESULTS_DIR, "stage_cache")
+OSM_CACHE_DIR = os.path.join(RESULTS_DIR, "osm_cache")
+
+# parameters: changing one makes its stage and everything downstream stale
+SPACING_M = 20         # grid spacing
+HALF = 10              # half-width (m) of the square cell around each centre for the OSM join
+SAVE_EVERY = 50        # grid points per csv flush of the crawl
+RETRIES = 3
+PLANNED_CRAWL = False  # as in filter_svi_metadata.py
+# options: speed / memory only
+FETCH_WORKERS = 8
+RATE_PER_SEC = 20
+OSM_WORKERS = 6
+STAGE_WORKERS = 2      # stages run at the same time (fetch next to osm)
+
+STAGES = build_stages(BOUNDARY_PATH, PBF_PATH, STREETVIEW_PATH, OSM_CACHE_DIR, spacing_m=SPACING_M, half=HALF,
+                      save_every=SAVE_EVERY, retries=RETRIES, planned_crawl=PLANNED_CRAWL,
+                      fetch_workers=FETCH_WORKERS, rate=RATE_PER_SEC, osm_workers=OSM_WORKERS,
+                      refresh=refresh_paths(RESULTS_DIR))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run the pipeline stages that are out of date")
+    parser.add_argument("targets", nargs="*", help="stages to bring up to date (default: all)")
+    parser.add_argument("--force", nargs="*", default=[], help="rerun these stages even when up to date")
+    parser.add_argument("--status", action="store_true", help="only print which stages are up to date")
+    args = parser.parse_args()
+
+    if args.status:
+        for name, state in plan(STAGES, CACHE_DIR).items():
+            print(f"{name:9s} {state.key}  {'up to date' if state.up_to_date else 'stale'}")
+    else:
+        states = run_stages(STAGES, CACHE_DIR, targets=args.targets or None, force=args.force,
+                            workers=STAGE_WORKERS)
+        linked = publish(STAGES, states, RESULTS_DIR)
+        print(f"✅ {len(linked)} outputs linked into {RESULTS_DIR}")
+# %%
@@ -0,0 +1,85 @@
+'''
+tile-parallel run of grid generation -> OSM tagging -> metadata assignment -> merge -> temporal summary over the
+EPSG:27700 lattice (see tile_pipeline.py). each tile runs in its own worker process; only tiles whose inputs
+changed since the last run are recomputed. the concatenated tables are written to PIPELINE_DIR under the same
+names as the single-process scripts produce.
+the crawl must be on the same lattice: step 0 brings the lattice grid + fetch stages of the stage cache
+(pipeline_stages.py with lattice, as `svi-fairness fetch --lattice`) up to date and links the crawl into
+RESULTS_DIR as RAW_METADATA; an interrupted crawl resumes there. a crawl already made with
+fetch_svi_metadata_glasgow.py (LATTICE = True) is a regular file under the same name and is used as it is
+'''
+# %%
+import os
+
+import geopandas as gpd
+
+from grid_utils import lattice_spec
+from osm_layers import ensure_osm_cache
+from pipeline_stages import build_stages, grid_names
+from stage_cache import publish, run_stages
+from storage import RESULTS_DIR, STORAGE_FORMAT, write_table
+from svi_dataset import write_svi_dataset
+from tile_pipeline import run_tiles
+
+BOUNDARY_PATH = "/mnt/home/2715439w/sharedscratch/fairness/glasgow/boundary/glasgow_boundary.geojson"
+PBF_PATH = "/mnt/home/2715439w/sharedscratch/fairness/glasgow/boundary/scotland-251101.osm.pbf"
+STREETVIEW_PATH = ('/mnt/home/2715439w/sharedscratch/svi_bias/tiles_to_pano/advanced_streetview_stitch/'
+                   'streetview_utils/streetview.py')
+CACHE_DIR = os.path.join(RESULTS_DIR, "stage_cache")
+OSM_CACHE_DIR = os.path.join(RESULTS_DIR, "osm_cache")
+PIPELINE_DIR = os.path.join(RESULTS_DIR, "tile_pipeline")
+
+SPACING = 20       # meter, lattice of the crawl and of the tiles
+RAW_METADATA = os.path.join(RESULTS_DIR, grid_names(SPACING, lattice=True)[2])
+TILE_ROWS = 25     # lattice rows per tile (500m bands): many more tiles than workers keeps the pool busy
+WORKERS = None     # None -> os.cpu_count()
+FORCE = False      # True -> recompute every tile
+
+OUTPUT_NAMES = {
+    "osm": "grid_with_osm_tags_roads",
+    "meta": "glasgow_streetview_metadata_grid_20m_cleaned",
+    "summary": "grid_summary",
+}
+
+if __name__ == "__main__":
+    # ============================================================
+    # 0️⃣ crawl on the lattice (stage cache: only reruns when the grid or the fetch parameters changed)
+    # ============================================================
+    if os.path.isfile(RAW_METADATA) and not os.path.islink(RAW_METADATA):
+        print(f"✅ lattice crawl (standalone fetch): {RAW_METADATA}")
+    else:
+        stages = build_stages(BOUNDARY_PATH, PBF_PATH, STREETVIEW_PATH, OSM_CACHE_DIR, spacing_m=SPACING,
+                              lattice=True)
+        publish(stages, run_stages(stages, CACHE_DIR, targets=["fetch"]), RESULTS_DIR)
+        print(f"✅ lattice crawl (stage cache): {RAW_METADATA}")
+
+    # ============================================================
+    # 1️⃣ boundary, lattice and OSM layer cache
+    # ============================================================
+    boundary = gpd.read_file(BOUNDARY_PATH)
+    boundary_27700 = boundary.to_crs(27700)
+    poly_27700 = boundary_27700.union_all()
+    spec = lattice_spec(boundary_27700.total_bounds, spacing_m=SPACING, tile_rows=TILE_ROWS)
+    print(f"lattice: {spec['n_rows']} rows x {spec['n_cols']} cols of {SPACING}m, {TILE_ROWS} rows per tile")
+
+    # workers read the cached GeoParquet layers, the PBF is only parsed on a cache miss
+    layer_dir = ensure_osm_cache(PBF_PATH, boundary.to_crs(4326).geometry.iloc[0], OSM_CACHE_DIR)
+
+    # ============================================================
+    # 2️⃣ tiles
+    # ============================================================
+    outputs, stats = run_tiles(poly_27700, spec, layer_dir, RAW_METADATA, PIPELINE_DIR,
+                               workers=WORKERS, force=FORCE)
+    print(f"✅ {stats['rerun']}/{stats['tiles']} tiles recomputed in {stats['elapsed_s']:.1f}s")
+
+    # ============================================================
+    # 3️⃣ merged outputs
+    # ============================================================
+    for name, stem in OUTPUT_NAMES.items():
+        df = outputs[name].reset_index() if name == "summary" else outputs[name]
+        path = write_table(df, os.path.join(PIPELINE_DIR, f"{stem}.{STORAGE_FORMAT}"))
+        print(f"✅ {name}: {len(df)} rows -> {path}")
+    # merged table as grid + panorama tables, like merge_svi_meta_with_osm_tag.py
+    merged_dir = write_svi_dataset(outputs["osm"], outputs["meta"], os.path.join(PIPELINE_DIR, "merged_svi_osm"))
+    print(f"✅ merged: grid + panorama tables -> {merged_dir}")
+# %%
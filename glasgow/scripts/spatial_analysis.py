@@ -0,0 +1,70 @@
+'''
+neighbourhood coverage and spatial autocorrelation of n_panos and recency_months on the grid (lattice_stats.py),
+from the grid_summary written by analysis.py.
+writes grid_neighbourhood (window coverage per cell) and grid_lisa (local Moran per cell and field) and prints
+the global Moran's I of each field. also `svi-fairness spatial`
+'''
+# %%
+import os
+import time
+
+from profiling import stage
+from storage import RESULTS_DIR, STORAGE_FORMAT
+
+FIELDS = ["n_panos", "recency_months"]
+WINDOW_RADIUS = 2      # cells: 5 x 5 window (100m) for the local coverage
+KERNEL_RADIUS = 1      # Moran / LISA neighbours: the 8 adjacent cells (queen)
+N_PERM = 999
+SEED = 0
+LATTICE = False        # True: the generate_grids_27700.py tile directory (pipeline_stages.grid_names)
+SPACING = 20
+
+
+def spatial_analysis(results_dir=RESULTS_DIR, spacing_m=SPACING, lattice=LATTICE, fields=FIELDS,
+                     window_radius=WINDOW_RADIUS, n_perm=N_PERM, seed=SEED):
+    """neighbourhood coverage + global / local Moran on the outputs in results_dir, written back next to them"""
+    import pandas as pd
+
+    from grid_utils import load_grid, read_lattice_spec
+    from lattice_stats import global_moran, lattice_from_grid, local_moran, neighbourhood_coverage, window_kernel
+    from pipeline_stages import SUMMARY, grid_names
+    from storage import read_table, write_table
+
+    grid_path = os.path.join(results_dir, grid_names(spacing_m, lattice)[0])
+    grid = load_grid(grid_path, columns=["grid_id", "query_lat", "query_lon"])
+    # tile directories carry the lattice spec (grid_id = row * n_cols + col); a single table is indexed by its steps
+    spec = read_lattice_spec(grid_path) if os.path.isdir(grid_path) else None
+    lat = lattice_from_grid(grid, spec)
+    grid_summary = read_table(os.path.join(results_dir, SUMMARY)).set_index("grid_id")
+    print(f"{len(grid)} cells on a {lat.shape[0]} x {lat.shape[1]} lattice")
+
+    with stage("neighbourhood_coverage", rows_in=len(grid)):
+        neighbourhood = neighbourhood_coverage(lat, grid_summary, radius=window_radius)
+    write_table(neighbourhood.reset_index(), os.path.join(results_dir, f"grid_neighbourhood.{STORAGE_FORMAT}"))
+    print(f"✅ local coverage over {2 * window_radius + 1}x{2 * window_radius + 1} windows")
+
+    kernel = window_kernel(KERNEL_RADIUS, "queen")
+    lisa_parts = []
+    for field in fields:
+        values = grid_summary[field].reindex(lat.grid_ids).to_numpy(dtype=float)
+        if field == "n_panos":
+            values = pd.Series(values).fillna(0).to_numpy()  # cells missing from the summary have no panoramas
+        t0 = time.perf_counter()
+        with stage("global_moran", rows_in=len(values), field=field, n_perm=n_perm):
+            moran = global_moran(lat, values, kernel=kernel, n_perm=n_perm, seed=seed)
+        with stage("local_moran", rows_in=len(values), field=field, n_perm=n_perm):
+            lisa = local_moran(lat, values, kernel=kernel, n_perm=n_perm, seed=seed)
+        print(f"{field}: Moran's I {moran['I']:.4f} (p_sim {moran['p_sim']:.4f}, n {moran['n']}), "
+              f"{(lisa['p_sim'] < 0.05).sum()} significant LISA cells, {time.perf_counter() - t0:.1f}s")
+        lisa_parts.append(lisa.reset_index().assign(field=field))
+
+    lisa = pd.concat(lisa_parts, ignore_index=True)
+    write_table(lisa, os.path.join(results_dir, f"grid_lisa.{STORAGE_FORMAT}"))
+    print("✅ saved grid_neighbourhood and grid_lisa")
+    return neighbourhood, lisa
+
+
+# %%
+if __name__ == "__main__":
+    spatial_analysis()
+# %%
@@ -0,0 +1,131 @@
+'''
+tiled, memory-bounded OSM layer x grid join (EPSG:27700).
+the grid is partitioned into square spatial tiles; every layer is projected once and indexed once in a shapely
+STRtree, which is then queried tile by tile with that tile's cells. each tile's join rows (grid_id, layer and
+only the attribute columns asked for, no geometry) are written straight to disk as join_XXXXX.parquet next to a
+join.json manifest, so the joined result of a whole city never sits in memory at once. later steps read it back
+with read_joined (column projection + filters per tile)
+'''
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from profiling import record, stage
+from storage import STORAGE_FORMAT, read_table, write_table
+
+JOIN_TILE_M = 2000  # tile edge in metres: 100 x 100 cells of 20m
+
+
+class LayerIndex:
+    """one OSM layer ready for tiled joins: STRtree over its 27700 geometries + the kept attribute columns"""
+
+    def __init__(self, name, gdf_27700, columns):
+        self.name = name
+        geoms = gdf_27700.geometry.to_numpy()
+        self.tree = shapely.STRtree(geoms)
+        self.attrs = gdf_27700[[c for c in columns if c in gdf_27700.columns]].reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.attrs)
+
+    def join(self, cells, grid_ids):
+        """rows of (grid_id, layer, attrs...) for every (feature, cell) pair that intersects"""
+        cell_idx, feat_idx = self.tree.query(cells, predicate="intersects")
+        out = self.attrs.take(feat_idx).reset_index(drop=True)
+        out.insert(0, "grid_id", grid_ids[cell_idx])
+        out.insert(1, "layer", self.name)
+        return out
+
+
+def grid_tiles(cells, tile_m=JOIN_TILE_M):
+    """square tile index of every cell, from its lower-left corner (cells is an array of 27700 geometries)"""
+    bounds = shapely.bounds(cells)
+    x0, y0 = np.nanmin(bounds[:, 0]), np.nanmin(bounds[:, 1])
+    tx = ((bounds[:, 0] - x0) // tile_m).astype(np.int64)
+    ty = ((bounds[:, 1] - y0) // tile_m).astype(np.int64)
+    return ty * (tx.max() + 1) + tx
+
+
+def join_filename(tile, fmt=STORAGE_FORMAT):
+    return f"join_{tile:05d}.{fmt}"
+
+
+def tiled_sjoin(grid_27700, layer_indexes, out_dir, tile_m=JOIN_TILE_M, columns=None, verbose=True):
+    """
+    join every layer in layer_indexes against grid_27700 (GeoDataFrame with grid_id) one tile at a time and
+    stream the rows to out_dir. columns fixes the attribute schema of every tile file (default: union of the
+    layers' kept columns). returns the number of joined rows
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for f in os.listdir(out_dir):
+        if f.startswith("join_") or f == "join.json":
+            os.remove(os.path.join(out_dir, f))
+
+    if columns is None:
+        columns = list(dict.fromkeys(c for li in layer_indexes for c in li.attrs.columns))
+    schema = ["grid_id", "layer"] + list(columns)
+
+    cells = grid_27700.geometry.to_numpy()
+    grid_ids = grid_27700["grid_id"].to_numpy()
+    tiles = grid_tiles(cells, tile_m)
+    order = np.argsort(tiles, kind="stable")
+    tile_ids, starts = np.unique(tiles[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    t0 = time.perf_counter()
+    manifest = {"tile_m": tile_m, "columns": schema, "tiles": []}
+    n_rows = 0
+    # per layer: (query seconds, joined rows) summed over tiles
+    layer_time = {li.name: [0.0, 0] for li in layer_indexes}
+    write_s = 0.0
+    with stage("tiled_sjoin", rows_in=len(cells), tiles=len(tile_ids)) as st:
+        for tile, s, e in zip(tile_ids, starts, ends):
+            sel = order[s:e]
+            parts = []
+            for li in layer_indexes:
+                t_layer = time.perf_counter()
+                parts.append(li.join(cells[sel], grid_ids[sel]))
+                layer_time[li.name][0] += time.perf_counter() - t_layer
+                layer_time[li.name][1] += len(parts[-1])
+            parts = [p for p in parts if len(p)]
+            if not parts:
+                continue
+            t_write = time.perf_counter()
+            df = pd.concat(parts, ignore_index=True).reindex(columns=schema)
+            write_table(df, os.path.join(out_dir, join_filename(int(tile))), categorical=["layer"])
+            write_s += time.perf_counter() - t_write
+            manifest["tiles"].append({"tile": int(tile), "file": join_filename(int(tile)), "n_rows": len(df)})
+            n_rows += len(df)
+
+        # manifest written last: a directory without it is an incomplete join
+        with open(os.path.join(out_dir, "join.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        for name, (seconds, rows) in layer_time.items():
+            record(name, seconds, rows_in=len(cells), rows_out=rows)
+        record("write", write_s, rows_out=n_rows)
+        st.rows_out = n_rows
+    if verbose:
+        print(f"✅ tiled join: {len(tile_ids)} tiles of {tile_m}m, {len(manifest['tiles'])} with hits, "
+              f"{n_rows} rows in {time.perf_counter() - t0:.1f}s -> {out_dir}")
+    return n_rows
+
+
+def iter_joined(out_dir, columns=None, filters=None):
+    """stream the join written by tiled_sjoin one tile at a time: yields (tile, DataFrame)"""
+    with open(os.path.join(out_dir, "join.json")) as f:
+        manifest = json.load(f)
+    for t in manifest["tiles"]:
+        yield t["tile"], read_table(os.path.join(out_dir, t["file"]), columns=columns, filters=filters)
+
+
+def read_joined(out_dir, columns=None, filters=None):
+    """the join written by tiled_sjoin as one frame (only the columns / rows asked for)"""
+    parts = [df for _, df in iter_joined(out_dir, columns=columns, filters=filters)]
+    if not parts:
+        with open(os.path.join(out_dir, "join.json")) as f:
+            return pd.DataFrame(columns=columns or json.load(f)["columns"])
+    return pd.concat(parts, ignore_index=True)
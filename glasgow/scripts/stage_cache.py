@@ -0,0 +1,264 @@
+'''
+content-addressed stage cache and DAG runner for the pipeline (pipeline_stages.py declares the stages).
+a stage has upstream stages (deps), external input files, parameters and the output files it creates. its key
+is a hash of its name, version and parameters, the content hash of its input files and the keys of its deps,
+so every key is known before anything runs and a changed parameter (e.g. the OSM cell half-width) makes the
+stage and everything downstream stale. outputs live in cache_dir/<stage>/<key>/: a stage whose directory
+exists is up to date and skipped. a run goes to <key>.partial first and is renamed into place once it
+succeeds; resumable stages (the crawl) keep their partial directory after a failure and continue from it.
+stages whose deps are done run concurrently in a thread pool (e.g. the metadata fetch next to OSM tagging)
+'''
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple
+
+from file_hash import file_sha256
+from profiling import stage
+
+MANIFEST = "stage.json"
+DIGESTS = "digests.json"
+
+
+class PipelineStage(NamedTuple):
+    """
+    fn(inputs, params, out_dir) runs the stage: inputs maps each dep to its output directory and each file
+    input to its path; it writes outputs into out_dir and may return a dict of counters for the manifest.
+    options are passed to fn with params but do not enter the key (workers, rates, verbosity)
+    """
+    name: str
+    fn: Callable
+    deps: tuple = ()
+    files: dict = {}
+    params: dict = {}
+    outputs: tuple = ()
+    options: dict = {}
+    version: int = 1
+    resumable: bool = False
+
+
+class StageState(NamedTuple):
+    key: str
+    out_dir: str
+    up_to_date: bool
+
+
+def _path_stat(path):
+    """(size, mtime_ns) of a file, or summed over the files of a directory"""
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    size = mtime = 0
+    for root, _, names in os.walk(path):
+        for n in names:
+            st = os.stat(os.path.join(root, n))
+            size += st.st_size
+            mtime = max(mtime, st.st_mtime_ns)
+    return size, mtime
+
+
+def _content_hash(path):
+    if not os.path.isdir(path):
+        return file_sha256(path)
+    h = hashlib.sha256()
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for n in sorted(names):
+            full = os.path.join(root, n)
+            h.update(os.path.relpath(full, path).encode())
+            h.update(file_sha256(full).encode())
+    return h.hexdigest()
+
+
+class DigestCache:
+    """content hashes of input files, recomputed only when a file's size or mtime changes (large PBFs)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def digest(self, path):
+        path = os.path.abspath(path)
+        stat = list(_path_stat(path))
+        entry = self.entries.get(path)
+        if entry is None or entry["stat"] != stat:
+            entry = self.entries[path] = {"stat": stat, "sha256": _content_hash(path)}
+        return entry["sha256"]
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def toposort(stages):
+    """stages in dependency order; raises on unknown deps and cycles"""
+    by_name = {s.name: s for s in stages}
+    order, state = [], {}
+
+    def visit(name, chain):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "open":
+            raise ValueError(f"dependency cycle: {' -> '.join(chain + [name])}")
+        if name not in by_name:
+            raise ValueError(f"unknown stage {name!r} (required by {chain[-1] if chain else None})")
+        state[name] = "open"
+        for d in by_name[name].deps:
+            visit(d, chain + [name])
+        state[name] = "done"
+        order.append(by_name[name])
+
+    for s in stages:
+        visit(s.name, [])
+    return order
+
+
+def stage_key(st, dep_keys, digests):
+    for k, p in st.files.items():
+        if not os.path.exists(p):
+            raise FileNotFoundError(f"input {k!r} of stage {st.name}: {p} does not exist")
+    payload = {
+        "name": st.name,
+        "version": st.version,
+        # 20 and 20.0 are the same spacing: integral floats are keyed as ints
+        "params": {k: int(v) if isinstance(v, float) and v.is_integer() else v for k, v in st.params.items()},
+        "deps": {d: dep_keys[d] for d in st.deps},
+        "files": {k: digests.digest(p) for k, p in sorted(st.files.items())},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def upstream(stages, targets=None):
+    """names of targets (all stages by default) and of every stage they depend on"""
+    by_name = {s.name: s for s in stages}
+    wanted = set()
+
+    def collect(name):
+        if name not in wanted:
+            wanted.add(name)
+            for d in by_name[name].deps:
+                collect(d)
+
+    for t in targets or by_name:
+        if t not in by_name:
+            raise ValueError(f"unknown stage {t!r}")
+        collect(t)
+    return wanted
+
+
+def plan(stages, cache_dir, targets=None):
+    """
+    {stage name: StageState(key, out_dir, up_to_date)} in dependency order, without running anything.
+    only targets and their upstream stages are keyed, so a missing input of an unrelated stage (the PBF for
+    svi-fairness grid) does not matter
+    """
+    wanted = upstream(stages, targets)
+    digests = DigestCache(os.path.join(cache_dir, DIGESTS))
+    states = {}
+    for st in toposort(stages):
+        if st.name not in wanted:
+            continue
+        key = stage_key(st, {d: states[d].key for d in st.deps}, digests)
+        out_dir = os.path.join(cache_dir, st.name, key)
+        states[st.name] = StageState(key, out_dir, os.path.exists(os.path.join(out_dir, MANIFEST)))
+    digests.save()
+    return states
+
+
+def _needed(stages, states, force):
+    """stages of states that have to run: stale or forced ones, plus everything downstream of them"""
+    run = set()
+    for st in toposort(stages):
+        if st.name in states and (not states[st.name].up_to_date or st.name in force
+                                  or any(d in run for d in st.deps)):
+            run.add(st.name)
+    return run
+
+
+def _run_one(st, inputs, state):
+    partial = f"{state.out_dir}.partial"
+    if os.path.exists(partial) and not st.resumable:
+        shutil.rmtree(partial)
+    os.makedirs(partial, exist_ok=True)
+    t0 = time.perf_counter()
+    with stage(st.name, key=state.key):
+        info = st.fn(inputs, {**st.params, **st.options}, partial) or {}
+    missing = [o for o in st.outputs if not os.path.exists(os.path.join(partial, o))]
+    if missing:
+        raise RuntimeError(f"stage {st.name} did not write {missing}")
+    manifest = {"stage": st.name, "key": state.key, "version": st.version, "params": st.params,
+                "deps": list(st.deps), "files": st.files, "outputs": list(st.outputs),
+                "elapsed_s": time.perf_counter() - t0, "finished_at": time.time(), **info}
+    with open(os.path.join(partial, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    if os.path.exists(state.out_dir):  # forced rerun
+        shutil.rmtree(state.out_dir)
+    os.replace(partial, state.out_dir)
+    return manifest
+
+
+def run_stages(stages, cache_dir, targets=None, force=(), workers=2, verbose=True):
+    """
+    bring targets (all stages by default) up to date: stale stages (or the forced ones) and their downstream
+    stages run as soon as their deps are done, up to workers at a time. returns the plan states of targets and
+    their upstream stages
+    """
+    states = plan(stages, cache_dir, targets)
+    by_name = {s.name: s for s in stages}
+    todo = _needed(stages, states, set(force))
+    if verbose:
+        for name, state in states.items():
+            label = "run" if name in todo else "up to date"
+            print(f"{name:9s} {state.key}  {label}")
+
+    def inputs_of(st):
+        return {**{d: states[d].out_dir for d in st.deps}, **st.files}
+
+    done = {n for n in states if n not in todo}
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while todo - done:
+            for name in sorted(todo - done - set(pending.values())):
+                st = by_name[name]
+                if all(d in done for d in st.deps):
+                    pending[pool.submit(_run_one, st, inputs_of(st), states[name])] = name
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = pending.pop(fut)
+                manifest = fut.result()  # a failed stage stops the run (stages already running finish)
+                done.add(name)
+                states[name] = states[name]._replace(up_to_date=True)
+                if verbose:
+                    print(f"✅ {name} done in {manifest['elapsed_s']:.1f}s -> {states[name].out_dir}")
+    return states
+
+
+def publish(stages, states, results_dir):
+    """
+    point results_dir/<output> at the cached outputs (symlinks), so the standalone scripts read the current
+    ones. existing regular files are left alone
+    """
+    linked = []
+    for st in stages:
+        state = states.get(st.name)
+        if state is None or not state.up_to_date:
+            continue
+        for out in st.outputs:
+            dst = os.path.join(results_dir, out)
+            if os.path.exists(dst) and not os.path.islink(dst):
+                print(f"⚠️ {dst} is not a link to the stage cache, not replaced")
+                continue
+            tmp = f"{dst}.{os.getpid()}.link"
+            os.symlink(os.path.join(state.out_dir, out), tmp)
+            os.replace(tmp, dst)
+            linked.append(dst)
+    return linked
@@ -0,0 +1,108 @@
+'''
+storage layer shared by the pipeline scripts.
+intermediate tables are written as typed, zstd-compressed Parquet (GeoParquet for GeoDataFrames), with native
+list columns for tag_key_list / tag_value_list and categorical road_type / grid_highway. reads support column
+projection and predicate pushdown (pyarrow filters), so later stages only load what they use.
+csv paths are still read and written the old way, so existing results keep working
+'''
+import ast
+import os
+
+RESULTS_DIR = os.environ.get("SVI_RESULTS_DIR", "/mnt/home/2715439w/sharedscratch/fairness/glasgow/results")
+STORAGE_FORMAT = os.environ.get("SVI_STORAGE_FORMAT", "parquet")  # "parquet" or "csv"
+
+LIST_COLUMNS = ["tag_key_list", "tag_value_list"]
+CATEGORICAL_COLUMNS = ["road_type", "grid_highway"]
+COMPRESSION = "zstd"
+
+
+def result_path(stem, fmt=None):
+    """path of an intermediate result, e.g. result_path("glasgow_grid_20m") -> RESULTS_DIR/glasgow_grid_20m.parquet"""
+    return os.path.join(RESULTS_DIR, f"{stem}.{fmt or STORAGE_FORMAT}")
+
+
+def is_parquet(path):
+    return str(path).endswith((".parquet", ".pq"))
+
+
+def _parse_list(value):
+    if isinstance(value, str) and value.startswith("["):
+        return ast.literal_eval(value)
+    return value
+
+
+def write_table(df, path, categorical=CATEGORICAL_COLUMNS):
+    """write df to path (.parquet or .csv); categorical columns present in df are dictionary-encoded"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if not is_parquet(path):
+        df.to_csv(path, index=False)
+        return path
+
+    df = df.copy()
+    for c in categorical:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    # GeoDataFrame.to_parquet writes GeoParquet (geometry as WKB + crs metadata)
+    df.to_parquet(path, index=False, compression=COMPRESSION)
+    return path
+
+
+def read_table(path, columns=None, filters=None):
+    """
+    read a table written by write_table (or a legacy csv).
+    - columns: only load these columns (projection)
+    - filters: pyarrow-style predicates, e.g. [("road_type", "==", "drivable")], pushed down to the
+      parquet reader (applied after loading for csv)
+    """
+    import pandas as pd  # imported on first read, so importing storage (e.g. for RESULTS_DIR) stays cheap
+
+    if is_parquet(path):
+        return pd.read_parquet(path, columns=columns, filters=filters, engine="pyarrow")
+
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + [f[0] for f in filters or []]))
+    df = pd.read_csv(path, usecols=usecols)
+    for c in LIST_COLUMNS:
+        if c in df.columns:
+            df[c] = df[c].map(_parse_list)
+    if filters:
+        df = df[_filter_mask(df, filters)].reset_index(drop=True)
+        if columns is not None:
+            df = df[list(columns)]
+    return df
+
+
+def _filter_mask(df, filters):
+    import pandas as pd
+
+    mask = pd.Series(True, index=df.index)
+    for col, op, value in filters:
+        s = df[col]
+        if op in ("=", "=="):
+            m = s == value
+        elif op == "!=":
+            m = s != value
+        elif op == "<":
+            m = s < value
+        elif op == "<=":
+            m = s <= value
+        elif op == ">":
+            m = s > value
+        elif op == ">=":
+            m = s >= value
+        elif op == "in":
+            m = s.isin(value)
+        elif op == "not in":
+            m = ~s.isin(value)
+        else:
+            raise ValueError(f"unsupported filter operator {op!r}")
+        mask &= m
+    return mask
+
+
+def read_geo_table(path, columns=None, filters=None):
+    """read a GeoParquet file written from a GeoDataFrame"""
+    import geopandas as gpd
+
+    return gpd.read_parquet(path, columns=columns, filters=filters)
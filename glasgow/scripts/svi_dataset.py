@@ -0,0 +1,176 @@
+'''
+the merged SVI x OSM dataset as two normalized tables joined on grid_id, instead of one wide merged_svi_osm
+table that repeats every per-grid column (tag lists included) on each panorama row:
+- grid.parquet  (dimension, one row per grid): grid_id int32 (int64 when an id does not fit), query_lat /
+  query_lon float32, road_type and grid_highway categorical, n_tags / unique_keys int16, tag_key_list /
+  tag_value_list
+- panos.parquet (fact, one row per panorama, sorted by grid_id): grid_id (same width as in grid.parquet), panoid,
+  lat / lon float32, ym int16 (= year * 12 + month, the month index of temporal_metrics), distance_m float32
+SVIDataset loads columns only when they are asked for (tag lists as Arrow list arrays rather than one Python
+list per row) and builds the joined view (same rows and order as the old left merge of the grid table with the
+metadata) from integer positions, with date / year / month derived from ym on demand
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from storage import LIST_COLUMNS, read_table, write_table
+
+GRID_DTYPES = {
+    "grid_id": "int32",
+    "query_lat": "float32",
+    "query_lon": "float32",
+    "road_type": "category",
+    "grid_highway": "category",
+    "n_tags": "int16",
+    "unique_keys": "int16",
+}
+PANO_DTYPES = {
+    "grid_id": "int32",
+    "lat": "float32",
+    "lon": "float32",
+    "ym": "int16",
+    "distance_m": "float32",
+}
+DERIVED_COLUMNS = ["year", "month", "date"]  # computed from ym
+
+
+def pack_month(year, month):
+    return (np.asarray(year, dtype=np.int64) * 12 + np.asarray(month, dtype=np.int64)).astype(np.int16)
+
+
+def unpack_month(ym):
+    ym = np.asarray(ym, dtype=np.int64)
+    return (ym - 1) // 12, (ym - 1) % 12 + 1
+
+
+def grid_id_dtype(*grid_ids):
+    """
+    int32 when every id fits, else int64 (.astype would wrap silently): 27700 lattice ids are row * n_cols + col
+    and pass 2**31 for large extents or fine spacings
+    """
+    info = np.iinfo(np.int32)
+    fits = all(len(g) == 0 or (g.min() >= info.min and g.max() <= info.max) for g in map(np.asarray, grid_ids))
+    return "int32" if fits else "int64"
+
+
+def write_svi_dataset(osm_tags, svi_meta, out_dir):
+    """write the grid dimension (from grid_with_osm_tags_roads) and panorama fact (from the cleaned metadata)"""
+    os.makedirs(out_dir, exist_ok=True)
+    svi_meta = svi_meta.dropna(subset=["year", "month"])
+    id_dtype = grid_id_dtype(osm_tags["grid_id"], svi_meta["grid_id"])
+    dtypes = {**GRID_DTYPES, "grid_id": id_dtype}
+    grid = osm_tags.astype({c: t for c, t in dtypes.items() if c in osm_tags.columns})
+    panos = pd.DataFrame({
+        "grid_id": svi_meta["grid_id"].to_numpy(),
+        "panoid": svi_meta["panoid"].to_numpy(),
+        "lat": svi_meta["lat"].to_numpy(),
+        "lon": svi_meta["lon"].to_numpy(),
+        "ym": pack_month(svi_meta["year"], svi_meta["month"]),
+        "distance_m": svi_meta["distance_m"].to_numpy(),
+    }).astype({**PANO_DTYPES, "grid_id": id_dtype})
+    # stable: a grid's panoramas keep their metadata order, and the join index needs no sort
+    panos = panos.sort_values("grid_id", kind="stable", ignore_index=True)
+
+    write_table(grid, os.path.join(out_dir, "grid.parquet"), categorical=["road_type", "grid_highway"])
+    write_table(panos, os.path.join(out_dir, "panos.parquet"), categorical=[])
+    with open(os.path.join(out_dir, "dataset.json"), "w") as f:
+        json.dump({"grid": list(grid.columns), "panos": list(panos.columns), "n_grids": len(grid),
+                   "n_panos": len(panos)}, f, indent=2)
+    return out_dir
+
+
+class SVIDataset:
+    """lazy reader of a directory written by write_svi_dataset"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "dataset.json")) as f:
+            self.meta = json.load(f)
+        self._tables = {"grid": pd.DataFrame(), "panos": pd.DataFrame()}
+        self._index = None
+
+    def _load(self, table, columns):
+        """columns of grid / panos, reading only the ones not loaded yet"""
+        have = self._tables[table]
+        missing = [c for c in columns if c not in have.columns]
+        if missing:
+            path = os.path.join(self.path, f"{table}.parquet")
+            lists = [c for c in missing if c in LIST_COLUMNS]
+            parts = []
+            if len(lists) < len(missing):
+                parts.append(read_table(path, columns=[c for c in missing if c not in lists]))
+            if lists:
+                parts.append(pd.read_parquet(path, columns=lists, dtype_backend="pyarrow"))
+            new = pd.concat(parts, axis=1)
+            dtypes = GRID_DTYPES if table == "grid" else PANO_DTYPES
+            # grid_id keeps the width it was written with (grid_id_dtype)
+            new = new.astype({c: t for c, t in dtypes.items() if c in new.columns and c != "grid_id"})
+            have = new if have.empty else pd.concat([have, new], axis=1)
+            self._tables[table] = have
+        return have[list(columns)]
+
+    def grid(self, columns=None):
+        return self._load("grid", columns or self.meta["grid"])
+
+    def panos(self, columns=None):
+        return self._load("panos", columns or self.meta["panos"])
+
+    def _join_index(self):
+        """(grid row, pano row or -1) per joined row: every grid, its panoramas in table order, else one empty row"""
+        if self._index is None:
+            grid_ids = self.grid(["grid_id"])["grid_id"].to_numpy()
+            pano_grid = self.panos(["grid_id"])["grid_id"].to_numpy()
+            # written sorted by grid_id; tables from elsewhere get a stable sort
+            order = np.arange(len(pano_grid))
+            if np.any(pano_grid[1:] < pano_grid[:-1]):
+                order = np.argsort(pano_grid, kind="stable")
+            sorted_ids = pano_grid[order]
+            starts = np.searchsorted(sorted_ids, grid_ids, side="left")
+            counts = np.searchsorted(sorted_ids, grid_ids, side="right") - starts
+            n_rows = np.maximum(counts, 1)
+            grid_rows = np.repeat(np.arange(len(grid_ids)), n_rows)
+            offset = np.arange(len(grid_rows)) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+            pano_rows = np.full(len(grid_rows), -1, dtype=np.int64)
+            hit = np.repeat(counts, n_rows) > 0
+            pano_rows[hit] = order[(np.repeat(starts, n_rows) + offset)[hit]]
+            self._index = grid_rows, pano_rows
+        return self._index
+
+    def joined(self, columns=None):
+        """
+        the merged table (grid columns + panorama columns, joined on grid_id) with only the columns asked for.
+        date / year / month come from ym; grids without panoramas have one row with missing panorama fields
+        """
+        columns = list(columns or self.meta["grid"] + [c for c in self.meta["panos"] if c != "grid_id"]
+                       + DERIVED_COLUMNS)
+        grid_rows, pano_rows = self._join_index()
+        has_pano = pano_rows >= 0
+        out = {}
+        for c in columns:
+            if c in self.meta["grid"]:
+                out[c] = self.grid([c])[c].array.take(grid_rows)
+            elif c in DERIVED_COLUMNS:
+                ym = self.panos(["ym"])["ym"].to_numpy()
+                year, month = unpack_month(np.where(has_pano, ym[np.maximum(pano_rows, 0)], 1970 * 12 + 1))
+                if c == "date":
+                    # first day of the month, as the merge used to build it from "year-month"
+                    months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]").astype("datetime64[ns]")
+                    out[c] = pd.Series(months).where(has_pano).array
+                else:
+                    out[c] = np.where(has_pano, year if c == "year" else month, np.nan).astype(np.float32)
+            elif c in self.meta["panos"]:
+                out[c] = self.panos([c])[c].array.take(pano_rows, allow_fill=True)
+            else:
+                raise KeyError(c)
+        return pd.DataFrame(out)
+
+    def memory_usage(self):
+        """bytes held by the loaded columns of both tables"""
+        return int(sum(t.memory_usage(deep=True).sum() for t in self._tables.values()))
+
+
+def load_svi_dataset(path):
+    return SVIDataset(path)
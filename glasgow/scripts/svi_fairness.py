@@ -0,0 +1,170 @@
+'''
+command line entry point of the pipeline (glasgow/bin/svi-fairness):
+    svi-fairness grid|fetch|filter|osm|merge|analyse [options]   bring one stage up to date
+    svi-fairness status [options]                                  which stages are up to date
+    svi-fairness recrawl|fairness|spatial [options]                 the analyses on top of the stage outputs
+a stage command runs the stage through the stage cache (stage_cache.py, pipeline_stages.py): its deps are
+brought up to date first, an up-to-date stage is skipped (--force reruns it), and the current outputs are linked
+into the results directory under their usual names. inputs, parameters and the results / cache directories are
+options, defaulting to the SVI_* environment variables and then the cluster paths.
+recrawl, fairness and spatial are not cached stages: they bring analyse up to date, link the outputs and run
+recrawl_svi_metadata_glasgow.py / fairness_analysis.py / spatial_analysis.py on the results directory.
+only argparse / os / sys are imported here and the stage modules import their heavy dependencies inside the
+stage functions, so --help and status start in well under a second and e.g. filter never loads geopandas
+'''
+import argparse
+import os
+import sys
+
+CLUSTER_DIR = "/mnt/home/2715439w/sharedscratch"
+DEFAULT_BOUNDARY = os.environ.get("SVI_BOUNDARY", f"{CLUSTER_DIR}/fairness/glasgow/boundary/glasgow_boundary.geojson")
+DEFAULT_PBF = os.environ.get("SVI_PBF", f"{CLUSTER_DIR}/fairness/glasgow/boundary/scotland-251101.osm.pbf")
+DEFAULT_STREETVIEW = os.environ.get(
+    "SVI_STREETVIEW",
+    f"{CLUSTER_DIR}/svi_bias/tiles_to_pano/advanced_streetview_stitch/streetview_utils/streetview.py",
+)
+
+# command -> stage name (pipeline_stages.build_stages)
+COMMANDS = {
+    "grid": "grid",
+    "fetch": "fetch",
+    "filter": "filter",
+    "osm": "osm",
+    "merge": "merge",
+    "analyse": "analysis",
+}
+HELP = {
+    "grid": "20m grid points inside the boundary (generate_grids.py, --lattice: generate_grids_27700.py)",
+    "fetch": "street view metadata of every grid point (fetch_svi_metadata_glasgow.py)",
+    "filter": "one row per panorama, nearest grid point (filter_svi_metadata.py)",
+    "osm": "OSM tags and road type per cell (get_osm_grid_tags_with_road_type.py)",
+    "merge": "grid + panorama tables (merge_svi_meta_with_osm_tag.py)",
+    "analyse": "per-cell temporal summary (analysis.py)",
+}
+
+# command -> (help, script) of the analyses run on the linked outputs (not cached)
+ANALYSES = {
+    "recrawl": ("re-query stale cells into a refresh csv for the next analyse (recrawl_svi_metadata_glasgow.py)",
+                "recrawl_svi_metadata_glasgow"),
+    "fairness": ("coverage disparity across road types and tags, bootstrap CIs (fairness_analysis.py)",
+                 "fairness_analysis"),
+    "spatial": ("neighbourhood coverage and Moran's I / LISA on the lattice (spatial_analysis.py)", "spatial_analysis"),
+}
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    paths = common.add_argument_group("paths")
+    paths.add_argument("--results-dir", help="where outputs are linked (default: SVI_RESULTS_DIR)")
+    paths.add_argument("--cache-dir", help="stage cache (default: <results-dir>/stage_cache)")
+    paths.add_argument("--boundary", default=DEFAULT_BOUNDARY, help="boundary GeoJSON (SVI_BOUNDARY)")
+    paths.add_argument("--pbf", default=DEFAULT_PBF, help="OSM PBF extract (SVI_PBF)")
+    paths.add_argument("--streetview", default=DEFAULT_STREETVIEW, help="streetview.py providing panoids (SVI_STREETVIEW)")
+    paths.add_argument("--osm-cache", help="GeoParquet cache of the OSM layers (default: <results-dir>/osm_cache)")
+
+    params = common.add_argument_group("parameters (a change makes the stage and its downstream stale)")
+    params.add_argument("--spacing", type=int, default=20, help="grid spacing in metres")
+    params.add_argument("--half", type=int, default=10, help="half-width (m) of the cell square for the OSM join")
+    params.add_argument("--save-every", type=int, default=50, help="grid points per csv flush of the crawl")
+    params.add_argument("--retries", type=int, default=3)
+    params.add_argument("--planned-crawl", action="store_true",
+                        help="crawl the query planner's centres only, panoramas are snapped back to their cells")
+    params.add_argument("--lattice", action="store_true",
+                        help="EPSG:27700 lattice as a tile directory instead of the degree grid (tile_pipeline.py)")
+
+    options = common.add_argument_group("options")
+    options.add_argument("--fetch-workers", type=int, default=8)
+    options.add_argument("--rate", type=float, default=20, help="max requests per second (0 = unlimited)")
+    options.add_argument("--osm-workers", type=int, default=6)
+    options.add_argument("--tile-rows", type=int, default=100, help="lattice rows per grid tile (with --lattice)")
+    options.add_argument("--stage-workers", type=int, default=2, help="stages run at the same time")
+    options.add_argument("--profile", help="append stage records (profiling.py) to this jsonl")
+    options.add_argument("-q", "--quiet", action="store_true")
+
+    parser = argparse.ArgumentParser(prog="svi-fairness", description="Glasgow street view coverage pipeline")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for command, text in HELP.items():
+        p = sub.add_parser(command, parents=[common], help=text, description=text)
+        p.add_argument("--force", action="store_true", help="rerun the stage even when it is up to date")
+        p.add_argument("--no-link", action="store_true", help="do not link the outputs into the results dir")
+    sub.add_parser("status", parents=[common], help="print which stages are up to date")
+
+    p = sub.add_parser("recrawl", parents=[common], help=ANALYSES["recrawl"][0], description=ANALYSES["recrawl"][0])
+    p.add_argument("--select-by", choices=["recency", "checked_at", "budget"], default="recency")
+    p.add_argument("--min-recency-months", type=int, default=24, help="recency: latest panorama at least this old")
+    p.add_argument("--older-than-days", type=int, default=180, help="checked_at: cells not queried for this long")
+    p = sub.add_parser("fairness", parents=[common], help=ANALYSES["fairness"][0], description=ANALYSES["fairness"][0])
+    p.add_argument("--n-boot", type=int, default=10000, help="bootstrap replicates")
+    p.add_argument("--boot-workers", type=int, default=8, help="processes for the bootstrap")
+    p = sub.add_parser("spatial", parents=[common], help=ANALYSES["spatial"][0], description=ANALYSES["spatial"][0])
+    p.add_argument("--n-perm", type=int, default=999, help="permutations of the Moran / LISA tests")
+    return parser
+
+
+def stages_from_args(args, osm_cache):
+    from pipeline_stages import build_stages, refresh_paths
+
+    return build_stages(args.boundary, args.pbf, args.streetview, osm_cache, spacing_m=args.spacing,
+                        half=args.half, save_every=args.save_every, retries=args.retries,
+                        planned_crawl=args.planned_crawl, fetch_workers=args.fetch_workers,
+                        rate=args.rate or None, osm_workers=args.osm_workers,
+                        refresh=refresh_paths(args.results_dir), lattice=args.lattice, tile_rows=args.tile_rows,
+                        verbose=not args.quiet)
+
+
+def run_analysis(args):
+    """the analysis script of args.command on the linked outputs in args.results_dir"""
+    import importlib
+
+    module = importlib.import_module(ANALYSES[args.command][1])
+    if args.command == "recrawl":
+        module.recrawl_metadata(args.results_dir, args.streetview, select_by=args.select_by,
+                                min_recency_months=args.min_recency_months, older_than_days=args.older_than_days,
+                                spacing_m=args.spacing, lattice=args.lattice, workers=args.fetch_workers,
+                                rate=args.rate or None, retries=args.retries, save_every=args.save_every)
+    elif args.command == "fairness":
+        module.fairness_analysis(args.results_dir, n_boot=args.n_boot, workers=args.boot_workers)
+    else:
+        module.spatial_analysis(args.results_dir, spacing_m=args.spacing, lattice=args.lattice, n_perm=args.n_perm)
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.results_dir is None:
+        from storage import RESULTS_DIR
+
+        args.results_dir = RESULTS_DIR
+    cache_dir = args.cache_dir or os.path.join(args.results_dir, "stage_cache")
+    stages = stages_from_args(args, args.osm_cache or os.path.join(args.results_dir, "osm_cache"))
+    if args.profile:
+        import profiling
+
+        profiling.configure(args.profile, command=args.command)
+
+    from stage_cache import plan, publish, run_stages
+
+    try:
+        if args.command == "status":
+            for name, state in plan(stages, cache_dir).items():
+                print(f"{name:9s} {state.key}  {'up to date' if state.up_to_date else 'stale'}")
+            return 0
+        # the analyses read the outputs of analyse and everything upstream of it
+        target = COMMANDS.get(args.command, "analysis")
+        force = [target] if getattr(args, "force", False) else []
+        states = run_stages(stages, cache_dir, targets=[target], force=force, workers=args.stage_workers,
+                            verbose=not args.quiet)
+    except FileNotFoundError as e:
+        parser.exit(2, f"svi-fairness: {e}\n")
+    if not getattr(args, "no_link", False):
+        linked = publish(stages, states, args.results_dir)
+        if not args.quiet:
+            print(f"✅ {len(linked)} outputs linked into {args.results_dir}")
+    if args.command in ANALYSES:
+        return run_analysis(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+'''
+concurrent streetview metadata fetching for grid centres.
+a bounded thread pool issues the requests (the job is network bound), a token bucket caps the request rate
+and transient errors are retried with exponential backoff. the request function is injected
+(streetview.panoids in production, a fake function offline), results are flushed to csv in batches
+in completion order
+'''
+import importlib.util
+import os
+import random
+import threading
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from checkpoint import DONE, EMPTY, FAILED
+from profiling import record
+
+# requests' ConnectionError / Timeout subclass OSError, so network hiccups are covered by default
+TRANSIENT_ERRORS = (OSError, TimeoutError)
+
+
+def load_streetview(path):
+    """streetview.py of the advanced_streetview_stitch repo, loaded from its file"""
+    spec = importlib.util.spec_from_file_location("streetview_local", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """vectorized haversine distance (meter)"""
+    R = 6371000
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def geodesic_np(lat1, lon1, lat2, lon2):
+    """vectorized exact geodesic distance on the WGS84 ellipsoid (meter), same as geopy's geodesic"""
+    from pyproj import Geod
+
+    _, _, dist = Geod(ellps="WGS84").inv(np.asarray(lon1, float), np.asarray(lat1, float),
+                                         np.asarray(lon2, float), np.asarray(lat2, float))
+    return dist
+
+
+DISTANCE_KERNELS = {"haversine": haversine_np, "geodesic": geodesic_np}
+
+RECORD_COLUMNS = ["query_lat", "query_lon", "panoid", "lat", "lon", "year", "month", "distance_m", "grid_id"]
+
+
+class PanoRecordBuilder:
+    """
+    columnar accumulator for panoids responses: values are appended to typed arrays across many grid
+    points, distances are computed in one vectorized call and one DataFrame is emitted per flush
+    (replaces one dict per panorama + one DataFrame per grid point)
+    """
+
+    def __init__(self, distance="haversine"):
+        self.distance_fn = DISTANCE_KERNELS[distance]
+        self.clear()
+
+    def clear(self):
+        self.grid_id = array("q")
+        self.query_lat = array("d")
+        self.query_lon = array("d")
+        self.panoid = []
+        self.lat = array("d")
+        self.lon = array("d")
+        self.year = array("d")
+        self.month = array("d")
+
+    def __len__(self):
+        return len(self.panoid)
+
+    def add(self, grid_id, query_lat, query_lon, panoids_list):
+        """append one grid point's response; a malformed item raises and leaves the builder unchanged"""
+        n = len(panoids_list)
+        nan = float("nan")
+        panoid = [item.get('panoid') for item in panoids_list]
+        lat = array("d", [item.get('lat') for item in panoids_list])
+        lon = array("d", [item.get('lon') for item in panoids_list])
+        year = array("d", [nan if item.get('year') is None else item.get('year') for item in panoids_list])
+        month = array("d", [nan if item.get('month') is None else item.get('month') for item in panoids_list])
+        self.grid_id.extend([grid_id] * n)
+        self.query_lat.extend([query_lat] * n)
+        self.query_lon.extend([query_lon] * n)
+        self.panoid.extend(panoid)
+        self.lat.extend(lat)
+        self.lon.extend(lon)
+        self.year.extend(year)
+        self.month.extend(month)
+
+    def to_frame(self):
+        query_lat = np.frombuffer(self.query_lat, dtype=np.float64)
+        query_lon = np.frombuffer(self.query_lon, dtype=np.float64)
+        lat = np.frombuffer(self.lat, dtype=np.float64)
+        lon = np.frombuffer(self.lon, dtype=np.float64)
+        return pd.DataFrame({
+            'query_lat': query_lat,
+            'query_lon': query_lon,
+            'panoid': self.panoid,
+            'lat': lat,
+            'lon': lon,
+            # nullable ints: written as 2019 (not 2019.0) and empty when missing, like the old per-point frames
+            'year': pd.array(np.frombuffer(self.year, dtype=np.float64), dtype="Int64"),
+            'month': pd.array(np.frombuffer(self.month, dtype=np.float64), dtype="Int64"),
+            'distance_m': self.distance_fn(query_lat, query_lon, lat, lon),
+            'grid_id': np.frombuffer(self.grid_id, dtype=np.int64),
+        }, columns=RECORD_COLUMNS)
+
+
+class TokenBucket:
+    """thread-safe token bucket: `rate` requests per second on average, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def fetch_with_retry(fetch_fn, lat, lon, limiter=None, retries=3, backoff=1.0, max_backoff=60.0,
+                     transient=TRANSIENT_ERRORS):
+    """call fetch_fn(lat, lon), retrying transient errors with exponential backoff (+ jitter)"""
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fetch_fn(lat, lon)
+        except transient:
+            if attempt == retries:
+                raise
+            delay = min(max_backoff, backoff * 2 ** attempt)
+            time.sleep(delay * (0.5 + random.random() / 2))
+
+
+def _append_csv(df, out_csv):
+    header = not os.path.exists(out_csv)
+    with open(out_csv, 'a', newline='') as f:
+        df.to_csv(f, header=header, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def fetch_grid_metadata(grid_centers, fetch_fn, out_csv, workers=8, rate=None, save_every=50,
+                        retries=3, backoff=1.0, checkpoint=None, distance="haversine", verbose=True):
+    """
+    fetch metadata for grid_centers = [(grid_id, lat, lon), ...] and append it to out_csv.
+    - workers: size of the thread pool (in-flight requests)
+    - rate: max requests per second over all workers (None = unlimited)
+    - save_every: grid points per csv flush; batches are written in completion order
+    - checkpoint: optional checkpoint.CrawlCheckpoint; each point's status (done / empty / failed) is
+      committed right after its csv batch is on disk
+    - distance: "haversine" (as before) or "geodesic" (exact WGS84) for distance_m
+    returns a dict of counters (done / empty / failed / rows / elapsed_s)
+    """
+    limiter = TokenBucket(rate) if rate else None
+    stats = {"done": 0, "empty": 0, "failed": 0, "rows": 0}
+    batch = PanoRecordBuilder(distance=distance)
+    batch_status = []
+    n_batched = 0
+    t0 = t_batch = time.perf_counter()
+
+    def task(gid, clat, clon):
+        return fetch_with_retry(fetch_fn, clat, clon, limiter=limiter, retries=retries, backoff=backoff)
+
+    def flush():
+        nonlocal batch_status, n_batched, t_batch
+        t_write = time.perf_counter()
+        if len(batch):
+            _append_csv(batch.to_frame(), out_csv)
+        if checkpoint is not None and batch_status:
+            checkpoint.mark(batch_status)
+        now = time.perf_counter()
+        if batch_status:
+            # one record per batch: fetch time since the previous flush, write = csv + checkpoint
+            record("fetch_batch", now - t_batch, rows_in=len(batch_status), rows_out=len(batch),
+                   write_s=now - t_write, failed=sum(s[1] == FAILED for s in batch_status))
+        t_batch = now
+        batch.clear()
+        batch_status = []
+        n_batched = 0
+
+    def collect(fut, gid, clat, clon):
+        nonlocal n_batched
+        try:
+            panoids = fut.result()
+            if panoids:
+                batch.add(gid, clat, clon, panoids)
+        except Exception as e:  # request error or malformed response: only this point fails
+            stats["failed"] += 1
+            batch_status.append((gid, FAILED, 0, str(e)))
+            print(f"⚠️ Failed grid {gid} ({clat:.6f}, {clon:.6f}) — {e}")
+            return
+
+        stats["done"] += 1
+        n_batched += 1
+        if not panoids:
+            stats["empty"] += 1
+            batch_status.append((gid, EMPTY, 0, None))
+        else:
+            stats["rows"] += len(panoids)
+            batch_status.append((gid, DONE, len(panoids), None))
+
+        # write to disk every save_every points
+        if n_batched >= save_every:
+            n_written = len(batch)
+            flush()
+            if verbose:
+                print(f"[{stats['done'] + stats['failed']}/{n_total}] 💾 written {n_written} rows of data in {out_csv}")
+
+    grid_centers = list(grid_centers)
+    n_total = len(grid_centers)
+    # only a few requests per worker are queued at once, so memory does not grow with the grid size
+    max_pending = workers * 4
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for gid, clat, clon in grid_centers:
+            if len(pending) >= max_pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    collect(fut, *pending.pop(fut))
+            pending[pool.submit(task, gid, clat, clon)] = (gid, clat, clon)
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                collect(fut, *pending.pop(fut))
+
+    # write remaining batch
+    n_written = len(batch)
+    flush()
+    if verbose and n_written:
+        print(f"💾 remaining batch written, in total {n_written} rows")
+
+    stats["elapsed_s"] = time.perf_counter() - t0
+    record("fetch_grid_metadata", stats["elapsed_s"], rows_in=n_total, rows_out=stats["rows"],
+           workers=workers, failed=stats["failed"])
+    return stats
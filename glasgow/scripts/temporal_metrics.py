@@ -0,0 +1,112 @@
+'''
+per-grid temporal coverage summary of the merged SVI x OSM table, in one vectorized pass.
+dates are parsed once, rows are sorted by (grid_id, month index, original position) and every statistic is a
+numpy segment reduction over the sorted runs. gives the same values as the old group.apply(agg_time) in analysis.py.
+temporal_summary_ym does the same straight from the panorama table of svi_dataset.py (month index already stored)
+'''
+import numpy as np
+import pandas as pd
+
+
+def month_index(dates, date_format="%d/%m/%Y"):
+    """year * 12 + month of each date (float, NaN when the date does not parse)"""
+    parsed = pd.to_datetime(dates, format=date_format, errors="coerce")
+    return parsed.dt.year * 12 + parsed.dt.month
+
+
+def temporal_summary(merged, date_format="%d/%m/%Y", reference_month=None):
+    """
+    grid_summary indexed by grid_id with first_date / latest_date (original text of the first row holding
+    the earliest / latest month), n_dates (distinct months), n_panos (distinct panoids), max_gap_months
+    (NaN with fewer than two dated rows), span_months and recency_months (reference_month - latest month;
+    reference_month defaults to the latest month in the whole table)
+    """
+    midx = month_index(merged["date"], date_format)
+    if reference_month is None:
+        reference_month = midx.max()
+
+    grid_ids = merged["grid_id"].to_numpy()
+    n_panos = merged.groupby("grid_id")["panoid"].nunique()
+
+    valid = midx.notna().to_numpy()
+    date_text = merged["date"].to_numpy(dtype=object)  # datetime columns keep Timestamps, not ns integers
+    return _summarize(n_panos, grid_ids[valid], midx.to_numpy()[valid].astype(np.int64), np.flatnonzero(valid),
+                      lambda rows: date_text[rows], reference_month)
+
+
+def temporal_summary_ym(grid_ids, panos, reference_month=None):
+    """
+    temporal_summary from the grid ids and the panorama table (grid_id, panoid, ym = year * 12 + month) without
+    building the joined view: same values as temporal_summary(dataset.joined(["grid_id", "panoid", "date"])),
+    dates as first-of-month Timestamps, grids without panoramas kept with n_panos 0
+    """
+    grid_index = pd.Index(np.unique(np.asarray(grid_ids)), name="grid_id")
+    panos = panos[np.isin(panos["grid_id"].to_numpy(), grid_index.to_numpy())]
+    n_panos = (panos.groupby("grid_id")["panoid"].nunique()
+               .reindex(grid_index, fill_value=0).astype(np.int64))
+
+    m = panos["ym"].to_numpy().astype(np.int64)  # every stored panorama has a month
+    if reference_month is None:
+        reference_month = m.max() if len(m) else np.nan
+
+    def month_start(rows):
+        months = (m[rows] - 1 - 1970 * 12).astype("datetime64[M]").astype("datetime64[ns]")
+        return pd.Series(months).to_numpy(dtype=object)
+
+    return _summarize(n_panos, panos["grid_id"].to_numpy(), m, np.arange(len(m)), month_start, reference_month)
+
+
+def _summarize(n_panos, g, m, pos, date_at, reference_month):
+    """
+    segment reductions shared by both entry points: g / m / pos are the grid id, month index and table row of
+    each dated row, date_at(rows) gives the first_date / latest_date values of those rows
+    """
+    n_grids = len(n_panos)
+    first_date = np.full(n_grids, np.nan, dtype=object)
+    latest_date = np.full(n_grids, np.nan, dtype=object)
+    n_dates = np.zeros(n_grids, dtype=np.int64)
+    max_gap_months = np.full(n_grids, np.nan)
+    span_months = np.full(n_grids, np.nan)
+    recency_months = np.full(n_grids, np.nan)
+
+    if len(g):
+        order = np.lexsort((pos, m, g))
+        g, m, pos = g[order], m[order], pos[order]
+
+        new_group = np.ones(len(g), dtype=bool)
+        new_group[1:] = g[1:] != g[:-1]
+        starts = np.flatnonzero(new_group)
+        ends = np.append(starts[1:], len(g))
+        new_run = new_group.copy()
+        new_run[1:] |= m[1:] != m[:-1]
+        run_starts = np.flatnonzero(new_run)
+
+        first_idx = m[starts]
+        last_idx = m[ends - 1]
+        # first row (in table order) of the latest month = start of the last run in each group
+        last_run = run_starts[np.searchsorted(run_starts, ends - 1, side="right") - 1]
+
+        gaps = np.empty(len(m), dtype=np.int64)
+        gaps[0] = -1
+        gaps[1:] = m[1:] - m[:-1]
+        gaps[starts] = -1
+        max_gap = np.maximum.reduceat(gaps, starts).astype(float)
+        max_gap[ends - starts < 2] = np.nan
+
+        at = n_panos.index.get_indexer(g[starts])
+        first_date[at] = date_at(pos[starts])
+        latest_date[at] = date_at(pos[last_run])
+        n_dates[at] = np.add.reduceat(new_run.astype(np.int64), starts)
+        max_gap_months[at] = max_gap
+        span_months[at] = last_idx - first_idx
+        recency_months[at] = reference_month - last_idx
+
+    return pd.DataFrame({
+        "first_date": first_date,
+        "latest_date": latest_date,
+        "n_dates": n_dates,
+        "n_panos": n_panos.to_numpy(),
+        "max_gap_months": max_gap_months,
+        "span_months": span_months,
+        "recency_months": recency_months,
+    }, index=n_panos.index)
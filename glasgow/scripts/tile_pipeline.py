@@ -0,0 +1,308 @@
+'''
+tile-parallel pipeline over the EPSG:27700 lattice (grid_utils.lattice_spec).
+the lattice is cut into bands of spec['tile_rows'] rows and each tile runs, in its own worker process:
+grid generation -> OSM tagging (road_type, tags, main highway) -> metadata assignment (one row per panoid,
+min distance_m) -> merge -> temporal summary. per-tile outputs are then concatenated into the usual tables
+(osm / meta / summary by default; the wide merged table and the grid only on request).
+
+metadata: the crawl is reduced to one row per panoid in the parent process (min distance_m, earliest row on
+ties: metadata_filter.keep_nearest, the rule of filter_svi_metadata.py) and only these winners are sharded, each
+to the tile of its grid_id. a panoid is therefore decided over the whole crawl, however far from the query point
+the service returned it, and the result is the same as the citywide groupby('panoid')['distance_m'].idxmin().
+
+incremental: every tile records a hash of its inputs (lattice, boundary, OSM cache key, its metadata shard,
+reference month, PIPELINE_VERSION); a rerun only recomputes tiles whose hash changed.
+the crawl must have been run on the same lattice (grid_id = row * n_cols + col): the fetch stage with lattice
+(pipeline_stages.build_stages, `svi-fairness fetch --lattice`) writes it under grid_names(spacing, lattice=True)
+'''
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from grid_utils import LATTICE_CRS, cell_boxes, grid_id_to_rowcol, lattice_tile, n_lattice_tiles
+from metadata_filter import iter_raw_chunks, keep_nearest
+from profiling import stage
+from storage import STORAGE_FORMAT, read_table, write_table
+
+# bump when a per-tile step changes, so every tile is recomputed
+PIPELINE_VERSION = 2
+META_COLUMNS = ["query_lat", "query_lon", "panoid", "lat", "lon", "year", "month", "distance_m", "grid_id"]
+OSM_COLUMNS = ["grid_id", "query_lat", "query_lon", "grid_highway", "road_type",
+               "n_tags", "unique_keys", "tag_key_list", "tag_value_list"]
+TILE_OUTPUTS = ["grid", "osm", "meta", "merged", "summary"]
+# concatenated by run_tiles unless asked otherwise: merged repeats the grid columns on every panorama row and is
+# rebuilt from osm + meta (svi_dataset.write_svi_dataset), grid is osm without the tags
+DEFAULT_OUTPUTS = ("osm", "meta", "summary")
+
+
+def _frame_hash(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()[:16]
+
+
+def _tile_dir(work_dir, tile):
+    return os.path.join(work_dir, "tiles", f"tile_{tile:05d}")
+
+
+# ============================================================
+# metadata shards (parent process)
+# ============================================================
+def partition_metadata(raw_path, spec, work_dir, chunksize=1_000_000):
+    """
+    split the cleaned crawl into one shard per tile: the raw table is streamed in chunks, rows without year /
+    month are dropped and a running record keeps the nearest row per panoid (keep_nearest); each winner goes to
+    the shard of its grid_id's tile, with a seq column holding its original row position.
+    shards are only rewritten when their content changes. returns ({tile: shard hash}, reference month)
+    """
+    n_tiles = n_lattice_tiles(spec)
+
+    best = None
+    reference_month = np.nan
+    for chunk in iter_raw_chunks(raw_path, chunksize):
+        chunk = chunk[META_COLUMNS].dropna(subset=["year", "month"])
+        if chunk.empty:
+            continue
+        reference_month = np.fmax(reference_month, (chunk["year"] * 12 + chunk["month"]).max())
+        with stage("keep_nearest", rows_in=len(chunk)) as st:
+            best = keep_nearest(best, chunk.rename_axis("seq").reset_index())
+            st.rows_out = len(best)
+
+    parts = {}
+    if best is not None:
+        row, _ = grid_id_to_rowcol(best["grid_id"].to_numpy(), spec)
+        parts = {int(t): part for t, part in best[META_COLUMNS + ["seq"]].groupby(row // spec["tile_rows"])}
+
+    shard_dir = os.path.join(work_dir, "meta_shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    hashes = {}
+    for tile in range(n_tiles):
+        shard = parts.pop(tile) if tile in parts else \
+            pd.DataFrame({c: pd.Series(dtype=float) for c in META_COLUMNS + ["seq"]})
+        shard = shard.sort_values("seq", kind="stable").reset_index(drop=True)
+        h = _frame_hash(shard)
+        path = os.path.join(shard_dir, f"meta_{tile:05d}.{STORAGE_FORMAT}")
+        stamp = path + ".hash"
+        if not (os.path.exists(stamp) and open(stamp).read() == h):
+            write_table(shard, path)
+            with open(stamp, "w") as f:
+                f.write(h)
+        hashes[tile] = h
+    return hashes, None if np.isnan(reference_month) else int(reference_month)
+
+
+def assign_metadata(shard, grid_ids):
+    """the shard's rows (already one per panoid) whose grid_id is in grid_ids, in crawl order"""
+    if shard.empty:
+        return shard.drop(columns="seq")
+    winners = shard[shard["grid_id"].isin(grid_ids)]
+    return winners.sort_values("seq", kind="stable").drop(columns="seq").reset_index(drop=True)
+
+
+# ============================================================
+# per-tile work (worker processes)
+# ============================================================
+_WORKER = {}
+
+
+def _init_worker(poly_wkb, spec, layer_dir):
+    """load the boundary and the cached OSM layers once per worker; every layer gets one STRtree"""
+    import shapely
+    from pyproj import Transformer
+
+    from osm_layers import read_cached_layers, semantic_layers
+    from osm_tags import SEMANTIC_KEYS
+    from spatial_join import LayerIndex
+
+    poly = shapely.from_wkb(poly_wkb)
+    shapely.prepare(poly)
+    osm_layers = read_cached_layers(layer_dir)
+    indexes = [
+        LayerIndex(name, gdf.to_crs(LATTICE_CRS), SEMANTIC_KEYS + ["id"])
+        for name, gdf in semantic_layers(osm_layers).items()
+        if gdf is not None and len(gdf)
+    ]
+    drivable = osm_layers.get("roads_drivable")
+    drivable_ids = drivable_index = None
+    if drivable is not None and "id" in drivable.columns:
+        drivable_ids = drivable["id"].to_numpy()
+    elif drivable is not None:
+        # no way ids to match on: hit / no-hit against the drivable geometries instead
+        drivable_index = LayerIndex("roads_drivable", drivable.to_crs(LATTICE_CRS), [])
+    _WORKER.update(
+        poly=poly,
+        spec=spec,
+        to_wgs84=Transformer.from_crs(LATTICE_CRS, 4326, always_xy=True),
+        indexes=indexes,
+        drivable_ids=drivable_ids,
+        drivable_index=drivable_index,
+    )
+
+
+def tile_osm_attributes(grid, spec, indexes, drivable_ids=None, drivable_index=None):
+    """road_type, tags, n_tags, unique_keys and grid_highway for the cells of one tile (OSM_COLUMNS)"""
+    from osm_tags import (HIGHWAY_PRIORITY, ROAD_TYPES, SEMANTIC_KEYS, classify_road_type, encode_tags,
+                          main_highway, tag_summary)
+
+    grid_ids = grid["grid_id"].to_numpy()
+    cells = cell_boxes(grid["x"], grid["y"], spec)
+    parts = [li.join(cells, grid_ids) for li in indexes]
+    joined = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["grid_id", "layer"])
+    for c in SEMANTIC_KEYS + ["id"]:
+        if c not in joined.columns:
+            joined[c] = None
+
+    roads_join = joined.loc[joined["layer"] == "roads", ["grid_id", "id"]]
+    if drivable_ids is not None:
+        road_type = classify_road_type(grid_ids, roads_join, drivable_ids)
+    else:
+        any_road = np.isin(grid_ids, roads_join["grid_id"])
+        drive_road = np.zeros(len(grid_ids), dtype=bool)
+        if drivable_index is not None:
+            drive_road = np.isin(grid_ids, drivable_index.join(cells, grid_ids)["grid_id"])
+        road_type = pd.Series(pd.Categorical.from_codes(
+            np.where(drive_road, 2, np.where(any_road, 1, 0)), categories=ROAD_TYPES))
+
+    tm = encode_tags(joined, grid_ids, keys=SEMANTIC_KEYS)
+    summary = tag_summary(tm).merge(main_highway(tm, priority=HIGHWAY_PRIORITY), on="grid_id", how="left")
+    osm = grid[["grid_id", "query_lat", "query_lon"]].assign(road_type=road_type.to_numpy())
+    osm = osm.merge(summary, on="grid_id", how="left")
+    for c in ["n_tags", "unique_keys"]:
+        osm[c] = osm[c].fillna(0).astype(int)
+    return osm[OSM_COLUMNS]
+
+
+def merge_tile(osm, meta):
+    """merge_svi_meta_with_osm_tag.py on one tile"""
+    meta = meta.copy()
+    meta["date"] = pd.to_datetime(meta["year"].astype(int).astype(str) + "-" + meta["month"].astype(int).astype(str))
+    meta = meta.drop(columns=["query_lat", "query_lon"])
+    merged = osm.merge(meta, on="grid_id", how="left")
+    return merged[["grid_id"] + [c for c in merged.columns if c != "grid_id"]]
+
+
+def run_tile(tile, work_dir, input_hash, reference_month):
+    """all per-tile stages; outputs + state.json (written last) go to tiles/tile_XXXXX/"""
+    from temporal_metrics import temporal_summary
+
+    t0 = time.perf_counter()
+    out_dir = _tile_dir(work_dir, tile)
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, "state.json")
+    for f in os.listdir(out_dir):
+        os.remove(os.path.join(out_dir, f))
+
+    with stage("tile", tile=tile) as st:
+        grid = lattice_tile(_WORKER["poly"], _WORKER["spec"], tile, to_wgs84=_WORKER["to_wgs84"])
+        stats = {"tile": tile, "n_cells": len(grid), "n_panos": 0}
+        st.rows_in = len(grid)
+        if len(grid):
+            with stage("osm_attributes", rows_in=len(grid)):
+                osm = tile_osm_attributes(grid, _WORKER["spec"], _WORKER["indexes"],
+                                          _WORKER["drivable_ids"], _WORKER["drivable_index"])
+            with stage("assign_metadata") as st_meta:
+                shard = read_table(os.path.join(work_dir, "meta_shards", f"meta_{tile:05d}.{STORAGE_FORMAT}"))
+                meta = assign_metadata(shard, grid["grid_id"].to_numpy())
+                st_meta.rows_in, st_meta.rows_out = len(shard), len(meta)
+            with stage("merge", rows_in=len(osm) + len(meta)):
+                merged = merge_tile(osm, meta)
+            with stage("temporal_summary", rows_in=len(merged)):
+                summary = temporal_summary(merged, reference_month=reference_month).reset_index()
+            with stage("write", rows_in=len(merged)):
+                for name, df in zip(TILE_OUTPUTS, [grid, osm, meta, merged, summary]):
+                    write_table(df, os.path.join(out_dir, f"{name}.{STORAGE_FORMAT}"))
+            stats["n_panos"] = len(meta)
+        st.rows_out = stats["n_panos"]
+
+    stats["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    with open(state_path, "w") as f:
+        json.dump({"hash": input_hash, **stats}, f)
+    return stats
+
+
+# ============================================================
+# driver
+# ============================================================
+def tile_input_hashes(spec, poly_27700, layer_dir, shard_hashes, reference_month):
+    common = json.dumps({
+        "spec": {k: v for k, v in spec.items() if k != "tiles"},
+        "poly": hashlib.sha256(poly_27700.wkb).hexdigest(),
+        "osm": os.path.basename(os.path.normpath(layer_dir)),
+        "reference_month": reference_month,
+        "version": PIPELINE_VERSION,
+    }, sort_keys=True)
+    return {
+        tile: hashlib.sha256(f"{common}|{tile}|{h}".encode()).hexdigest()[:16]
+        for tile, h in shard_hashes.items()
+    }
+
+
+def stale_tiles(work_dir, hashes):
+    """tiles whose state.json is missing or was computed from different inputs"""
+    stale = []
+    for tile, h in hashes.items():
+        path = os.path.join(_tile_dir(work_dir, tile), "state.json")
+        if not os.path.exists(path):
+            stale.append(tile)
+            continue
+        with open(path) as f:
+            if json.load(f).get("hash") != h:
+                stale.append(tile)
+    return stale
+
+
+def run_tiles(poly_27700, spec, layer_dir, raw_meta_path, work_dir, workers=None, force=False,
+              outputs=DEFAULT_OUTPUTS, verbose=True):
+    """
+    run every stale tile in a process pool (workers defaults to the cpu count), then concatenate the per-tile
+    outputs named in outputs (any of TILE_OUTPUTS). returns ({name: DataFrame}, run stats)
+    """
+    unknown = set(outputs) - set(TILE_OUTPUTS)
+    if unknown:
+        raise ValueError(f"unknown tile outputs {sorted(unknown)}, expected some of {TILE_OUTPUTS}")
+    t0 = time.perf_counter()
+    os.makedirs(work_dir, exist_ok=True)
+    with open(os.path.join(work_dir, "lattice.json"), "w") as f:
+        json.dump(spec, f, indent=2)
+
+    shard_hashes, reference_month = partition_metadata(raw_meta_path, spec, work_dir)
+    hashes = tile_input_hashes(spec, poly_27700, layer_dir, shard_hashes, reference_month)
+    todo = list(hashes) if force else stale_tiles(work_dir, hashes)
+    if verbose:
+        print(f"{len(hashes)} tiles, {len(todo)} to (re)run, "
+              f"shards ready in {time.perf_counter() - t0:.1f}s")
+
+    tile_stats = []
+    if todo:
+        workers = min(workers or os.cpu_count() or 1, len(todo))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(poly_27700.wkb, spec, layer_dir)) as pool:
+            futures = [pool.submit(run_tile, tile, work_dir, hashes[tile], reference_month) for tile in todo]
+            for fut in as_completed(futures):
+                tile_stats.append(fut.result())
+                if verbose:
+                    s = tile_stats[-1]
+                    print(f"tile {s['tile']}: {s['n_cells']} cells, {s['n_panos']} panoramas, "
+                          f"{s['elapsed_s']:.1f}s ({len(tile_stats)}/{len(todo)})")
+
+    tables = {}
+    for name in outputs:
+        parts = []
+        for tile in sorted(hashes):
+            path = os.path.join(_tile_dir(work_dir, tile), f"{name}.{STORAGE_FORMAT}")
+            if os.path.exists(path):
+                parts.append(read_table(path))
+        tables[name] = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    if "summary" in tables and len(tables["summary"]):
+        tables["summary"] = tables["summary"].set_index("grid_id")
+
+    stats = {
+        "tiles": len(hashes),
+        "rerun": len(todo),
+        "reference_month": reference_month,
+        "elapsed_s": round(time.perf_counter() - t0, 3),
+    }
+    return tables, stats